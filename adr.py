@@ -0,0 +1,246 @@
+# This file is the adaptive data rate of the links of one node, on top of
+# arq.Link (see arq.py)
+#
+#    rate frame:  [0xA7, OP, SPEED]     OP is SET or CONFIRM, SPEED the air
+#                                       speed code of 03H bits 2-0
+#
+#    Every packet received with the rssi byte (rssi=True) is a sample of its
+#    link: the packet rssi and the noise rssi of the channel at that time
+#    (sx126x.noise_rssi(), the noise at the far end is taken to be the same).
+#    The margin of a link at an air speed is the rssi over the weakest signal
+#    the speed still decodes, noise + the SNR limit of its spreading factor.
+#    The rate of a link is the fastest speed which keeps margin dB over the
+#    weakest of the last history samples, a faster speed than the current one
+#    needs hysteresis dB more.
+#
+#    Both ends must use the same air speed, the controller changes it by
+#      1. SET at the old speed, acknowledged
+#      2. the remote switches once it has acknowledged, the controller once
+#         it got the ack
+#      3. CONFIRM at the new speed, acknowledged
+#    A remote which hears nothing from the controller at the new speed within
+#    confirm_timeout seconds goes back to the old one, a controller without
+#    the ack of CONFIRM too. Whichever frame got lost, a send which fails at
+#    the speed of the link is tried once more at the other speed of the last
+#    change, which finds the remote again. A speed that failed is not tried
+#    again for retry seconds.
+#
+#    When a link gets worse than its speed allows the two ends lose each
+#    other. A remote which hears nothing from its controller for idle seconds
+#    goes back to the speed it started at, the controller tries that speed
+#    last after a failed send.
+#
+#    A node has one air speed at a time. The controller tunes to the speed of
+#    a link when it sends to it and back to the listen speed after linger
+#    seconds without traffic on it, nodes which send on their own (telemetry)
+#    must stay at the listen speed.
+
+import time
+import collections
+
+import sx126x
+import arq
+import radio
+
+RATE = 0xA7
+SET = 0x01
+CONFIRM = 0x02
+
+# the speeds set() accepts, slowest first
+SPEEDS = [1200, 2400, 4800, 9600, 19200, 38400, 62500]
+
+
+class Peer:
+    # the link to one remote node
+
+    def __init__(self, air_speed, history):
+        self.air_speed = air_speed
+        # the other speed of the last change, tried when the link fails
+        self.other = None
+        self.samples = collections.deque(maxlen=history)  # (rssi, noise)
+        self.failed = {}  # air speed -> time the change to it failed
+
+
+class Adr:
+    # The links of one node with a speed each. send() and receive() are those
+    # of arq.Link, a controller moves the link to its best speed before it
+    # sends, a remote (controller=False) follows the changes of its controller.
+
+    def __init__(self, node, link, margin=10.0, history=8, hysteresis=3.0, controller=True,
+                 linger=3.0, confirm_timeout=60.0, retry=600.0, idle=900.0):
+        self.node = node
+        self.link = link
+        self.margin_db = margin
+        self.history = history
+        self.hysteresis = hysteresis
+        self.controller = controller
+        self.linger = linger
+        self.confirm_timeout = confirm_timeout
+        self.retry = retry
+        self.idle = idle
+        # the speed every node starts at
+        self.base = node.air_speed
+        self.listen = node.air_speed
+        self.peers = {}
+        # the last traffic at a speed other than the listen speed
+        self.active = 0
+        # the last packet received
+        self.heard = time.time()
+        # remote: (controller, old speed, deadline) of an unconfirmed change
+        self.pending = None
+        self.switches = 0
+        self.fallbacks = 0
+
+    def peer(self, addr):
+        peer = self.peers.get(addr)
+        if peer is None:
+            peer = self.peers[addr] = Peer(self.listen, self.history)
+        return peer
+
+    def observe(self, packet):
+        if packet.rssi is not None:
+            self.peer(packet.addr).samples.append((packet.rssi, packet.noise))
+
+    def margin(self, addr, air_speed):
+        # dB over the sensitivity of air_speed of the weakest recent packet of addr,
+        # None without samples
+        peer = self.peers.get(addr)
+        if peer is None or not peer.samples:
+            return None
+        return min(rssi - radio.sensitivity(air_speed, noise) for rssi, noise in peer.samples)
+
+    def best(self, addr):
+        # the fastest speed which keeps the margin, None until history samples are in
+        peer = self.peers.get(addr)
+        if peer is None or len(peer.samples) < self.history:
+            return None
+        now = time.time()
+        best = SPEEDS[0]
+        for speed in SPEEDS:
+            failed = peer.failed.get(speed)
+            if failed is not None and now - failed < self.retry:
+                break
+            need = self.margin_db + (self.hysteresis if speed > peer.air_speed else 0)
+            if self.margin(addr, speed) >= need:
+                best = speed
+        return best
+
+    def tune(self, air_speed):
+        if self.node.air_speed != air_speed:
+            self.node.reconfigure(air_speed=air_speed)
+        if air_speed != self.listen:
+            self.active = time.time()
+
+    def send(self, dest, data):
+        # data to dest at the speed of its link, True once acknowledged
+        self.expire()
+        peer = self.peer(dest)
+        if self.controller:
+            self.adjust(dest)
+        self.tune(peer.air_speed)
+        if self.link.send(dest, data):
+            # the reply comes at this speed, linger counts from now
+            self.active = time.time()
+            return True
+        # the ends disagree about the last change or dest went back to the start speed
+        for speed in (peer.other, self.base):
+            if speed is None or speed == peer.air_speed:
+                continue
+            self.tune(speed)
+            if self.link.send(dest, data):
+                peer.failed[peer.air_speed] = time.time()
+                peer.air_speed, peer.other = speed, peer.air_speed
+                self.fallbacks += 1
+                self.active = time.time()
+                return True
+        self.tune(peer.air_speed)
+        return False
+
+    def adjust(self, dest):
+        # move the link to dest to its best speed, returns the speed of the link
+        peer = self.peer(dest)
+        speed = self.best(dest)
+        if speed is None or speed == peer.air_speed:
+            return peer.air_speed
+        old = peer.air_speed
+        code = radio.AIR_SPEED.index(speed)
+        self.tune(old)
+        if not self.link.send(dest, bytes([RATE, SET, code])):
+            peer.failed[speed] = time.time()
+            peer.other = speed
+            return old
+        self.tune(speed)
+        peer.other = old
+        if self.link.send(dest, bytes([RATE, CONFIRM, code])):
+            peer.air_speed = speed
+            peer.failed.pop(speed, None)
+            self.switches += 1
+        else:
+            # the remote goes back on its own after confirm_timeout
+            peer.failed[speed] = time.time()
+            peer.other = speed
+            self.fallbacks += 1
+            self.tune(old)
+        return peer.air_speed
+
+    def receive(self, timeout=0):
+        # the next packet for the application, rate frames are handled here
+        deadline = time.time() + timeout
+        while True:
+            self.expire()
+            packet = self.link.receive(timeout=min(max(deadline - time.time(), 0), 0.5))
+            if packet is not None:
+                self.heard = time.time()
+                self.observe(packet)
+                if self.node.air_speed != self.listen:
+                    self.active = time.time()
+                if self.pending is not None and self.pending[0] == packet.addr:
+                    # anything from the controller at the new speed confirms it
+                    self.commit()
+                if not self.handle(packet):
+                    return packet
+            elif time.time() >= deadline:
+                return None
+
+    def handle(self, packet):
+        # True if packet was a rate frame
+        data = packet.data
+        if len(data) != 3 or data[0] != RATE or data[2] >= len(radio.AIR_SPEED):
+            return False
+        speed = radio.AIR_SPEED[data[2]]
+        if data[1] == SET and speed != self.node.air_speed:
+            peer = self.peer(packet.addr)
+            old = self.pending[1] if self.pending is not None else peer.air_speed
+            # the ack is on the air until its time on air has passed
+            time.sleep(sx126x.packet_time(arq.ACK_LENGTH, self.node.air_speed))
+            self.pending = (packet.addr, old, time.time() + self.confirm_timeout)
+            peer.air_speed, peer.other = speed, old
+            self.tune(speed)
+        return True
+
+    def commit(self):
+        addr, old, deadline = self.pending
+        self.pending = None
+        self.switches += 1
+        if not self.controller:
+            # a remote talks to its controller only, this is its speed now
+            self.listen = self.peer(addr).air_speed
+
+    def expire(self):
+        now = time.time()
+        if self.pending is not None and now >= self.pending[2]:
+            addr, old, deadline = self.pending
+            self.pending = None
+            peer = self.peer(addr)
+            peer.air_speed, peer.other = old, peer.air_speed
+            self.fallbacks += 1
+            self.tune(old)
+        if not self.controller and self.node.air_speed != self.base and now - self.heard > self.idle:
+            self.pending = None
+            for peer in self.peers.values():
+                peer.air_speed, peer.other = self.base, peer.air_speed
+            self.listen = self.base
+            self.fallbacks += 1
+            self.tune(self.base)
+        if self.controller and self.node.air_speed != self.listen and now - self.active > self.linger:
+            self.tune(self.listen)
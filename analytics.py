@@ -0,0 +1,252 @@
+# This file is the link quality analysis of the logged receive history
+#
+#    load_journal()  reads the packet journal of sx126x.receive() / receivetemp() (journal.py)
+#    load_log()  reads g.txt written by the older versions
+#                "Noise RSSI: -95dBm Packet RSSI: -87dBm Node: 30 Current date and time = ..."
+#    load_csv()  reads the capture of prog01/pc_main.py (save_data_01.csv)
+#
+#    They return a History of NumPy arrays sorted by time, everything after
+#    loading is computed in vectorised passes over the whole history, so the
+#    logs of a month in the field take seconds, not minutes.
+#
+#    python analytics.py journal        prints a report per node (a directory, g.txt or .csv)
+
+import os
+import re
+import sys
+import gzip
+import warnings
+import collections
+
+import numpy as np
+
+import journal
+
+# time in seconds since the epoch, node address (-1 when the log has none),
+# packet rssi and noise rssi in dBm (nan when not logged)
+History = collections.namedtuple('History', ['time', 'node', 'rssi', 'noise'])
+
+LOG_LINE = re.compile(
+    r'(?:Noise RSSI: (-?\d+)dBm )?Packet RSSI: (-?\d+)dBm (?:Node: (\d+) )?'
+    r'Current date and time = (\d{4}-\d\d-\d\d \d\d:\d\d:\d\d(?:\.\d+)?)')
+
+CSV_LINE = re.compile(
+    r'^(\d\d)[/ ](\d\d)[/ ](\d{4}) at (\d\d):(\d\d):(\d\d)([AP]M),[^,\n]*,(\d+),(-?\d+),(-?\d+)',
+    re.M)
+
+
+def make_history(time, node, rssi, noise):
+    order = np.argsort(time, kind='stable')
+    return History(time[order], node[order], rssi[order], noise[order])
+
+
+# journal.RECORD as a NumPy record
+RECORD = np.dtype([('time', '<f8'), ('addr', '<u2'), ('length', '<u2'),
+                   ('rssi', 'i1'), ('noise', 'i1'), ('offset', '<u8')])
+
+
+def load_journal(directory="journal"):
+    # all the segments, the records are read as a whole without the payloads
+    parts = []
+    for name in journal.segments(directory):
+        if os.path.exists(name + ".rec"):
+            raw = np.fromfile(name + ".rec", dtype=np.uint8)
+        else:
+            with gzip.open(name + ".rec.gz", "rb") as f:
+                raw = np.frombuffer(f.read(), dtype=np.uint8)
+        # the segment being written may end in a partial record
+        raw = raw[:len(raw) - len(raw) % RECORD.itemsize]
+        parts.append(raw.view(RECORD))
+    records = np.concatenate(parts) if parts else np.zeros(0, RECORD)
+
+    def level(values):
+        values = values.astype(float)
+        values[values == journal.UNKNOWN] = np.nan
+        return values
+
+    return make_history(records['time'].astype(float), records['addr'].astype(int),
+                        level(records['rssi']), level(records['noise']))
+
+
+def load_log(path="g.txt"):
+    with open(path) as f:
+        rows = LOG_LINE.findall(f.read())
+    if not rows:
+        return make_history(np.zeros(0), np.zeros(0, int), np.zeros(0), np.zeros(0))
+    noise, rssi, node, stamp = (np.array(c) for c in zip(*rows))
+    time = np.array(stamp, dtype='datetime64[us]').astype(np.int64) / 1e6
+    rssi = rssi.astype(float)
+    # the older lines wrote the rssi without its sign
+    rssi = -np.abs(rssi)
+    noise = np.where(noise == '', 'nan', noise).astype(float)
+    node = np.where(node == '', '-1', node).astype(int)
+    return make_history(time, node, rssi, noise)
+
+
+def load_csv(path="prog01/save_data_01.csv"):
+    # columns Time Rx, Time Tx, Node, Noise RSSI, Channel RSSI
+    with open(path) as f:
+        rows = CSV_LINE.findall(f.read())
+    if not rows:
+        return make_history(np.zeros(0), np.zeros(0, int), np.zeros(0), np.zeros(0))
+    day, month, year, hour, minute, second, ampm, node, noise, rssi = (np.array(c) for c in zip(*rows))
+    hour = hour.astype(int) % 12 + np.where(ampm == 'PM', 12, 0)
+    date = np.char.add(np.char.add(np.char.add(year, '-'), np.char.add(month, '-')), day)
+    time = (np.array(date, dtype='datetime64[D]').astype(np.int64) * 86400
+            + hour * 3600 + minute.astype(int) * 60 + second.astype(int)).astype(float)
+    return make_history(time, node.astype(int), rssi.astype(float), noise.astype(float))
+
+
+def snr(history):
+    # packet rssi over the noise floor in dB (nan where the noise was not sampled)
+    return history.rssi - history.noise
+
+
+def group_order(groups, length):
+    # (row order grouped by node and stable within it, first position of the
+    # group of every position in that order); one group when groups is None
+    if groups is None:
+        return np.arange(length), np.zeros(length, int)
+    groups = np.asarray(groups)
+    order = np.argsort(groups, kind='stable')
+    sorted_groups = groups[order]
+    new = np.concatenate(([True], sorted_groups[1:] != sorted_groups[:-1]))
+    first = np.maximum.accumulate(np.where(new, np.arange(length), 0))
+    return order, first
+
+
+def rolling_mean(values, window, groups=None):
+    # mean of the last window values at every position (nan are skipped),
+    # with groups (the node of every row) the window only spans the rows of the same node
+    values = np.asarray(values, float)
+    order, first = group_order(groups, len(values))
+    ordered = values[order]
+    valid = ~np.isnan(ordered)
+    total = np.concatenate(([0.0], np.cumsum(np.where(valid, ordered, 0.0))))
+    count = np.concatenate(([0], np.cumsum(valid)))
+    end = np.arange(1, len(values) + 1)
+    start = np.maximum(end - window, first)
+    n = count[end] - count[start]
+    out = np.empty(len(values))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out[order] = (total[end] - total[start]) / n
+    return out
+
+
+def rolling_percentile(values, window, q, groups=None, block=65536):
+    # q-th percentile of the last window values at every position, per node with groups,
+    # computed block by block to keep the memory at block * window values
+    values = np.asarray(values, float)
+    order, first = group_order(groups, len(values))
+    ordered = values[order]
+    out = np.empty(len(values))
+    bounds = np.concatenate((np.unique(first), [len(values)]))
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        padded = np.concatenate((np.full(window - 1, np.nan), ordered[lo:hi]))
+        for i in range(0, hi - lo, block):
+            view = np.lib.stride_tricks.sliding_window_view(padded[i:i + block + window - 1], window)
+            with warnings.catch_warnings():
+                # windows made of nan only (the start, gaps in the noise) give nan
+                warnings.simplefilter('ignore', RuntimeWarning)
+                out[order[lo + i:min(lo + i + block, hi)]] = np.nanpercentile(view, q, axis=1)
+    return out
+
+
+def by_node(history):
+    # (nodes, index of the node of every row, row order grouped by node then time)
+    nodes, inverse = np.unique(history.node, return_inverse=True)
+    order = np.lexsort((history.time, inverse))
+    return nodes, inverse, order
+
+
+def packet_loss(history, period=None):
+    # per node: (nodes, received, lost, loss rate). The expected interval is the
+    # median gap of each node unless period (seconds) is given, a gap of k
+    # intervals means k - 1 packets were lost.
+    nodes, inverse, order = by_node(history)
+    t = history.time[order]
+    g = inverse[order]
+    gap = np.diff(t)
+    same = g[1:] == g[:-1]
+    received = np.bincount(inverse, minlength=len(nodes))
+    if period is None:
+        expected = np.array([np.median(gap[same & (g[1:] == i)]) if received[i] > 1 else np.nan
+                             for i in range(len(nodes))])
+    else:
+        expected = np.full(len(nodes), float(period))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        missing = np.where(same, np.maximum(np.rint(gap / expected[g[1:]]) - 1, 0), 0)
+    missing = np.nan_to_num(missing)
+    lost = np.bincount(g[1:], weights=missing, minlength=len(nodes)).astype(int)
+    return nodes, received, lost, lost / np.maximum(received + lost, 1)
+
+
+def outages(history, threshold):
+    # intervals longer than threshold seconds without a packet, per node:
+    # arrays (node, start, end)
+    nodes, inverse, order = by_node(history)
+    t = history.time[order]
+    g = inverse[order]
+    gap = np.diff(t)
+    hit = (g[1:] == g[:-1]) & (gap > threshold)
+    return nodes[g[1:][hit]], t[:-1][hit], t[1:][hit]
+
+
+def node_stats(history, q=(5, 50, 95)):
+    # per node: count, mean rssi, rssi percentiles, mean noise and mean snr
+    nodes, inverse, order = by_node(history)
+    count = np.bincount(inverse, minlength=len(nodes))
+
+    def mean(values):
+        valid = ~np.isnan(values)
+        s = np.bincount(inverse[valid], weights=values[valid], minlength=len(nodes))
+        n = np.bincount(inverse[valid], minlength=len(nodes))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return s / n
+
+    # percentiles from one sort by (node, rssi): the rows of a node are contiguous
+    rssi_order = np.lexsort((history.rssi, inverse))
+    sorted_rssi = history.rssi[rssi_order]
+    first = np.concatenate(([0], np.cumsum(count)[:-1]))
+    percentiles = {}
+    for p in q:
+        index = first + np.floor((count - 1) * p / 100.0).astype(int)
+        percentiles[p] = sorted_rssi[index]
+
+    return {
+        "node": nodes,
+        "count": count,
+        "rssi_mean": mean(history.rssi),
+        "rssi_percentile": percentiles,
+        "noise_mean": mean(history.noise),
+        "snr_mean": mean(snr(history))
+    }
+
+
+def report(history, outage=300, window=50):
+    stats = node_stats(history)
+    nodes, received, lost, rate = packet_loss(history)
+    out_node, out_start, out_end = outages(history, outage)
+    # the rssi of the last window packets of each node, at every row
+    recent_mean = rolling_mean(history.rssi, window, history.node)
+    recent_low = rolling_percentile(history.rssi, window, 5, history.node)
+    for i, node in enumerate(stats["node"]):
+        p = stats["rssi_percentile"]
+        rows = history.node == node
+        print(f"node {node}: {received[i]} packets, {lost[i]} lost ({rate[i]:.1%})")
+        print(f"    rssi mean {stats['rssi_mean'][i]:.1f}dBm  p5/p50/p95 {p[5][i]:.0f}/{p[50][i]:.0f}/{p[95][i]:.0f}dBm")
+        print(f"    last {window} packets: rssi mean {recent_mean[rows][-1]:.1f}dBm  p5 {recent_low[rows][-1]:.0f}dBm, "
+              f"worst mean {np.nanmin(recent_mean[rows]):.1f}dBm")
+        print(f"    noise mean {stats['noise_mean'][i]:.1f}dBm  snr mean {stats['snr_mean'][i]:.1f}dB")
+        print(f"    {np.count_nonzero(out_node == node)} outages over {outage}s, "
+              f"{np.sum((out_end - out_start)[out_node == node]):.0f}s in total")
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else "journal"
+    if os.path.isdir(path):
+        report(load_journal(path))
+    elif path.endswith(".csv"):
+        report(load_csv(path))
+    else:
+        report(load_log(path))
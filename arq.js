@@ -0,0 +1,120 @@
+// arq.js (Node.js)
+// The receiving side of arq.py and the packet framing of sx126x.py, so the
+// JS nodes understand what the Python nodes send
+//
+//    packet:      [ADDR_HIGH, ADDR_LOW, 0xFE, LENGTH, message...] (+ rssi byte)
+//    data frame:  [0xA5, SESSION, SEQ, BASE, message...]
+//    ack frame:   [0xA6, SESSION, SEQ]
+//
+//    FrameDecoder splits the bytes of the serial port into packets like
+//    sx126x.FrameDecoder; packets without the 0xFE marker end with the
+//    silence on the port. Receiver acknowledges every ARQ data frame and
+//    hands the messages on in order and once, like arq.Link.handle().
+
+const { Buffer } = require('node:buffer');
+
+const MAGIC = 0xFE;
+const HEADER = 4;
+const DATA = 0xA5;
+const ACK = 0xA6;
+const WINDOW = 8;
+const SEQ_SPACE = 256;
+
+function frame(addr, data) {
+    // the bytes written to the module for one packet from addr
+    data = Buffer.from(data);
+    if (data.length > 0xff) {
+        throw new RangeError("message is longer than 255 bytes");
+    }
+    return Buffer.concat([Buffer.from([addr >> 8 & 0xff, addr & 0xff, MAGIC, data.length]), data]);
+}
+
+class FrameDecoder {
+    constructor(rssi = false, gap = 20) {
+        this.rssi = rssi;
+        this.gap = gap;
+        this.buf = Buffer.alloc(0);
+        this.timer = null;
+    }
+
+    // onPacket is called with { node_address, data, rssi } of every packet
+    feed(chunk, onPacket) {
+        this.buf = Buffer.concat([this.buf, chunk]);
+        const tail = this.rssi ? 1 : 0;
+        while (this.buf.length >= HEADER && this.buf[2] === MAGIC) {
+            const need = HEADER + this.buf[3] + tail;
+            if (this.buf.length < need) {
+                break;
+            }
+            onPacket(this.packet(this.buf.subarray(0, need), HEADER, tail));
+            this.buf = this.buf.subarray(need);
+        }
+        clearTimeout(this.timer);
+        if (this.buf.length > 0) {
+            // an unframed packet ends with the silence on the port
+            this.timer = setTimeout(() => {
+                if (this.buf.length >= 2 + tail) {
+                    onPacket(this.packet(this.buf, 2, tail));
+                }
+                this.buf = Buffer.alloc(0);
+            }, this.gap);
+        }
+    }
+
+    packet(bytes, header, tail) {
+        return {
+            node_address: (bytes[0] << 8) + bytes[1],
+            data: Buffer.from(bytes.subarray(header, bytes.length - tail)),
+            rssi: tail ? -(256 - bytes[bytes.length - 1]) : null
+        };
+    }
+}
+
+class Receiver {
+    constructor() {
+        // addr -> { session, base, buffered: Map(seq -> message) }
+        this.peers = new Map();
+        this.duplicates = 0;
+    }
+
+    // { ack, messages } of the data of a packet from addr: ack is the frame to
+    // send back (null when it is no ARQ frame), messages what goes to the application
+    handle(addr, data) {
+        if (data.length < 4 || data[0] !== DATA) {
+            return { ack: null, messages: data.length === 3 && data[0] === ACK ? [] : [data] };
+        }
+        const [session, seq, senderBase] = [data[1], data[2], data[3]];
+        // acknowledge every copy, the ack of the first one may have been lost
+        const ack = Buffer.from([ACK, session, seq]);
+        let peer = this.peers.get(addr);
+        if (!peer || peer.session !== session) {
+            peer = { session, base: senderBase, buffered: new Map() };
+            this.peers.set(addr, peer);
+        }
+        const messages = [];
+        // whatever is missing before the base of the sender will not come any more
+        while ((senderBase - peer.base + SEQ_SPACE) % SEQ_SPACE > 0 &&
+               (senderBase - peer.base + SEQ_SPACE) % SEQ_SPACE < SEQ_SPACE / 2) {
+            if (peer.buffered.has(peer.base)) {
+                messages.push(peer.buffered.get(peer.base));
+                peer.buffered.delete(peer.base);
+            }
+            peer.base = (peer.base + 1) % SEQ_SPACE;
+        }
+        const offset = (seq - peer.base + SEQ_SPACE) % SEQ_SPACE;
+        if (offset >= WINDOW || peer.buffered.has(seq)) {
+            this.duplicates += 1;
+            return { ack, messages };
+        }
+        peer.buffered.set(seq, data.subarray(4));
+        // deliver in order from the start of the window
+        while (peer.buffered.has(peer.base)) {
+            messages.push(peer.buffered.get(peer.base));
+            peer.buffered.delete(peer.base);
+            peer.base = (peer.base + 1) % SEQ_SPACE;
+        }
+        return { ack, messages };
+    }
+}
+
+module.exports = { MAGIC, HEADER, DATA, ACK, frame, FrameDecoder, Receiver };
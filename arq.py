@@ -0,0 +1,202 @@
+# This file is the reliable delivery on top of sx126x.send() for the commands
+# which must not get lost (see "Error Handling" in readme.md)
+#
+#    data frame:  [0xA5, SESSION, SEQ, BASE, message...]
+#    ack frame:   [0xA6, SESSION, SEQ]
+#
+#    Selective repeat: every data frame is acknowledged on its own and only
+#    the frames without an ack are sent again. SEQ counts per destination
+#    (mod 256) and at most WINDOW frames are outstanding, so the receiver can
+#    tell a repeated frame from a new one. BASE is the oldest SEQ the sender
+#    still waits for, the receiver never waits for anything before it.
+#    SESSION is chosen at random when the sender starts, a new session resets
+#    the receiver's state.
+#
+#    The retransmission timeout adapts to the round trips measured from the
+#    acks (Jacobson/Karels, samples of repeated frames are not used).
+#    Packets which are not ARQ frames are passed through untouched.
+
+import random
+import threading
+import time
+import collections
+
+DATA = 0xA5
+ACK = 0xA6
+WINDOW = 8
+SEQ_SPACE = 256
+# [DATA, SESSION, SEQ, BASE] in front of the message, [ACK, SESSION, SEQ]
+HEADER = 4
+ACK_LENGTH = 3
+
+
+class Rto:
+    # retransmission timeout of one destination
+
+    def __init__(self, initial=3.0, min_rto=0.5, max_rto=30.0):
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+
+    def sample(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(max(self.srtt + 4 * self.rttvar, self.min_rto), self.max_rto)
+
+    def backoff(self):
+        self.rto = min(self.rto * 2, self.max_rto)
+
+
+class Link:
+    # Reliable delivery through one sx126x node. send() / send_many() wait for
+    # the acks, receive() acknowledges data frames and drops repeated ones.
+    # Both read the node themselves, so the node may or may not run its reader thread.
+
+    def __init__(self, node, window=WINDOW, max_retries=5):
+        self.node = node
+        self.window = window
+        self.max_retries = max_retries
+        self.session = random.randrange(256)
+        self.next_seq = collections.defaultdict(int)
+        self.rto = collections.defaultdict(Rto)
+        self.acks = set()
+        self.inbox = collections.deque()
+        # receive side: source -> [session, base, {seq: packet}]
+        self.peers = {}
+        self.cond = threading.Condition()
+        self.pump_lock = threading.Lock()
+        self.retransmissions = 0
+        self.duplicates = 0
+
+    def send(self, dest, data):
+        # True once dest acknowledged data, False after max_retries
+        return not self.send_many(dest, [data])
+
+    def send_many(self, dest, messages):
+        # send a list of messages with up to window of them outstanding,
+        # returns the indexes of the messages which were never acknowledged
+        messages = [m.encode() if isinstance(m, str) else bytes(m) for m in messages]
+        pending = list(range(len(messages)))
+        outstanding = {}  # seq -> [index, sent at, tries]
+        failed = []
+        rto = self.rto[dest]
+
+        while pending or outstanding:
+            while pending and len(outstanding) < self.window:
+                index = pending.pop(0)
+                seq = self.next_seq[dest]
+                self.next_seq[dest] = (seq + 1) % SEQ_SPACE
+                outstanding[seq] = [index, time.time(), 1]
+                self.transmit(dest, seq, next(iter(outstanding)), messages[index])
+
+            with self.cond:
+                for seq in list(outstanding):
+                    if (dest, self.session, seq) in self.acks:
+                        self.acks.discard((dest, self.session, seq))
+                        index, sent_at, tries = outstanding.pop(seq)
+                        if tries == 1:
+                            rto.sample(time.time() - sent_at)
+
+            now = time.time()
+            expired = [seq for seq, entry in outstanding.items() if now - entry[1] >= rto.rto]
+            if expired:
+                # one backoff per timeout, not per frame of the window
+                rto.backoff()
+            for seq in expired:
+                entry = outstanding[seq]
+                if entry[2] > self.max_retries:
+                    failed.append(entry[0])
+                    del outstanding[seq]
+                    continue
+                self.retransmissions += 1
+                self.transmit(dest, seq, next(iter(outstanding)), messages[entry[0]])
+                entry[1] = time.time()
+                entry[2] += 1
+
+            if outstanding:
+                self.wait(lambda: any((dest, self.session, s) in self.acks for s in outstanding), 0.05)
+        return sorted(failed)
+
+    def transmit(self, dest, seq, base, data):
+        self.node.send(bytes([DATA, self.session, seq, base]) + data, dest=dest)
+
+    def receive(self, timeout=0):
+        # the next packet for the application, ARQ frames come without their header
+        self.wait(lambda: self.inbox, timeout)
+        with self.cond:
+            if self.inbox:
+                return self.inbox.popleft()
+        return None
+
+    def wait(self, ready, timeout):
+        # read the node until ready() is true or timeout seconds have passed
+        deadline = time.time() + timeout
+        while True:
+            with self.cond:
+                if ready():
+                    return True
+            remaining = max(deadline - time.time(), 0)
+            if self.pump_lock.acquire(blocking=False):
+                try:
+                    packet = self.node.receive_packet(min(remaining, 0.05))
+                finally:
+                    self.pump_lock.release()
+                if packet is not None:
+                    self.handle(packet)
+                    continue
+            else:
+                # another thread is reading the node, it will notify us
+                with self.cond:
+                    self.cond.wait(min(remaining, 0.05))
+            if time.time() >= deadline:
+                with self.cond:
+                    return bool(ready())
+
+    def handle(self, packet):
+        data = packet.data
+        if len(data) == ACK_LENGTH and data[0] == ACK:
+            with self.cond:
+                self.acks.add((packet.addr, data[1], data[2]))
+                self.cond.notify_all()
+            return
+        if len(data) < HEADER or data[0] != DATA:
+            with self.cond:
+                self.inbox.append(packet)
+                self.cond.notify_all()
+            return
+
+        session, seq, sender_base = data[1], data[2], data[3]
+        # acknowledge every copy, the ack of the first one may have been lost
+        self.node.send(bytes([ACK, session, seq]), dest=packet.addr)
+        with self.cond:
+            peer = self.peers.get(packet.addr)
+            if peer is None or peer[0] != session:
+                peer = self.peers[packet.addr] = [session, sender_base, {}]
+            base, buffered = peer[1], peer[2]
+
+            # the sender got the acks up to its base or gave up on them,
+            # whatever is missing before it will not come any more
+            while 0 < (sender_base - base) % SEQ_SPACE < SEQ_SPACE // 2:
+                if base in buffered:
+                    self.inbox.append(buffered.pop(base))
+                base = (base + 1) % SEQ_SPACE
+
+            offset = (seq - base) % SEQ_SPACE
+            if offset >= self.window or seq in buffered:
+                # already delivered (behind the window) or already buffered
+                self.duplicates += 1
+                peer[1] = base
+                return
+            buffered[seq] = packet._replace(data=data[HEADER:])
+            # deliver in order from the start of the window
+            while base in buffered:
+                self.inbox.append(buffered.pop(base))
+                base = (base + 1) % SEQ_SPACE
+            peer[1] = base
+            self.cond.notify_all()
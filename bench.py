@@ -0,0 +1,340 @@
+# This file is the latency and throughput benchmark of the driver, it runs a
+# home unit and a motor unit on the emulated radio (emulator.py)
+#
+#    python bench.py --commands 20 --telemetry 30 > bench.json
+#
+#    round trip   home.py -> motor.py -> send_reply, the time of every command
+#                 split into
+#                   send_setup     send() before the write (mode pins, settle sleep)
+#                   uart_write     host -> module at the UART baud
+#                   air            time on air
+#                   uart_read      module -> host
+#                   receive_wait   until receive() hands the packet to the program
+#                                  (reader thread, polling, the ARQ ack of the motor)
+#                   ack            the motor sending its ARQ ack, part of receive_wait
+#                   decode         codec.decode()
+#                   actuation      from the decoded command to send_reply() (GPIO)
+#                 for the request and the reply, commands with a retransmission
+#                 only count in the total
+#    set          sx126x.set() with the same registers and with a new address
+#    --baud       the UART rate of both nodes (set_baud), 9600 to 115200
+#    telemetry    send_cpu_continue() of node_100_main.py back to back
+#
+#    The result is JSON on stdout, times in milliseconds.
+
+import json
+import time
+import platform
+import argparse
+import threading
+
+import emulator
+import fleet
+
+COMMANDS = ["ON", "STATUS", "OFF"]
+
+
+def summary(values):
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    n = len(values)
+    return {
+        "count": n,
+        "mean": round(sum(values) / n * 1000, 3),
+        "p50": round(values[n // 2] * 1000, 3),
+        "p90": round(values[min(int(n * 0.9), n - 1)] * 1000, 3),
+        "max": round(values[-1] * 1000, 3)
+    }
+
+
+class Trace:
+    # timestamps of the driver and the emulator, all hooks only append
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+
+    def add(self, kind, who, t, *data):
+        with self.lock:
+            self.events.append((kind, who, t) + data)
+
+    def clear(self):
+        with self.lock:
+            self.events = []
+
+    def first(self, kind, who, after, match=None):
+        with self.lock:
+            for event in self.events:
+                if event[0] == kind and event[1] == who and event[2] >= after and (match is None or match(event)):
+                    return event
+        return None
+
+    def count(self, kind, who, after, match=None):
+        with self.lock:
+            return sum(1 for e in self.events
+                       if e[0] == kind and e[1] == who and e[2] >= after and (match is None or match(e)))
+
+
+def hook(medium, trace, node, module, who):
+    # the bytes the host writes, the packets the module sends and what it passes to the host
+    write = node.ser.write
+
+    def ser_write(data):
+        trace.add("write", who, time.time(), bytes(data))
+        return write(data)
+    node.ser.write = ser_write
+
+    output = module.write
+
+    def module_write(data):
+        trace.add("output", who, time.time(), data)
+        return output(data)
+    module.write = module_write
+
+    send = node.send
+
+    def node_send(data, dest=None, channel=None):
+        start = time.time()
+        result = send(data, dest, channel)
+        trace.add("send", who, start, bytes(data) if not isinstance(data, str) else data.encode(), time.time())
+        return result
+    node.send = node_send
+
+
+def payload_type(first, write=False):
+    # the first byte of the message: arq.DATA, arq.ACK or codec.VERSION; the
+    # packets on the air start with the header, the writes of the host also
+    # with the target the module consumes in fixed mode
+    import sx126x
+    offset = sx126x.FrameDecoder.HEADER + (sx126x.ROUTE if write else 0)
+    return lambda event: len(event[3]) > offset and event[3][offset] == first
+
+
+def bench_set(node, freq, rounds):
+    unchanged, changed = [], []
+    for i in range(rounds):
+        t = time.time()
+        node.reconfigure()
+        unchanged.append(time.time() - t)
+    addr = node.addr
+    for i in range(rounds):
+        t = time.time()
+        node.reconfigure(addr=addr + 1 + i % 2)
+        changed.append(time.time() - t)
+    node.reconfigure(addr=addr)
+    return {"unchanged": summary(unchanged), "changed": summary(changed)}
+
+
+def round_trips(medium, trace, home, link, unit, gateway_module, motor_module, commands):
+    import arq
+    import codec
+
+    decode = codec.decode
+    decodes = []
+
+    def timed_decode(frame):
+        start = time.time()
+        try:
+            return decode(frame)
+        finally:
+            decodes.append((threading.current_thread().name, start, time.time()))
+    codec.decode = timed_decode
+
+    handle = unit.handle
+
+    def timed_handle(packet):
+        trace.add("handle", "motor", time.time())
+        return handle(packet)
+    unit.handle = timed_handle
+
+    send_reply = unit.send_reply
+
+    def timed_reply(target_address, error=codec.NO_ERROR):
+        trace.add("reply", "motor", time.time())
+        return send_reply(target_address, error)
+    unit.send_reply = timed_reply
+
+    transmit = medium.transmit
+
+    def timed_transmit(sender, dest, channel, payload, start, duration, wake=None):
+        who = "home" if sender is gateway_module else "motor"
+        trace.add("air", who, start, bytes(payload), start + duration)
+        return transmit(sender, dest, channel, payload, start, duration, wake)
+    medium.transmit = timed_transmit
+
+    phases = {}
+    totals = []
+    retried = 0
+
+    def phase(name, value):
+        phases.setdefault(name, []).append(value)
+
+    try:
+        for i in range(commands):
+            command = COMMANDS[i % len(COMMANDS)]
+            del decodes[:]
+            t0 = time.time()
+            if not link.send(1, codec.encode_command(command)):
+                continue
+            reply = None
+            while reply is None and time.time() < t0 + 10:
+                packet = link.receive(timeout=1)
+                if packet is not None and packet.data[:1] == bytes([codec.VERSION]):
+                    reply = packet
+                    t_end = time.time()
+            if reply is None:
+                continue
+            totals.append(t_end - t0)
+            if trace.count("air", "home", t0, payload_type(arq.DATA)) != 1 or \
+               trace.count("air", "motor", t0, payload_type(codec.VERSION)) != 1:
+                retried += 1
+                continue
+
+            # request: home -> motor
+            w1 = trace.first("write", "home", t0, payload_type(arq.DATA, write=True))
+            air1 = trace.first("air", "home", t0, payload_type(arq.DATA))
+            out1 = trace.first("output", "motor", air1[4])
+            handled = trace.first("handle", "motor", out1[2])
+            ack = trace.first("send", "motor", t0, lambda e: e[3][:1] == bytes([arq.ACK]))
+            motor_decode = [d for d in decodes if d[0] != threading.current_thread().name][0]
+            replied = trace.first("reply", "motor", t0)
+            # reply: motor -> home
+            w2 = trace.first("write", "motor", replied[2], payload_type(codec.VERSION, write=True))
+            air2 = trace.first("air", "motor", replied[2], payload_type(codec.VERSION))
+            out2 = trace.first("output", "home", air2[4])
+
+            phase("request.send_setup", w1[2] - t0)
+            phase("request.uart_write", air1[2] - w1[2])
+            phase("request.air", air1[4] - air1[2])
+            phase("request.uart_read", out1[2] - air1[4])
+            phase("request.receive_wait", handled[2] - out1[2])
+            phase("request.ack", ack[4] - ack[2])
+            phase("decode", motor_decode[2] - motor_decode[1])
+            phase("actuation", replied[2] - motor_decode[2])
+            phase("reply.send_setup", w2[2] - replied[2])
+            phase("reply.uart_write", air2[2] - w2[2])
+            phase("reply.air", air2[4] - air2[2])
+            phase("reply.uart_read", out2[2] - air2[4])
+            phase("reply.receive_wait", t_end - out2[2])
+            t = time.time()
+            decode(reply.data)
+            phase("reply.decode", time.time() - t)
+            trace.clear()
+    finally:
+        codec.decode = decode
+        medium.transmit = transmit
+
+    return {
+        "commands": commands,
+        "answered": len(totals),
+        "retransmitted": retried,
+        "total": summary(totals),
+        "phases": {name: summary(values) for name, values in phases.items()}
+    }
+
+
+def telemetry(sender, receiver, seconds):
+    # send_cpu_continue without the timer: one reading after the other
+    received = []
+    running = True
+
+    def count():
+        while running or receiver.ring:
+            packet = receiver.get(0.2)
+            if packet is not None:
+                received.append(packet)
+    counter = threading.Thread(target=count, daemon=True)
+    counter.start()
+
+    sends = []
+    sent_bytes = 0
+    start = time.time()
+    while time.time() - start < seconds:
+        message = "CPU Temperature:" + str(45.0 + len(sends) % 10) + " C"
+        t = time.time()
+        sender.send(message, dest=receiver.addr)
+        sends.append(time.time() - t)
+        sent_bytes += len(message)
+    elapsed = time.time() - start
+    time.sleep(1)
+    running = False
+    counter.join()
+    received_bytes = sum(len(p.data) for p in received)
+    return {
+        "seconds": round(elapsed, 3),
+        "sent": len(sends),
+        "received": len(received),
+        "messages_per_second": round(len(received) / elapsed, 3),
+        "payload_bytes_per_second": round(received_bytes / elapsed, 3),
+        "send": summary(sends)
+    }
+
+
+def run(commands=20, telemetry_seconds=20, set_rounds=10, freq=433, air_speed=2400, baud=9600):
+    medium = emulator.Medium()
+    emulator.install(medium.gpio)
+    import arq
+    import motor
+
+    trace = Trace()
+    home = fleet.make_node(medium, 0, 0, None, freq, air_speed, baud=baud)
+    gateway_module = medium.modules[-1]
+    remote = fleet.make_node(medium, 1, 1, None, freq, air_speed, baud=baud)
+    motor_module = medium.modules[-1]
+    hook(medium, trace, home, gateway_module, "home")
+    hook(medium, trace, remote, motor_module, "motor")
+
+    result = {
+        "config": {"freq": freq, "air_speed": air_speed, "baud": motor_module.baud,
+                   "commands": commands, "telemetry_seconds": telemetry_seconds},
+        "environment": {"python": platform.python_version(), "machine": platform.machine()},
+        "set": bench_set(home, freq, set_rounds)
+    }
+
+    home.start_reader()
+    remote.start_reader()
+    link = arq.Link(home)
+    unit = motor.Motor(remote, arq.Link(remote), 0, relay_on=5000, relay_off=5001, sensor=5002)
+    running = True
+
+    def serve():
+        while running:
+            unit.poll(timeout=0.05)
+    server = threading.Thread(target=serve, daemon=True, name="motor")
+    server.start()
+
+    result["round_trip"] = round_trips(medium, trace, home, link, unit, gateway_module, motor_module, commands)
+    running = False
+    server.join()
+
+    result["telemetry"] = telemetry(remote, home, telemetry_seconds)
+    result["air"] = dict(medium.stats)
+    home.stop_reader()
+    remote.stop_reader()
+    medium.close()
+    return result
+
+
+if __name__ == '__main__':
+    import io
+    import contextlib
+
+    parser = argparse.ArgumentParser(description="latency and throughput of the driver on the emulator")
+    parser.add_argument("--commands", type=int, default=20)
+    parser.add_argument("--telemetry", type=float, default=20, help="seconds of telemetry")
+    parser.add_argument("--set-rounds", type=int, default=10)
+    parser.add_argument("--freq", type=int, default=433)
+    parser.add_argument("--air-speed", type=int, default=2400)
+    parser.add_argument("--baud", type=int, default=9600, help="UART rate of both nodes")
+    parser.add_argument("--output", help="write the JSON to this file too")
+    args = parser.parse_args()
+
+    # the driver and the motor print every packet
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = run(args.commands, args.telemetry, args.set_rounds, args.freq, args.air_speed, args.baud)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
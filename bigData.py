@@ -65,7 +65,7 @@ def get_cpu_temp():
 
 #node = sx126x.sx126x(serial_num = "/dev/ttyS0",freq=433,addr=30,power=22,rssi=False)
 #node = sx126x.sx126x(serial_num = "/dev/ttyS0",freq=433,addr=100,power=22,rssi=True)
-node = sx126x.sx126x(serial_num = "/dev/ttyAMA0",freq=433,addr=100,power=22,rssi=True)
+node = sx126x.sx126x(serial_num = "/dev/ttyAMA0",freq=433,addr=100,power=22,rssi=True,fixed=True)
 
 
 def send_deal():
@@ -84,11 +84,7 @@ def send_deal():
 
     get_t = get_rec.split(",")
     
-    node.addr_temp = node.addr
-    node.set(node.freq,int(get_t[0]),node.power,node.rssi)
-    node.send(get_t[1])
-    time.sleep(0.2)
-    node.set(node.freq,node.addr_temp,node.power,node.rssi)
+    node.send(get_t[1],dest=int(get_t[0]))
 
     print('\x1b[2A',end='\r')
     print(" "*100)
@@ -116,12 +112,8 @@ def send_bigdata(send_to_who,bigdata):
             # sys.stdout.flush()
 
     # get_t = get_rec.split(",")
-    node.send_to = send_to_who
-    node.addr_temp = node.addr
-    node.set(node.freq,node.send_to,node.power,node.rssi)
-    node.send(str(bigdata))
-    time.sleep(0.2)
-    node.set(node.freq,node.addr_temp,node.power,node.rssi)
+    # split into fragments of the configured packet size by the driver
+    node.send_large(send_to_who,str(bigdata.tolist()))
     # print("the node temporary address")
     # print(buffer_size)
 
@@ -138,21 +130,11 @@ def send_cpu_continue(send_to_who,continue_or_not = True):
     if continue_or_not:
         global timer_task
         global seconds
-        node.send_to = send_to_who
-        node.addr_temp = node.addr
-        node.set(node.freq,node.send_to,node.power,node.rssi)
-        node.send("CPU Temperature:"+str(get_cpu_temp())+" C")
-        time.sleep(0.2)
-        node.set(node.freq,node.addr_temp,node.power,node.rssi)
+        node.send("CPU Temperature:"+str(get_cpu_temp())+" C",dest=send_to_who)
         timer_task = Timer(seconds,send_cpu_continue,(send_to_who,))
         timer_task.start()
     else:
-        node.send_to = send_to_who
-        node.addr_temp = node.addr
-        node.set(node.freq,node.send_to,node.power,node.rssi)
-        node.send("CPU Temperature:"+str(get_cpu_temp())+" C")
-        time.sleep(0.2)
-        node.set(node.freq,node.addr_temp,node.power,node.rssi)
+        node.send("CPU Temperature:"+str(get_cpu_temp())+" C",dest=send_to_who)
         timer_task.cancel()
         pass
     
@@ -185,12 +167,9 @@ try:
             # dectect key m to send big data
             if c == '\x6d':
                 a = np.arange(90)
-                # This is the most primitive approach, I have just divided into two subsets.
-                # We need to do some general or automatic way, maybe based on the payload size.
-                
-                send_bigdata(send_to_who,a[0:45])
-                
-                send_bigdata(send_to_who,a[46:90])
+                # send_large() splits it based on the payload size and the
+                # receiver puts the fragments together again with recv_large()
+                send_bigdata(send_to_who,a)
                 
                 print("Finished the data transmission for current instance")
                 
@@ -212,6 +191,10 @@ try:
             
             
         node.receive()
+
+        bigdata = node.recv_large(timeout=0)
+        if bigdata:
+            print(f"receive big data from address \033[1;32m{bigdata.addr} node\033[0m {bigdata.data.decode()}")
         
         # timer,send messages automatically
         
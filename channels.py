@@ -0,0 +1,256 @@
+# This file is the channel plan of a fleet: the nodes are spread over groups
+# of a frequency and a net id so that they do not all share one channel
+#
+#    plan = channels.Plan(channels.groups([433, 435, 437]))
+#    plan.assign(30, load=0.002)          # the group of a new node
+#    moves = plan.rebalance()             # [(addr, old group, new group)]
+#    plan.migrate(configurator, moves)    # over the air (remote_config.py)
+#
+#    The load of a node is the fraction of the time its traffic is on the
+#    air. It is given when the node is assigned and then measured: observe()
+#    adds the time on air of every packet from or to the node, update()
+#    turns it into the average of the last period. Nodes on one frequency
+#    share the air whatever their net id, the net id only keeps them from
+#    hearing the other group, so the load is balanced by frequency.
+#
+#    A new node goes to the group with the least load. rebalance() moves
+#    the node which evens out the busiest and the quietest frequency best,
+#    one after the other while a move lowers the busiest by more than
+#    hysteresis, at most max_moves at a time: a move is a remote
+#    configuration of the node and costs more than a slightly uneven plan.
+#
+#    The registry is a JSON file of {addr: [freq, net_id, load]}, written
+#    as a whole on every change (path=None keeps it in memory only).
+#
+#    Scheduler is the gateway side: messages are queued by destination and
+#    flush() sends them group by group, so the gateway retunes once per
+#    group with traffic and not once per message, and listens in each group
+#    for linger seconds for the replies before it moves on.
+
+import os
+import json
+import time
+import collections
+
+import sx126x
+import arq
+
+Group = collections.namedtuple('Group', ['freq', 'net_id'])
+
+
+def groups(freqs, net_ids=(0,)):
+    # every combination of freqs and net_ids, the frequencies first
+    return [Group(freq, net_id) for net_id in net_ids for freq in freqs]
+
+
+class Plan:
+
+    def __init__(self, groups, path="channel_plan.json", hysteresis=0.1, max_moves=4, alpha=0.5):
+        if not groups:
+            raise ValueError("a plan needs at least one group")
+        self.groups = [Group(*group) for group in groups]
+        self.path = path
+        self.hysteresis = hysteresis
+        self.max_moves = max_moves
+        self.alpha = alpha
+        # addr -> group, addr -> load
+        self.nodes = {}
+        self.loads = {}
+        # addr -> time on air since the last update()
+        self.airtime = collections.Counter()
+        self.updated = time.time()
+        self.load()
+
+    def group(self, addr):
+        # the group of addr, None for a node outside the plan
+        return self.nodes.get(addr)
+
+    def members(self, group):
+        return [addr for addr, g in self.nodes.items() if g == group]
+
+    def freq_loads(self):
+        # freq -> load of all its nodes
+        loads = {group.freq: 0.0 for group in self.groups}
+        for addr, group in self.nodes.items():
+            loads[group.freq] += self.loads.get(addr, 0.0)
+        return loads
+
+    def assign(self, addr, load=0.0):
+        # the group of addr, a new node goes to the quietest one
+        if addr in self.nodes:
+            return self.nodes[addr]
+        freqs = self.freq_loads()
+        sizes = collections.Counter(self.nodes.values())
+        group = min(self.groups, key=lambda g: (freqs[g.freq], sizes[g]))
+        self.nodes[addr] = group
+        self.loads[addr] = load
+        self.save()
+        return group
+
+    def remove(self, addr):
+        self.nodes.pop(addr, None)
+        self.loads.pop(addr, None)
+        self.save()
+
+    def observe(self, addr, length, air_speed):
+        # a packet of length bytes from or to addr
+        self.airtime[addr] += sx126x.time_on_air(length, air_speed)
+
+    def update(self):
+        # the measured loads of the period since the last update
+        now = time.time()
+        elapsed = now - self.updated
+        if elapsed <= 0:
+            return
+        for addr in self.nodes:
+            measured = self.airtime.pop(addr, 0.0) / elapsed
+            self.loads[addr] += self.alpha * (measured - self.loads.get(addr, 0.0))
+        self.airtime.clear()
+        self.updated = now
+        self.save()
+
+    def rebalance(self):
+        # move nodes from the busiest to the quietest frequency, returns the moves
+        moves = []
+        nodes = dict(self.nodes)
+        for _ in range(self.max_moves):
+            freqs = {group.freq: 0.0 for group in self.groups}
+            for addr, group in nodes.items():
+                freqs[group.freq] += self.loads.get(addr, 0.0)
+            busiest = max(freqs, key=freqs.get)
+            quietest = min(freqs, key=freqs.get)
+            gap = freqs[busiest] - freqs[quietest]
+            # the node which brings the two closest together, a node of more
+            # than the gap would only swap the roles
+            candidates = [addr for addr, group in nodes.items()
+                          if group.freq == busiest and 0 < self.loads.get(addr, 0.0) < gap]
+            if not candidates:
+                break
+            addr = min(candidates, key=lambda a: abs(gap - 2 * self.loads[a]))
+            # the busiest frequency after the move
+            after = max(freqs[busiest] - self.loads[addr], freqs[quietest] + self.loads[addr],
+                        *(load for freq, load in freqs.items() if freq not in (busiest, quietest)))
+            if freqs[busiest] - after <= self.hysteresis * freqs[busiest]:
+                break
+            # keep the net id of the node where the quiet frequency has it
+            target = [g for g in self.groups if g.freq == quietest]
+            target = next((g for g in target if g.net_id == nodes[addr].net_id), target[0])
+            moves.append((addr, nodes[addr], target))
+            nodes[addr] = target
+        return moves
+
+    def move(self, addr, group):
+        self.nodes[addr] = Group(*group)
+        self.save()
+
+    def migrate(self, configurator, moves, delay=5, confirm=True):
+        # apply moves over the air, returns {addr: status} (see remote_config.Configurator);
+        # the gateway goes to the old group of the nodes to ask and to the new one to verify
+        node = configurator.link.node
+        home = Group(node.params["freq"], node.params["net_id"])
+        results = {}
+        batches = collections.defaultdict(list)
+        for addr, old, new in moves:
+            batches[(Group(*old), Group(*new))].append(addr)
+        for (old, new), addrs in batches.items():
+            tune(node, old)
+            results.update(configurator.push(addrs, dict(new._asdict()), delay=delay))
+        if confirm:
+            # the nodes look at the delay every half second and take a while to apply
+            time.sleep(delay + 1)
+        for (old, new), addrs in batches.items():
+            accepted = [addr for addr in addrs if results.get(addr) == "accepted"]
+            if not accepted:
+                continue
+            if confirm:
+                tune(node, new)
+                results.update(configurator.verify(accepted, dict(new._asdict())))
+            for addr in accepted:
+                if results[addr] in ("ok", "accepted"):
+                    self.move(addr, new)
+        tune(node, home)
+        return results
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except ValueError:
+            return
+        for addr, (freq, net_id, load) in saved.items():
+            self.nodes[int(addr)] = Group(freq, net_id)
+            self.loads[int(addr)] = load
+
+    def save(self):
+        if self.path is None:
+            return
+        saved = {str(addr): [group.freq, group.net_id, round(self.loads.get(addr, 0.0), 6)]
+                 for addr, group in self.nodes.items()}
+        temp = self.path + ".tmp"
+        with open(temp, "w") as f:
+            json.dump(saved, f)
+        os.replace(temp, self.path)
+
+
+def tune(node, group):
+    # True if node had to change its registers
+    if node.params["freq"] == group.freq and node.params["net_id"] == group.net_id:
+        return False
+    node.reconfigure(freq=group.freq, net_id=group.net_id)
+    return True
+
+
+class Scheduler:
+    # The sends of the gateway batched by group. link is the arq.Link of the
+    # gateway node, home the group it listens in between flushes.
+
+    def __init__(self, plan, link, home=None, linger=2.0):
+        self.plan = plan
+        self.link = link
+        self.node = link.node
+        self.home = Group(*home) if home is not None else \
+            Group(self.node.params["freq"], self.node.params["net_id"])
+        self.linger = linger
+        # group -> dest -> messages
+        self.queues = collections.OrderedDict()
+        # (group, packet) received during flush()
+        self.inbox = collections.deque()
+        self.switches = 0
+
+    def queue(self, dest, data):
+        group = self.plan.group(dest) or self.home
+        self.queues.setdefault(group, collections.OrderedDict()).setdefault(dest, []).append(data)
+
+    def flush(self):
+        # send everything queued, returns {dest: [indexes of messages never acknowledged]}
+        current = Group(self.node.params["freq"], self.node.params["net_id"])
+        # the group the gateway is in first, its home last, it stays there
+        order = sorted(self.queues, key=lambda g: (g != current, g == self.home))
+        failed = {}
+        for group in order:
+            self.switches += tune(self.node, group)
+            for dest, messages in self.queues.pop(group).items():
+                failed[dest] = self.link.send_many(dest, messages)
+                for message in messages:
+                    self.plan.observe(dest, sx126x.packet_length(arq.HEADER + len(message)), self.node.air_speed)
+            deadline = time.time() + self.linger
+            while time.time() < deadline:
+                packet = self.link.receive(timeout=max(deadline - time.time(), 0))
+                if packet is not None:
+                    self.plan.observe(packet.addr, sx126x.packet_length(len(packet.data)), self.node.air_speed)
+                    self.inbox.append((group, packet))
+        self.switches += tune(self.node, self.home)
+        return failed
+
+    def receive(self, timeout=0):
+        # the next (group, packet), the ones of flush() first; packets heard
+        # between flushes are from the home group
+        if self.inbox:
+            return self.inbox.popleft()
+        packet = self.link.receive(timeout)
+        if packet is None:
+            return None
+        self.plan.observe(packet.addr, sx126x.packet_length(len(packet.data)), self.node.air_speed)
+        return self.home, packet
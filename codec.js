@@ -0,0 +1,124 @@
+// codec.js (Node.js)
+// The binary message format between the Home and the Motor unit, the same
+// as codec.py (see "Message Format" in readme.md)
+//
+//    every frame is [VERSION, MESSAGE_TYPE, DATA..., CRC]
+//
+//    request  (Home -> Motor):  [VERSION, ON/OFF/STATUS_REQUEST]
+//                               [VERSION, SET_TIMER, TIMER_MSB, TIMER_LSB]
+//    response (Motor -> Home):  [VERSION, STATUS_UPDATE, MOTOR_STATUS, RUN_TIME_MSB, RUN_TIME_LSB, ERROR_CODE]
+//
+//    CRC is a CRC-8 (polynomial 0x07) over all the bytes before it.
+
+const { Buffer } = require('node:buffer');
+
+const VERSION = 0x01;
+
+const ON = 0x01;
+const OFF = 0x02;
+const STATUS_REQUEST = 0x03;
+const SET_TIMER = 0x04;
+const STATUS_UPDATE = 0x10;
+
+const MOTOR_OFF = 0x00;
+const MOTOR_ON = 0x01;
+const MOTOR_ERROR = 0xFF;
+
+const NO_ERROR = 0x00;
+const POWER_FAILURE = 0x01;
+const UNKNOWN_COMMAND = 0x02;
+
+const COMMANDS = { ON: ON, OFF: OFF, STATUS: STATUS_REQUEST, SET_TIMER: SET_TIMER };
+const COMMAND_NAMES = Object.fromEntries(Object.entries(COMMANDS).map(([name, code]) => [code, name]));
+const STATUS_NAMES = { [MOTOR_OFF]: "OFF", [MOTOR_ON]: "ON", [MOTOR_ERROR]: "ERROR" };
+
+class CodecError extends Error {}
+
+const CRC_TABLE = (() => {
+    const table = [];
+    for (let i = 0; i < 256; i++) {
+        let crc = i;
+        for (let bit = 0; bit < 8; bit++) {
+            crc = crc & 0x80 ? ((crc << 1) ^ 0x07) & 0xff : (crc << 1) & 0xff;
+        }
+        table.push(crc);
+    }
+    return table;
+})();
+
+function crc8(data) {
+    let crc = 0;
+    for (const b of data) {
+        crc = CRC_TABLE[crc ^ b];
+    }
+    return crc;
+}
+
+function seal(body) {
+    const frame = Buffer.from([VERSION, ...body]);
+    return Buffer.concat([frame, Buffer.from([crc8(frame)])]);
+}
+
+function encodeCommand(command, timer = 0) {
+    // command is "ON", "OFF", "STATUS" or "SET_TIMER" (timer in seconds)
+    if (!(command in COMMANDS)) {
+        throw new CodecError(`unknown command ${command}`);
+    }
+    const messageType = COMMANDS[command];
+    if (messageType === SET_TIMER) {
+        timer = Math.min(Math.max(Math.trunc(timer), 0), 0xffff);
+        return seal([messageType, timer >> 8, timer & 0xff]);
+    }
+    return seal([messageType]);
+}
+
+function encodeStatus(status, runTime, error = NO_ERROR) {
+    // status is MOTOR_OFF/MOTOR_ON/MOTOR_ERROR, runTime in seconds
+    runTime = Math.min(Math.max(Math.trunc(runTime), 0), 0xffff);
+    return seal([STATUS_UPDATE, status, runTime >> 8, runTime & 0xff, error]);
+}
+
+function isFrame(data) {
+    // frames of senders from before the codec are text
+    return data.length > 0 && data[0] === VERSION;
+}
+
+function decode(frame) {
+    // returns an object such as { command: "ON" } or
+    // { status: "ON", run_time: 120, error: 0 }, throws CodecError on a bad frame
+    frame = Buffer.from(frame);
+    if (frame.length < 3) {
+        throw new CodecError("frame too short");
+    }
+    if (frame[0] !== VERSION) {
+        throw new CodecError(`unsupported version ${frame[0]}`);
+    }
+    if (crc8(frame.subarray(0, -1)) !== frame[frame.length - 1]) {
+        throw new CodecError("crc mismatch");
+    }
+
+    const messageType = frame[1];
+    const data = frame.subarray(2, -1);
+    if (messageType === STATUS_UPDATE) {
+        if (data.length !== 4) {
+            throw new CodecError("bad status length");
+        }
+        return { status: STATUS_NAMES[data[0]] || "ERROR", run_time: (data[1] << 8) + data[2], error: data[3] };
+    }
+    if (messageType === SET_TIMER) {
+        if (data.length !== 2) {
+            throw new CodecError("bad timer length");
+        }
+        return { command: "SET_TIMER", timer: (data[0] << 8) + data[1] };
+    }
+    if (messageType in COMMAND_NAMES && data.length === 0) {
+        return { command: COMMAND_NAMES[messageType] };
+    }
+    throw new CodecError(`unknown message type ${messageType}`);
+}
+
+module.exports = {
+    VERSION, ON, OFF, STATUS_REQUEST, SET_TIMER, STATUS_UPDATE,
+    MOTOR_OFF, MOTOR_ON, MOTOR_ERROR, NO_ERROR, POWER_FAILURE, UNKNOWN_COMMAND,
+    COMMANDS, CodecError, crc8, encodeCommand, encodeStatus, isFrame, decode
+};
@@ -0,0 +1,116 @@
+# This file is the binary message format between the Home and the Motor unit
+# (see "Message Format" in readme.md)
+#
+#    every frame is [VERSION, MESSAGE_TYPE, DATA..., CRC]
+#
+#    request  (Home -> Motor):  [VERSION, ON/OFF/STATUS_REQUEST]
+#                               [VERSION, SET_TIMER, TIMER_MSB, TIMER_LSB]
+#    response (Motor -> Home):  [VERSION, STATUS_UPDATE, MOTOR_STATUS, RUN_TIME_MSB, RUN_TIME_LSB, ERROR_CODE]
+#
+#    CRC is a CRC-8 (polynomial 0x07) over all the bytes before it.
+#    A command is 3 bytes and a status 7 bytes instead of ~45 bytes of JSON.
+
+VERSION = 0x01
+
+ON = 0x01
+OFF = 0x02
+STATUS_REQUEST = 0x03
+SET_TIMER = 0x04
+STATUS_UPDATE = 0x10
+
+MOTOR_OFF = 0x00
+MOTOR_ON = 0x01
+MOTOR_ERROR = 0xFF
+
+NO_ERROR = 0x00
+POWER_FAILURE = 0x01
+UNKNOWN_COMMAND = 0x02
+
+COMMANDS = {
+    "ON": ON,
+    "OFF": OFF,
+    "STATUS": STATUS_REQUEST,
+    "SET_TIMER": SET_TIMER
+}
+COMMAND_NAMES = {v: k for k, v in COMMANDS.items()}
+
+STATUS_NAMES = {
+    MOTOR_OFF: "OFF",
+    MOTOR_ON: "ON",
+    MOTOR_ERROR: "ERROR"
+}
+
+
+class CodecError(ValueError):
+    pass
+
+
+def make_crc_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xff if crc & 0x80 else (crc << 1) & 0xff
+        table.append(crc)
+    return table
+
+CRC_TABLE = make_crc_table()
+
+
+def crc8(data):
+    crc = 0
+    for b in data:
+        crc = CRC_TABLE[crc ^ b]
+    return crc
+
+
+def seal(body):
+    body = bytes([VERSION]) + bytes(body)
+    return body + bytes([crc8(body)])
+
+
+def encode_command(command, timer=0):
+    # command is "ON", "OFF", "STATUS" or "SET_TIMER" (timer in seconds)
+    if command not in COMMANDS:
+        raise CodecError(f"unknown command {command}")
+    message_type = COMMANDS[command]
+    if message_type == SET_TIMER:
+        timer = min(max(int(timer), 0), 0xffff)
+        return seal([message_type, timer >> 8, timer & 0xff])
+    return seal([message_type])
+
+
+def encode_status(status, run_time, error=NO_ERROR):
+    # status is MOTOR_OFF/MOTOR_ON/MOTOR_ERROR, run_time in seconds
+    run_time = min(max(int(run_time), 0), 0xffff)
+    return seal([STATUS_UPDATE, status, run_time >> 8, run_time & 0xff, error])
+
+
+def decode(frame):
+    # returns a dict such as {"command": "ON"} or
+    # {"status": "ON", "run_time": 120, "error": 0}, raises CodecError on a bad frame
+    frame = bytes(frame)
+    if len(frame) < 3:
+        raise CodecError("frame too short")
+    if frame[0] != VERSION:
+        raise CodecError(f"unsupported version {frame[0]}")
+    if crc8(frame[:-1]) != frame[-1]:
+        raise CodecError("crc mismatch")
+
+    message_type = frame[1]
+    data = frame[2:-1]
+    if message_type == STATUS_UPDATE:
+        if len(data) != 4:
+            raise CodecError("bad status length")
+        return {
+            "status": STATUS_NAMES.get(data[0], "ERROR"),
+            "run_time": (data[1] << 8) + data[2],
+            "error": data[3]
+        }
+    if message_type == SET_TIMER:
+        if len(data) != 2:
+            raise CodecError("bad timer length")
+        return {"command": "SET_TIMER", "timer": (data[0] << 8) + data[1]}
+    if message_type in COMMAND_NAMES and not data:
+        return {"command": COMMAND_NAMES[message_type]}
+    raise CodecError(f"unknown message type {message_type}")
@@ -0,0 +1,505 @@
+# This file is a software model of the Waveshare SX126x LoRa HAT for running
+# the sx126x class without a Raspberry Pi and without modules
+#
+#    medium = emulator.Medium()              the air, one thread for all modules
+#    a = medium.module(m0=22, m1=27)         a HAT, a.port is its serial device (a PTY)
+#    b = medium.module(m0=5, m1=6)
+#    emulator.install(medium.gpio)           RPi.GPIO for "import RPi.GPIO as GPIO"
+#
+#    import sx126x
+#    node = sx126x.sx126x(a.port, 433, 0, 22, False)
+#
+#    Every module listens to the M0/M1 pins given to it, a second node in the
+#    same process needs its own pins: sx126x.sx126x(b.port, ..., m0=5, m1=6)
+#
+#    The module knows
+#      - setting mode (M1 high): C0/C2 write and C1 read of the registers 00H~08H
+#      - normal mode: a packet is everything written until the UART goes quiet
+#        (at most the packet size of 04H), transparent or fixed-point (06H bit6),
+#        with the packet rssi byte (06H bit7), and the noise read C0 C1 C2 C3
+#      - deep sleep (M0 and M1 high) neither sends nor receives
+#      - WOR mode (M0 high): a WOR transmitter (06H bit3) sends every packet
+#        with a preamble of one WOR cycle (06H bits 2-0), a WOR receiver hears
+#        only such packets, with a cycle at least as long as its own
+#    Bytes are passed on after the time the UART needs at the baud of 03H, a
+#    packet reaches the other modules after its time on air. Bytes written by
+#    the host at another baud than the module's are lost, as on the wire.
+#
+#    The medium gives every link a path loss, from medium.link() or from the
+#    positions of the modules (log-distance model), and the rssi byte is the
+#    transmit power of 04H minus that loss. A packet is lost when
+#      - its rssi is below the sensitivity of the air speed,
+#      - the receiver was sending itself during any part of it (half duplex),
+#      - another packet overlapped it on the channel and was not at least
+#        capture dB weaker (otherwise the stronger one is captured).
+#    medium.stats counts the deliveries and the losses by reason.
+
+import os
+import sys
+import tty
+import math
+import time
+import heapq
+import types
+import termios
+import selectors
+import threading
+import collections
+
+import radio
+
+DEFAULT_REGS = [0x00, 0x00, 0x00, 0x62, 0x00, 0x17, 0x03, 0x00, 0x00]
+
+NOISE_READ = bytes([0xC0, 0xC1, 0xC2, 0xC3])
+
+
+def airtime(length, air_speed):
+    # the same time on air the driver budgets with
+    import sx126x
+    return sx126x.time_on_air(length, air_speed)
+
+
+def uart_time(length, baud):
+    # 8N1, ten bits per byte
+    return length * 10.0 / baud
+
+
+class GPIO:
+    # The part of RPi.GPIO used by the scripts. Writes to the M0/M1 pin of a
+    # module change its mode, every other pin is only remembered.
+
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+
+    def __init__(self):
+        self.pins = {}
+        self.listeners = {}
+        self.lock = threading.Lock()
+
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None, initial=None):
+        if initial is not None:
+            self.output(pin, initial)
+        elif pin not in self.pins:
+            self.pins[pin] = self.HIGH if pull_up_down == self.PUD_UP else self.LOW
+
+    def output(self, pin, value):
+        value = self.HIGH if value else self.LOW
+        with self.lock:
+            self.pins[pin] = value
+            listeners = list(self.listeners.get(pin, ()))
+        for module in listeners:
+            module.pins_changed()
+
+    def input(self, pin):
+        return self.pins.get(pin, self.LOW)
+
+    def cleanup(self, pin=None):
+        pass
+
+    def listen(self, pin, module):
+        with self.lock:
+            self.listeners.setdefault(pin, []).append(module)
+
+
+def install(gpio):
+    # make "import RPi.GPIO as GPIO" return gpio, before sx126x is imported
+    package = types.ModuleType("RPi")
+    package.GPIO = gpio
+    sys.modules["RPi"] = package
+    sys.modules["RPi.GPIO"] = gpio
+    return gpio
+
+
+class Module:
+    # One HAT, the host side of its UART is the PTY at self.port.
+
+    NORMAL = 0
+    WOR = 1
+    SETTING = 2
+    SLEEP = 3
+
+    def __init__(self, medium, m0=22, m1=27, band=433, regs=None, position=None):
+        self.medium = medium
+        # (x, y) in metres for the path loss, None uses the rssi of the medium
+        self.position = position
+        self.gpio = medium.gpio
+        self.m0 = m0
+        self.m1 = m1
+        self.base = 410 if band < 850 else 850
+        self.regs = list(regs or DEFAULT_REGS)
+        self.mode = self.NORMAL
+
+        self.master, slave = os.openpty()
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        self.slave = slave
+        self.rx = bytearray()
+        self.last_rx = 0
+        # the time the module is busy sending until
+        self.busy_until = 0
+        self.last_rssi = 0
+        self.sent = 0
+        self.received = 0
+        self.garbled = 0
+
+        self.gpio.listen(m0, self)
+        self.gpio.listen(m1, self)
+        self.pins_changed()
+
+    # registers
+
+    @property
+    def addr(self):
+        return (self.regs[0] << 8) + self.regs[1]
+
+    @property
+    def net_id(self):
+        return self.regs[2]
+
+    @property
+    def baud(self):
+        return radio.BAUD[self.regs[3] >> 5]
+
+    @property
+    def air_speed(self):
+        return radio.AIR_SPEED[self.regs[3] & 0x07]
+
+    @property
+    def packet_size(self):
+        return radio.BUFFER_SIZE[self.regs[4] >> 6]
+
+    @property
+    def power(self):
+        return radio.POWER[self.regs[4] & 0x03]
+
+    @property
+    def channel(self):
+        return self.regs[5]
+
+    @property
+    def freq(self):
+        return self.base + self.channel
+
+    @property
+    def wor_transmitter(self):
+        return bool(self.regs[6] & 0x08)
+
+    @property
+    def wor_period(self):
+        # seconds
+        return 0.5 * (1 + (self.regs[6] & 0x07))
+
+    @property
+    def rssi_byte(self):
+        return bool(self.regs[6] & 0x80)
+
+    @property
+    def fixed(self):
+        return bool(self.regs[6] & 0x40)
+
+    # host side
+
+    def pins_changed(self):
+        m0 = self.gpio.input(self.m0)
+        m1 = self.gpio.input(self.m1)
+        mode = [[self.NORMAL, self.WOR], [self.SETTING, self.SLEEP]][m1][m0]
+        if mode != self.mode:
+            # a half written command or packet does not survive the mode switch
+            with self.medium.lock:
+                self.mode = mode
+                self.rx.clear()
+
+    def host_baud(self):
+        speed = termios.tcgetattr(self.master)[4]
+        return self.medium.speeds.get(speed)
+
+    def on_readable(self, now):
+        try:
+            data = os.read(self.master, 4096)
+        except OSError:
+            return
+        if self.host_baud() != self.baud:
+            # framing errors at the wrong baud, nothing reaches the module
+            self.garbled += len(data)
+            return
+        if self.mode == self.SLEEP:
+            return
+        self.rx += data
+        self.last_rx = now
+        if self.mode == self.SETTING:
+            self.setting_command(now)
+        elif len(self.rx) >= self.packet_size + (3 if self.fixed else 0):
+            self.close_packet(now)
+
+    def quiet_at(self):
+        # the time the data in rx makes a packet, None if there is none
+        if not self.rx or self.mode == self.SETTING:
+            return None
+        return self.last_rx + max(uart_time(3, self.baud), 0.002)
+
+    def setting_command(self, now):
+        while len(self.rx) >= 3:
+            head, start, length = self.rx[0], self.rx[1], self.rx[2]
+            if head in (0xC0, 0xC2):
+                if len(self.rx) < 3 + length:
+                    return
+                values = self.rx[3:3 + length]
+                del self.rx[:3 + length]
+                if start + length > len(self.regs):
+                    self.reply(now, bytes([0xFF, 0xFF, 0xFF]))
+                    continue
+                # the answer goes out at the old baud, the new one applies afterwards
+                reply = bytes([0xC1, start, length]) + bytes(values)
+                self.reply(now, reply)
+                self.regs[start:start + length] = list(values)
+            elif head == 0xC1:
+                del self.rx[:3]
+                if start + length > len(self.regs):
+                    self.reply(now, bytes([0xFF, 0xFF, 0xFF]))
+                    continue
+                self.reply(now, bytes([0xC1, start, length]) + bytes(self.regs[start:start + length]))
+            else:
+                del self.rx[:1]
+
+    def close_packet(self, now):
+        data = bytes(self.rx)
+        self.rx.clear()
+        if data[:4] == NOISE_READ and len(data) == 6:
+            if self.regs[4] & 0x20:
+                start, length = data[4], data[5]
+                noise = self.medium.channel_noise(self, now)
+                values = [noise & 0xff, self.last_rssi & 0xff][start:start + length]
+                self.reply(now, bytes([0xC1, start, length] + values))
+            return
+        wake = None
+        if self.mode == self.WOR:
+            if not self.wor_transmitter:
+                # a WOR receiver does not send
+                return
+            wake = self.wor_period
+        if self.fixed:
+            if len(data) < 4:
+                return
+            dest, channel, payload = (data[0] << 8) + data[1], data[2], data[3:]
+        else:
+            dest, channel, payload = self.addr, self.channel, data
+        size = self.packet_size
+        # the bytes are in the module once the UART has carried them
+        start = max(now + uart_time(len(data), self.baud), self.busy_until)
+        for i in range(0, len(payload), size):
+            chunk = payload[i:i + size]
+            duration = airtime(len(chunk), self.air_speed) + (wake or 0)
+            self.medium.transmit(self, dest, channel, chunk, start, duration, wake)
+            self.sent += 1
+            start += duration
+        self.busy_until = start
+
+    def reply(self, now, data):
+        self.output(now, data)
+
+    def output(self, now, data):
+        # pass data to the host after the UART time at the module's baud
+        self.medium.schedule(now + uart_time(len(data), self.baud), self.write, bytes(data))
+
+    def write(self, data):
+        try:
+            os.write(self.master, data)
+        except OSError:
+            pass
+
+    # air side
+
+    def hears(self, sender, dest, channel):
+        if self.mode in (self.SETTING, self.SLEEP) or sender is self:
+            return False
+        if channel != self.channel or sender.base != self.base:
+            return False
+        if sender.air_speed != self.air_speed or sender.net_id != self.net_id:
+            return False
+        return dest in (self.addr, 0xFFFF) or self.addr == 0xFFFF
+
+    def receive(self, now, sender, payload, rssi):
+        self.received += 1
+        self.last_rssi = rssi
+        data = payload
+        if self.rssi_byte:
+            data = data + bytes([rssi & 0xff])
+        self.output(now, data)
+
+    def close(self):
+        os.close(self.slave)
+        os.close(self.master)
+
+
+class Medium:
+    # The air between the modules and the clock of the emulator. One thread
+    # reads the PTYs of all the modules and runs the timed events.
+
+    def __init__(self, rssi=-60, path_loss=40.0, exponent=2.7, capture=6.0, noise_floor=-110):
+        self.gpio = GPIO()
+        self.modules = []
+        # rssi of links without a path loss
+        self.default_rssi = rssi
+        # log-distance model: path_loss dB at 1 m, exponent * 10 dB per decade
+        self.path_loss = path_loss
+        self.exponent = exponent
+        self.capture = capture
+        self.noise_floor = noise_floor
+        self.links = {}
+        # packets on the air: [sender, channel, band, start, end, tx power, WOR cycle of the preamble]
+        self.airborne = []
+        self.stats = collections.Counter()
+        self.lock = threading.RLock()
+        self.events = []
+        self.seq = 0
+        self.selector = selectors.DefaultSelector()
+        self.wakeup_r, self.wakeup_w = os.pipe()
+        self.selector.register(self.wakeup_r, selectors.EVENT_READ, None)
+        self.speeds = {getattr(termios, "B%d" % b): b for b in radio.BAUD if hasattr(termios, "B%d" % b)}
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def module(self, m0=22, m1=27, band=433, regs=None, position=None):
+        with self.lock:
+            module = Module(self, m0, m1, band, regs, position)
+            self.modules.append(module)
+            self.selector.register(module.master, selectors.EVENT_READ, module)
+        self.wake()
+        return module
+
+    def schedule(self, when, function, *args):
+        with self.lock:
+            heapq.heappush(self.events, (when, self.seq, function, args))
+            self.seq += 1
+        self.wake()
+
+    def wake(self):
+        if threading.current_thread() is not self.thread:
+            os.write(self.wakeup_w, b'x')
+
+    def link(self, a, b, loss, both=True):
+        # fix the path loss in dB from module a to module b
+        self.links[(a, b)] = loss
+        if both:
+            self.links[(b, a)] = loss
+
+    def loss(self, sender, receiver):
+        # path loss in dB, None when neither a link nor the positions are known
+        loss = self.links.get((sender, receiver))
+        if loss is not None:
+            return loss
+        if sender.position is None or receiver.position is None:
+            return None
+        distance = math.dist(sender.position, receiver.position)
+        return self.path_loss + 10 * self.exponent * math.log10(max(distance, 1.0))
+
+    def rssi(self, sender, receiver, power=None):
+        # packet rssi in dBm at receiver
+        loss = self.loss(sender, receiver)
+        if loss is None:
+            return self.default_rssi
+        return (sender.power if power is None else power) - loss
+
+    def channel_noise(self, module, now):
+        # what the noise read of module shows: the strongest packet on its channel or the floor
+        levels = [self.rssi(p[0], module, p[5]) for p in self.airborne
+                  if p[0] is not module and p[1] == module.channel and p[2] == module.base and p[3] <= now < p[4]]
+        return round(max(levels + [self.noise_floor]))
+
+    def transmit(self, sender, dest, channel, payload, start, duration, wake=None):
+        # sender puts payload on the air from start for duration seconds,
+        # wake is the WOR cycle its preamble covers
+        packet = [sender, channel, sender.base, start, start + duration, sender.power, wake]
+        self.airborne.append(packet)
+        self.stats['sent'] += 1
+        self.schedule(start + duration, self.deliver, packet, dest, payload)
+
+    def deliver(self, packet, dest, payload):
+        sender, channel, band, start, end, power, wake = packet
+        now = time.time()
+        overlapping = [p for p in self.airborne
+                       if p is not packet and p[1] == channel and p[2] == band and p[3] < end and start < p[4]]
+        for module in self.modules:
+            if not module.hears(sender, dest, channel):
+                continue
+            if module.mode == Module.WOR and (module.wor_transmitter or wake is None or wake < module.wor_period):
+                # asleep between two listens of its WOR cycle
+                self.stats['asleep'] += 1
+                continue
+            rssi = self.rssi(sender, module, power)
+            if rssi < radio.sensitivity(module.air_speed):
+                self.stats['weak'] += 1
+                continue
+            if any(p[0] is module for p in overlapping):
+                self.stats['half_duplex'] += 1
+                continue
+            interference = [self.rssi(p[0], module, p[5]) for p in overlapping if p[0] is not module]
+            if interference and rssi < max(interference) + self.capture:
+                self.stats['collision'] += 1
+                continue
+            if interference:
+                self.stats['captured'] += 1
+            self.stats['delivered'] += 1
+            module.receive(now, sender, payload, round(rssi))
+        # a packet may still overlap the ones sent up to one longest packet later
+        self.airborne = [p for p in self.airborne if p[4] > now - 10]
+
+    def run(self):
+        while self.running:
+            with self.lock:
+                due = [self.events[0][0]] if self.events else []
+                due += [t for t in (m.quiet_at() for m in self.modules) if t is not None]
+            timeout = max(min(due) - time.time(), 0) if due else 0.5
+            for key, _ in self.selector.select(timeout):
+                if key.data is None:
+                    os.read(self.wakeup_r, 4096)
+                    continue
+                with self.lock:
+                    key.data.on_readable(time.time())
+
+            now = time.time()
+            with self.lock:
+                for module in self.modules:
+                    quiet = module.quiet_at()
+                    if quiet is not None and quiet <= now:
+                        module.close_packet(now)
+                ready = []
+                while self.events and self.events[0][0] <= now:
+                    ready.append(heapq.heappop(self.events))
+            for _, _, function, args in ready:
+                with self.lock:
+                    function(*args)
+
+    def close(self):
+        self.running = False
+        self.wake()
+        self.thread.join()
+        for module in self.modules:
+            module.close()
+
+
+if __name__ == '__main__':
+    # python emulator.py N    two or N modules, prints their serial devices
+    medium = Medium()
+    for i in range(int(sys.argv[1]) if len(sys.argv) > 1 else 2):
+        module = medium.module(m0=22 + 2 * i, m1=27 + 2 * i)
+        print(f"module {i}: {module.port} M0={module.m0} M1={module.m1}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        medium.close()
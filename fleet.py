@@ -0,0 +1,328 @@
+# This file simulates a fleet of motor units and telemetry nodes around one
+# gateway at address 0 on the emulated radio (emulator.py)
+#
+#    python fleet.py --motors 50 --telemetry 10 --radius 2000 --rounds 3
+#
+#    Every motor runs motor.Motor (the logic of motor.py) on its own emulated
+#    HAT at a random place within radius metres, telemetry nodes send their
+#    reading every period seconds as node_100_main.py does. The gateway sends
+#    ON, STATUS and OFF to every motor in turn like home.py, through arq.Link,
+#    and times each command until the status reply of the motor arrives.
+#
+#    With --adr the gateway moves every motor to its best air speed (adr.py),
+#    telemetry nodes stay at --air-speed. With --tpc the gateway sends to each
+#    motor at the lowest power which keeps its link (tpc.py), after the air
+#    speed with --adr. With --lbt every node senses the
+#    channel before it sends (sx126x.set_lbt). --channels spreads the nodes
+#    over that many frequencies 2 MHz apart by their load (channels.py), the
+#    gateway sends to the motors channel by channel and listens on the first
+#    one in between, it hears the telemetry of the other channels only while
+#    it is there. --radios gives the gateway that many modules (gateway.py),
+#    one on each channel, which get the commands of a round out side by side.
+#
+#    The report gives the packets delivered and lost on the air (by reason),
+#    the commands acknowledged and answered and the latency distribution,
+#    --json prints it as JSON.
+
+import io
+import json
+import math
+import time
+import random
+import collections
+import argparse
+import threading
+import contextlib
+
+import emulator
+
+COMMANDS = ["ON", "STATUS", "OFF"]
+
+
+def make_node(medium, i, addr, position, freq, air_speed, rssi=False, baud=9600):
+    # the modules differ in their M0/M1 pins
+    import sx126x
+    module = medium.module(m0=1000 + 2 * i, m1=1001 + 2 * i, band=freq, position=position)
+    node = sx126x.sx126x(module.port, freq, addr, 22, rssi, fixed=True, m0=1000 + 2 * i, m1=1001 + 2 * i)
+    if air_speed != 2400:
+        node.set(freq, addr, 22, rssi, air_speed=air_speed)
+    if baud != 9600:
+        node.set_baud(baud)
+    return node
+
+
+def place(radius, rng):
+    # uniform over the disc around the gateway
+    r = radius * math.sqrt(rng.random())
+    a = rng.random() * 2 * math.pi
+    return (r * math.cos(a), r * math.sin(a))
+
+
+def percentiles(values, qs=(50, 90, 99)):
+    if not values:
+        return {f"p{q}": None for q in qs}
+    values = sorted(values)
+    return {f"p{q}": values[min(int(len(values) * q / 100), len(values) - 1)] for q in qs}
+
+
+def simulate(medium, motors=10, telemetry=0, radius=1000, rounds=3, freq=433, air_speed=2400,
+             period=10, reply_timeout=10, seed=1, adaptive=False, lbt=False, channel_count=1, radios=0,
+             power_control=False):
+    # medium must be installed as RPi.GPIO (emulator.install) before
+    import sx126x
+    import arq
+    import adr
+    import tpc
+    import codec
+    import motor
+    import channels
+    import gateway as multi
+
+    rng = random.Random(seed)
+    # one radio per channel, the motors answer address 0 whichever radio asked
+    channel_count = max(channel_count, radios)
+    plan = channels.Plan(channels.groups([freq + 2 * i for i in range(channel_count)]), path=None)
+    # a reading (about 21 bytes) every period, a motor about one command with
+    # its reply and the acks (about 8 bytes each)
+    for i in range(motors, motors + telemetry):
+        plan.assign(i + 1, load=sx126x.packet_time(21, air_speed) / period)
+    for i in range(motors):
+        plan.assign(i + 1, load=4 * sx126x.packet_time(8, air_speed) / period)
+    home_group = plan.groups[0]
+    gateways = [make_node(medium, i, 0, (0.0, 0.0), plan.groups[i].freq, air_speed, rssi=True)
+                for i in range(max(radios, 1))]
+    gateway = gateways[0]
+    hub = None
+    control = None
+    if radios:
+        hub = multi.Gateway([multi.Radio(node, linger=2.0) for node in gateways], plan)
+        gateway_links = [radio.link for radio in hub.radios]
+    else:
+        gateway.start_reader()
+        gateway_links = [arq.Link(gateway)]
+        home = gateway_links[0]
+        if power_control:
+            home = control = tpc.Tpc(gateway, home)
+        if adaptive:
+            home = adr.Adr(gateway, home)
+
+    positions = [place(radius, rng) for _ in range(motors + telemetry)]
+    nodes = [make_node(medium, i + len(gateways), i + 1, positions[i], plan.group(i + 1).freq, air_speed)
+             for i in range(motors + telemetry)]
+
+    running = True
+    units = []
+    for i, node in enumerate(nodes[:motors]):
+        node.start_reader()
+        base = 5000 + 3 * i
+        link = arq.Link(node)
+        if adaptive:
+            link = adr.Adr(node, link, controller=False)
+        units.append(motor.Motor(node, link, 0, relay_on=base, relay_off=base + 1, sensor=base + 2))
+
+    def serve(unit):
+        while running:
+            unit.poll(timeout=0.05)
+
+    telemetry_sent = [0]
+
+    def report(node):
+        # the send_cpu_continue pattern of node_100_main.py
+        time.sleep(rng.random() * period)
+        while running:
+            try:
+                node.send("CPU Temperature:" + str(round(40 + rng.random() * 20, 1)) + " C", dest=0)
+                telemetry_sent[0] += 1
+            except sx126x.DutyCycleExceeded:
+                pass
+            time.sleep(period)
+
+    for node in nodes[motors:]:
+        node.set_duty_cycle(0.01 if freq > 850 else 0.1)
+    if lbt:
+        for node in gateways + nodes:
+            node.set_lbt()
+    if hub is not None:
+        hub.start()
+
+    def is_status(packet):
+        try:
+            return "status" in codec.decode(packet.data)
+        except codec.CodecError:
+            return False
+
+    threads = [threading.Thread(target=serve, args=(u,), daemon=True) for u in units]
+    threads += [threading.Thread(target=report, args=(n,), daemon=True) for n in nodes[motors:]]
+    for t in threads:
+        t.start()
+
+    latencies = []
+    results = {"commands": 0, "acknowledged": 0, "answered": 0}
+    per_motor = []
+    telemetry_received = 0
+    switches = 0
+    started = time.time()
+    for r in range(rounds if hub is not None else 0):
+        # the commands of a round all at once, the radios send them side by side
+        command = COMMANDS[r % len(COMMANDS)]
+        t0 = time.time()
+        sent = {unit.node.addr: hub.send(unit.node.addr, codec.encode_command(command)) for unit in units}
+        results["commands"] += len(sent)
+        answered = {}
+        settled = None
+        while len(answered) < len(sent):
+            if settled is None and all(future.done() for future in sent.values()):
+                settled = time.time()
+            if settled is not None and time.time() > settled + reply_timeout:
+                break
+            item = hub.receive(timeout=0.1)
+            if item is None:
+                continue
+            packet = item[1]
+            if packet.addr not in sent:
+                telemetry_received += packet.data.startswith(b"CPU Temperature")
+            elif packet.addr not in answered and is_status(packet):
+                answered[packet.addr] = time.time() - t0
+        results["acknowledged"] += sum(future.result() for future in sent.values())
+        results["answered"] += len(answered)
+        latencies += answered.values()
+        for i, unit in enumerate(units):
+            addr = unit.node.addr
+            per_motor.append({"addr": addr, "distance": round(math.dist(positions[i], (0, 0))),
+                              "freq": plan.group(addr).freq, "command": command, "latency": answered.get(addr)})
+    for r in range(rounds if hub is None else 0):
+        command = COMMANDS[r % len(COMMANDS)]
+        # channel by channel, the gateway retunes once per channel and round
+        order = sorted(range(len(units)), key=lambda i: plan.groups.index(plan.group(units[i].node.addr)))
+        for i in order:
+            unit = units[i]
+            addr = unit.node.addr
+            switches += channels.tune(gateway, plan.group(addr))
+            results["commands"] += 1
+            t0 = time.time()
+            answered = None
+            if home.send(addr, codec.encode_command(command)):
+                results["acknowledged"] += 1
+                deadline = t0 + reply_timeout
+                while time.time() < deadline:
+                    packet = home.receive(timeout=max(deadline - time.time(), 0))
+                    if packet is None:
+                        break
+                    if packet.addr != addr:
+                        telemetry_received += packet.data.startswith(b"CPU Temperature")
+                        continue
+                    if is_status(packet):
+                        answered = time.time() - t0
+                        break
+            if answered is not None:
+                results["answered"] += 1
+                latencies.append(answered)
+            per_motor.append({"addr": addr, "distance": round(math.dist(positions[i], (0, 0))),
+                              "freq": plan.group(addr).freq, "command": command, "latency": answered})
+        switches += channels.tune(gateway, home_group)
+    # what is still queued at the gateway
+    while True:
+        packet = home.receive(timeout=0) if hub is None else hub.receive(0)
+        if packet is None:
+            break
+        if hub is not None:
+            packet = packet[1]
+        telemetry_received += packet.data.startswith(b"CPU Temperature")
+    elapsed = time.time() - started
+    running = False
+    if hub is not None:
+        switches = sum(radio.retunes for radio in hub.radios)
+        hub.stop()
+
+    return {
+        "motors": motors,
+        "telemetry_nodes": telemetry,
+        "radius": radius,
+        "air_speed": air_speed,
+        "freq": freq,
+        "channels": {group.freq: len(plan.members(group)) for group in plan.groups},
+        "radios": len(gateways),
+        "switches": switches,
+        "elapsed": round(elapsed, 2),
+        "air": dict(medium.stats),
+        "commands": results["commands"],
+        "acknowledged": results["acknowledged"],
+        "answered": results["answered"],
+        "success_rate": results["answered"] / max(results["commands"], 1),
+        "commands_per_minute": results["answered"] * 60 / elapsed if elapsed else 0,
+        "latency": dict(percentiles(latencies),
+                        mean=sum(latencies) / len(latencies) if latencies else None,
+                        max=max(latencies) if latencies else None),
+        "retransmissions": sum(link.retransmissions for link in gateway_links),
+        "air_speeds": sorted(unit.node.air_speed for unit in units),
+        "powers": sorted(control.powers.get(unit.node.addr, tpc.LEVELS[-1]) for unit in units) if control else None,
+        "lbt": dict(sum((collections.Counter(c) for n in gateways + nodes for c in n.channel_stats().values()),
+                        collections.Counter())),
+        "telemetry_sent": telemetry_sent[0],
+        "telemetry_received": telemetry_received,
+        "per_motor": per_motor
+    }
+
+
+def print_report(result):
+    print(f"{result['motors']} motors, {result['telemetry_nodes']} telemetry nodes within "
+          f"{result['radius']} m, {result['air_speed']} bps, {result['elapsed']} s")
+    air = result["air"]
+    print(f"air: {air.get('sent', 0)} sent, {air.get('delivered', 0)} delivered, "
+          f"{air.get('weak', 0)} too weak, {air.get('collision', 0)} collided, "
+          f"{air.get('half_duplex', 0)} lost to half duplex, {air.get('captured', 0)} captured")
+    print(f"commands: {result['commands']} sent, {result['acknowledged']} acknowledged, "
+          f"{result['answered']} answered ({result['success_rate']:.0%}), "
+          f"{result['commands_per_minute']:.1f} per minute, {result['retransmissions']} retransmissions")
+    latency = result["latency"]
+    if latency["mean"] is not None:
+        print(f"latency: mean {latency['mean']:.2f} s  p50 {latency['p50']:.2f}  "
+              f"p90 {latency['p90']:.2f}  p99 {latency['p99']:.2f}  max {latency['max']:.2f} s")
+    print(f"telemetry: {result['telemetry_sent']} sent, {result['telemetry_received']} received")
+    if len(result["channels"]) > 1:
+        print("channels: " + ", ".join(f"{n} nodes at {freq} MHz" for freq, n in result["channels"].items()) +
+              f", {result['switches']} retunes of the gateway ({result['radios']} radios)")
+    if result["lbt"]:
+        lbt = result["lbt"]
+        print(f"listen before talk: {lbt.get('idle', 0)} idle, {lbt.get('busy', 0)} busy, "
+              f"{lbt.get('forced', 0)} sent on a busy channel")
+    speeds = collections.Counter(result["air_speeds"])
+    print("motor air speeds: " + ", ".join(f"{n} at {speed}" for speed, n in sorted(speeds.items())))
+    if result["powers"] is not None:
+        powers = collections.Counter(result["powers"])
+        print("gateway power: " + ", ".join(f"{n} motors at {power} dBm" for power, n in sorted(powers.items())))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="simulate motor units around one gateway")
+    parser.add_argument("--motors", type=int, default=10)
+    parser.add_argument("--telemetry", type=int, default=0)
+    parser.add_argument("--radius", type=float, default=1000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--freq", type=int, default=433)
+    parser.add_argument("--air-speed", type=int, default=2400)
+    parser.add_argument("--period", type=float, default=10)
+    parser.add_argument("--path-loss", type=float, default=40.0, help="dB at 1 m")
+    parser.add_argument("--exponent", type=float, default=2.7)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--adr", action="store_true", help="adaptive air speed of the motors")
+    parser.add_argument("--tpc", action="store_true", help="transmit power control of the gateway")
+    parser.add_argument("--lbt", action="store_true", help="listen before talk on every node")
+    parser.add_argument("--channels", type=int, default=1, help="frequencies to spread the nodes over")
+    parser.add_argument("--radios", type=int, default=0,
+                        help="modules of the gateway (gateway.py), one per channel")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    medium = emulator.Medium(path_loss=args.path_loss, exponent=args.exponent)
+    emulator.install(medium.gpio)
+    # the nodes print every packet, only the report is of interest here
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = simulate(medium, args.motors, args.telemetry, args.radius, args.rounds, args.freq,
+                          args.air_speed, args.period, seed=args.seed, adaptive=args.adr, lbt=args.lbt,
+                          power_control=args.tpc,
+                          channel_count=args.channels, radios=args.radios)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
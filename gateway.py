@@ -0,0 +1,186 @@
+# This file is the gateway with several radios, HATs on their own M0/M1 pins
+# or USB modules, each one a sx126x node of its own
+#
+#    nodes = [sx126x.sx126x("/dev/ttyS0", 433, 0, 22, False, fixed=True),
+#             sx126x.sx126x("/dev/ttyUSB0", 435, 0, 22, False, fixed=True, m0=5, m1=6)]
+#    hub = gateway.Gateway([gateway.Radio(node, linger=2.0) for node in nodes], plan)
+#    hub.start()
+#    done = hub.send(30, b"...")          # a concurrent.futures.Future
+#    radio, packet = hub.receive(1.0)
+#
+#    Every radio has a thread which does all the I/O of its module: it sends
+#    the messages queued for it through its own arq.Link, retunes the module
+#    to the group (frequency and net id, see channels.py) of each message and
+#    passes whatever it receives on to receive() of the gateway. A radio does
+#    not hear while it sends: after the messages to a node it listens for up
+#    to linger seconds until the node answers, before it goes on with the
+#    next one. A radio with nothing to send goes back to its home group and
+#    listens there.
+#
+#    send() takes the group of the destination from the plan and queues the
+#    message on the radio which gets it on the air first: one of the radios
+#    in that group with the least backlog, the time on air of what is queued
+#    on it, or else the radio which is done first when a retune is added.
+#    Radios in different groups send at the same time, the messages a
+#    gateway gets through grow with the number of radios as long as the
+#    nodes are spread over as many groups (channels.Plan).
+#
+#    Two radios in one group need addresses of their own, the nodes answer
+#    the address they were sent from.
+
+import time
+import queue
+import threading
+import concurrent.futures
+
+import sx126x
+import arq
+import channels
+
+# the seconds send() takes beyond the time on air, and a retune
+SEND_TIME = 0.2
+RETUNE_TIME = 0.5
+
+
+def group_of(node):
+    return channels.Group(node.params["freq"], node.params["net_id"])
+
+
+class Radio:
+
+    def __init__(self, node, home=None, link=None, linger=0.0):
+        self.node = node
+        self.link = link if link is not None else arq.Link(node)
+        self.home = channels.Group(*home) if home is not None else group_of(node)
+        self.linger = linger
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        # the time on air of the queued messages, and the group the last of them goes to
+        self.backlog = 0.0
+        self.group = group_of(node)
+        self.inbox = None
+        self.running = False
+        self.thread = None
+        self.sent = 0
+        self.retunes = 0
+
+    def cost(self, messages):
+        return sum(sx126x.packet_time(arq.HEADER + len(m), self.node.air_speed) + SEND_TIME for m in messages) + \
+            self.linger
+
+    def start(self, inbox):
+        self.inbox = inbox
+        self.running = True
+        self.node.start_reader()
+        self.thread = threading.Thread(target=self.run, daemon=True, name=f"radio {self.node.serial_n}")
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.node.stop_reader()
+
+    def put(self, group, dest, messages, future):
+        with self.lock:
+            self.backlog += self.cost(messages)
+            self.group = group
+            self.jobs.put((group, dest, messages, future))
+
+    def run(self):
+        while self.running:
+            try:
+                group, dest, messages, future = self.jobs.get(timeout=0.05)
+            except queue.Empty:
+                with self.lock:
+                    idle = self.jobs.empty() and self.group != self.home
+                    if idle:
+                        self.group = self.home
+                if idle:
+                    self.retunes += channels.tune(self.node, self.home)
+                self.pump()
+                continue
+            try:
+                self.retunes += channels.tune(self.node, group)
+                failed = self.link.send_many(dest, messages)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                self.sent += len(messages) - len(failed)
+                future.set_result(failed)
+                if len(failed) < len(messages):
+                    self.pump(dest, self.linger)
+            finally:
+                with self.lock:
+                    self.backlog = max(self.backlog - self.cost(messages), 0.0)
+            self.pump()
+
+    def pump(self, dest=None, timeout=0):
+        # what the link received to the gateway, for up to timeout seconds until dest answers
+        deadline = time.time() + timeout
+        while True:
+            packet = self.link.receive(timeout=min(max(deadline - time.time(), 0), 0.05))
+            if packet is not None:
+                self.inbox.put((self, packet))
+                if packet.addr == dest:
+                    dest = None
+                    deadline = 0
+            elif time.time() >= deadline:
+                return
+
+
+class Gateway:
+
+    def __init__(self, radios, plan=None):
+        if not radios:
+            raise ValueError("a gateway needs at least one radio")
+        self.radios = list(radios)
+        self.plan = plan
+        self.inbox = queue.Queue()
+
+    def start(self):
+        for radio in self.radios:
+            radio.start(self.inbox)
+
+    def stop(self):
+        for radio in self.radios:
+            radio.stop()
+
+    def group(self, dest):
+        group = self.plan.group(dest) if self.plan is not None else None
+        return group if group is not None else self.radios[0].home
+
+    def radio(self, group, cost):
+        # the radio which gets cost seconds of messages for group on the air first
+        def done(radio):
+            return radio.backlog + cost + (0 if radio.group == group else RETUNE_TIME)
+        return min(self.radios, key=done)
+
+    def send_many(self, dest, messages, group=None):
+        # a Future of the indexes of the messages never acknowledged, see arq.Link.send_many()
+        messages = [m.encode() if isinstance(m, str) else bytes(m) for m in messages]
+        group = channels.Group(*group) if group is not None else self.group(dest)
+        future = concurrent.futures.Future()
+        self.radio(group, self.radios[0].cost(messages)).put(group, dest, messages, future)
+        return future
+
+    def send(self, dest, data, group=None):
+        # a Future of True once dest acknowledged data
+        done = concurrent.futures.Future()
+        self.send_many(dest, [data], group).add_done_callback(
+            lambda future: done.set_exception(future.exception()) if future.exception() is not None
+            else done.set_result(not future.result()))
+        return done
+
+    def receive(self, timeout=0):
+        # the next (radio, packet) any radio received, None after timeout seconds
+        try:
+            return self.inbox.get(timeout=timeout) if timeout else self.inbox.get_nowait()
+        except queue.Empty:
+            return None
+
+    def stats(self):
+        return [{"port": radio.node.serial_n, "group": tuple(radio.group), "sent": radio.sent,
+                 "retunes": radio.retunes, "retransmissions": radio.link.retransmissions}
+                for radio in self.radios]
@@ -1,10 +1,11 @@
 import sys
 import sx126x
+import codec
+import arq
 import time
 import select
 import termios
 import tty
-import json
 from threading import Timer
 
 old_settings = termios.tcgetattr(sys.stdin)
@@ -15,21 +16,18 @@ time.sleep(1)
 # current_address = int(input())
 current_address = 0
 
-node = sx126x.sx126x(serial_num="/dev/ttyS0", freq=433, addr=current_address, power=22, rssi=False)
+node = sx126x.sx126x(serial_num="/dev/ttyS0", freq=433, addr=current_address, power=22, rssi=False, fixed=True)
+node.start_reader()
+# a motor which listens in the WOR mode (WOR_PERIOD in motor.py) only hears the WOR preamble:
+# node.wor_peers.add(30)
+link = arq.Link(node)
 
 def send_command(command, target_address):
     """Sends a command."""
-    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-    message = {"command": command, "time": timestamp}
-    json_message = json.dumps(message)
-
-    original_address = node.addr
-    node.addr_temp = node.addr
-    node.set(node.freq, target_address, node.power, node.rssi)
-    node.send(json_message)
-    node.set(node.freq, original_address, node.power, node.rssi)
-    time.sleep(0.2)
-    print(f"Command sent to {target_address}.")
+    if link.send(target_address, codec.encode_command(command)):
+        print(f"Command delivered to {target_address}.")
+    else:
+        print(f"No acknowledgement from {target_address}.")
 
 
 try:
@@ -45,10 +43,14 @@ try:
 
     while True:
         # Check for incoming data first
-        received_data = node.receive()
-        if received_data:
+        packet = link.receive(timeout=0.01)
+        if packet:
             current_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-            print(f"[{current_time}] Received: {received_data}")  # No need for ReceiveDataContinuously
+            try:
+                received_data = codec.decode(packet.data)
+                print(f"[{current_time}] Received from {packet.addr}: {received_data}")  # No need for ReceiveDataContinuously
+            except codec.CodecError as e:
+                print(f"[{current_time}] Received invalid frame ({e}): {packet.data}")
 
         # Then, check for keyboard input without blocking
         if select.select([sys.stdin], [], [], 0) == ([sys.stdin], [], []):
@@ -66,11 +68,10 @@ try:
 
             sys.stdout.flush()
 
-        time.sleep(0.01) # Small delay for responsiveness
-
 except ValueError:
     print("Invalid target address. Please enter a number between 0 and 65535.")
 except Exception as e:
     print(f"An error occurred: {e}")
 finally:
-    termios.tcsetattr(sys.stdin, termios.TCSADRAIN, old_settings)
\ No newline at end of file
+    termios.tcsetattr(sys.stdin, termios.TCSADRAIN, old_settings)
+    node.close()
\ No newline at end of file
@@ -5,6 +5,8 @@ const cors = require('cors');
 const path = require('path');
 
 const SX126X = require('./sx126x');
+const codec = require('./codec');
+const arq = require('./arq');
 
 const app = express();
 const server = http.createServer(app);
@@ -118,15 +120,14 @@ function send_command(command, target_address, ws) {
         console.error("LoRa module not initialized.");
         return;
     }
-    const timestamp = new Date().toISOString().replace(/T/, ' ').replace(/\..+/, '');
-    const message = { command: command, time: timestamp };
-    const json_message = JSON.stringify(message);
+    // the Motor unit decodes [VERSION, MESSAGE_TYPE, DATA..., CRC] (see codec.js)
+    const frame = codec.encodeCommand(command);
 
     const original_address = node.addr;
     node.addr_temp = node.addr;
     node.set(node.freq, target_address, node.power, node.rssi)
         .then(() => {
-            node.send(json_message);
+            node.send(frame);
             return new Promise(resolve => setTimeout(resolve, 200));
         })
         .then(() => {
@@ -155,23 +156,26 @@ function send_command(command, target_address, ws) {
 function waitForResponse(timeout) {
     return new Promise((resolve, reject) => {
         let responseReceived = false;
+        // the acknowledgment of the command and the status come as separate packets
+        const decoder = new arq.FrameDecoder(node.rssi);
 
         const responseHandler = async (data) => {
             if (responseReceived) return;
-            responseReceived = true;
-
-            node.serialPort.off('data', responseHandler);
-            node.serialPort.off('error', errorHandler);
-
-            const receivedString = data.toString('utf8');
-            console.log("Received response 1111111111111111:", receivedString);
+            decoder.feed(data, (packet) => {
+                if (responseReceived || !codec.isFrame(packet.data)) return;
+                let response;
+                try {
+                    response = node.message(packet);
+                } catch (parseError) {
+                    console.log("Invalid response:", parseError.message);
+                    return;
+                }
+                responseReceived = true;
 
-            try {
-                const response = JSON.parse(receivedString);
-                resolve(JSON.stringify(response));
-            } catch (parseError) {
-                resolve(receivedString);
-            }
+                node.serialPort.off('data', responseHandler);
+                node.serialPort.off('error', errorHandler);
+                resolve(response);
+            });
         };
 
         const errorHandler = (err) => {
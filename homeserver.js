@@ -4,6 +4,7 @@ const WebSocket = require('ws');
 const path = require('path');
 
 const SX126X = require('./sx126x'); // Assuming sx126x.js is in the same directory
+const codec = require('./codec');
 
 const app = express();
 const server = http.createServer(app);
@@ -72,15 +73,14 @@ function send_command(command, target_address) {
         console.error("LoRa module not initialized.");
         return;
     }
-    const timestamp = new Date().toISOString().replace(/T/, ' ').replace(/\..+/, '');
-    const message = { command: command, time: timestamp };
-    const json_message = JSON.stringify(message);
+    // the Motor unit decodes [VERSION, MESSAGE_TYPE, DATA..., CRC] (see codec.js)
+    const frame = codec.encodeCommand(command);
 
     const original_address = node.addr;
     node.addr_temp = node.addr;
     node.set(node.freq, target_address, node.power, node.rssi)
         .then(() => {
-            node.send(json_message);
+            node.send(frame);
             return new Promise(resolve => setTimeout(resolve, 200));
         })
         .then(() => {
@@ -0,0 +1,194 @@
+# This file is the packet journal of the receiver, it replaces the line per
+# packet appended to g.txt
+#
+#    journal/packets-20240501-100000.rec   fixed size records, one per packet
+#    journal/packets-20240501-100000.dat   the payloads one after the other
+#
+#    record:  time (double), source (u16), length (u16), packet rssi (i8),
+#             noise rssi (i8), payload offset in the .dat file (u64)
+#             little endian, 22 bytes, rssi and noise are -128 when unknown
+#
+#    write() only appends to a buffer in memory, a background thread writes
+#    the buffers every flush_interval seconds with one fsync for the batch.
+#    A segment is closed after max_bytes of payload or max_age seconds and
+#    compressed to .rec.gz / .dat.gz. read() walks the segments in order and
+#    yields the records one by one without loading a whole file.
+
+import os
+import gzip
+import glob
+import time
+import shutil
+import struct
+import threading
+import collections
+
+RECORD = struct.Struct('<dHHbbQ')
+UNKNOWN = -128
+PREFIX = "packets-"
+
+Record = collections.namedtuple('Record', ['time', 'addr', 'length', 'rssi', 'noise', 'offset', 'data'])
+
+
+def level(value):
+    return UNKNOWN if value is None else max(min(int(value), 127), -127)
+
+
+class Journal:
+
+    def __init__(self, directory="journal", max_bytes=4 << 20, max_age=24 * 3600,
+                 flush_interval=1.0, compress=True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.flush_interval = flush_interval
+        self.compress = compress
+        os.makedirs(directory, exist_ok=True)
+
+        # lock guards the buffers, flush_lock keeps the flushes one at a time
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.records = bytearray()
+        self.payloads = bytearray()
+        self.rec = None
+        self.dat = None
+        self.opened = 0
+        self.offset = 0
+        self.written = 0
+        self.open_segment()
+
+        self.running = True
+        self.wake = threading.Event()
+        self.flusher = threading.Thread(target=self.flush_loop, daemon=True)
+        self.flusher.start()
+
+    def open_segment(self):
+        now = time.time()
+        name = os.path.join(self.directory, PREFIX + time.strftime("%Y%m%d-%H%M%S", time.localtime(now)))
+        # two segments in the same second get a suffix
+        base, n = name, 1
+        while os.path.exists(name + ".rec") or os.path.exists(name + ".rec.gz"):
+            name = f"{base}-{n}"
+            n += 1
+        self.rec = open(name + ".rec", "ab")
+        self.dat = open(name + ".dat", "ab")
+        self.opened = now
+        self.offset = 0
+
+    def write(self, packet):
+        # journal a sx126x.Packet, cheap enough for the receive path
+        data = bytes(packet.data)
+        with self.lock:
+            self.records += RECORD.pack(packet.time, packet.addr, len(data), level(packet.rssi),
+                                        level(getattr(packet, 'noise', None)), self.offset)
+            self.payloads += data
+            self.offset += len(data)
+            self.written += 1
+
+    def flush(self):
+        # write the buffered records with one fsync, rotate the segment when it is due;
+        # only the swap of the buffers holds the lock, write() goes on during the fsync
+        with self.flush_lock:
+            with self.lock:
+                records, self.records = self.records, bytearray()
+                payloads, self.payloads = self.payloads, bytearray()
+                rec, dat = self.rec, self.dat
+                rotate = self.offset >= self.max_bytes or time.time() - self.opened >= self.max_age
+                if rotate and self.offset:
+                    # the new packets go to the next segment, the swapped ones to this one
+                    self.open_segment()
+                elif rotate:
+                    # nothing was received, the age counts from the first packet
+                    self.opened = time.time()
+                    rotate = False
+            if records:
+                # payloads first, a record never points behind the end of its .dat file
+                dat.write(payloads)
+                dat.flush()
+                os.fsync(dat.fileno())
+                rec.write(records)
+                rec.flush()
+                os.fsync(rec.fileno())
+            if rotate:
+                closed = close_segment(rec, dat)
+                if self.compress:
+                    for path in closed:
+                        compress(path)
+
+    def flush_loop(self):
+        while self.running:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+
+    def close(self):
+        self.running = False
+        self.wake.set()
+        self.flusher.join()
+        self.flush()
+        with self.lock:
+            closed = close_segment(self.rec, self.dat)
+        # an empty segment is not worth keeping
+        if os.path.getsize(closed[0]) == 0:
+            for path in closed:
+                os.remove(path)
+        elif self.compress:
+            for path in closed:
+                compress(path)
+
+
+def close_segment(rec, dat):
+    rec.close()
+    dat.close()
+    return rec.name, dat.name
+
+
+def compress(path):
+    with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(path)
+
+
+def open_part(path):
+    if os.path.exists(path):
+        return open(path, "rb")
+    return gzip.open(path + ".gz", "rb")
+
+
+def segments(directory="journal"):
+    # the segment names without extension, oldest first
+    names = set()
+    for path in glob.glob(os.path.join(directory, PREFIX + "*.rec*")):
+        names.add(path[:path.index(".rec")])
+    return sorted(names)
+
+
+def read(directory="journal", since=None, with_data=True):
+    # yields the Records of all the segments in order, the records of the
+    # segment still being written are included as far as they are flushed
+    for name in segments(directory):
+        with open_part(name + ".rec") as rec, open_part(name + ".dat") as dat:
+            while True:
+                raw = rec.read(RECORD.size)
+                if len(raw) < RECORD.size:
+                    break
+                t, addr, length, rssi, noise, offset = RECORD.unpack(raw)
+                if since is not None and t < since:
+                    continue
+                data = None
+                if with_data:
+                    # payloads are in record order, seek only after skipped ones
+                    if dat.tell() != offset:
+                        dat.seek(offset)
+                    data = dat.read(length)
+                yield Record(t, addr, length,
+                             None if rssi == UNKNOWN else rssi,
+                             None if noise == UNKNOWN else noise,
+                             offset, data)
+
+
+if __name__ == '__main__':
+    import sys
+    for record in read(sys.argv[1] if len(sys.argv) > 1 else "journal"):
+        print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.time))} "
+              f"node {record.addr} rssi {record.rssi} noise {record.noise} {record.data}")
@@ -29,7 +29,7 @@ def get_cpu_temp():
         logger.error(f"Failed to read CPU temperature: {e}")
         return None
 
-node = sx126x.sx126x(serial_num="/dev/ttyS0", freq=433, addr=30, power=22, rssi=False)
+node = sx126x.sx126x(serial_num="/dev/ttyS0", freq=433, addr=30, power=22, rssi=False, fixed=True)
 # node = sx126x.sx126x(serial_num="/dev/tty0", freq=433, addr=100, power=22, rssi=True)
 
 def send_deal():
@@ -51,12 +51,8 @@ def send_deal():
     get_t = get_rec.split(",")
     
     try:
-        node.addr_temp = node.addr
-        node.set(node.freq, int(get_t[0]), node.power, node.rssi)
-        node.send(get_t[1])
+        node.send(get_t[1], dest=int(get_t[0]))
         logger.debug(f"Message sent: {get_t[1]} to address {get_t[0]}")
-        time.sleep(0.2)
-        node.set(node.freq, node.addr_temp, node.power, node.rssi)
     except Exception as e:
         logger.error(f"Error sending data: {e}")
 
@@ -71,30 +67,20 @@ def send_cpu_continue(send_to_who, continue_or_not=True):
         global timer_task
         global seconds
         try:
-            node.send_to = send_to_who
-            node.addr_temp = node.addr
-            node.set(node.freq, node.send_to, node.power, node.rssi)
             cpu_temp = get_cpu_temp()
             if cpu_temp is not None:
-                node.send(f"CPU Temperature: {cpu_temp} C")
+                node.send(f"CPU Temperature: {cpu_temp} C", dest=send_to_who)
                 logger.debug(f"Sent CPU Temperature: {cpu_temp} C to {send_to_who}")
-            time.sleep(0.2)
-            node.set(node.freq, node.addr_temp, node.power, node.rssi)
             timer_task = Timer(seconds, send_cpu_continue, (send_to_who,))
             timer_task.start()
         except Exception as e:
             logger.error(f"Error in sending CPU temperature: {e}")
     else:
         try:
-            node.send_to = send_to_who
-            node.addr_temp = node.addr
-            node.set(node.freq, node.send_to, node.power, node.rssi)
             cpu_temp = get_cpu_temp()
             if cpu_temp is not None:
-                node.send(f"CPU Temperature: {cpu_temp} C")
+                node.send(f"CPU Temperature: {cpu_temp} C", dest=send_to_who)
                 logger.debug(f"Sent CPU Temperature: {cpu_temp} C to {send_to_who}")
-            time.sleep(0.2)
-            node.set(node.freq, node.addr_temp, node.power, node.rssi)
             timer_task.cancel()
         except Exception as e:
             logger.error(f"Error stopping CPU temperature sending: {e}")
@@ -1,6 +1,8 @@
 from flask import Flask, request, jsonify, render_template
 import sys
 import sx126x
+import codec
+import arq
 import time
 import json
 import threading
@@ -29,8 +31,9 @@ create_table()
 
 # Initialize your LoRa module
 current_address = 0
-node = sx126x.sx126x(serial_num="/dev/ttyS0", freq=433, addr=current_address, power=22, rssi=True)  # rssi=True for RSSI
+node = sx126x.sx126x(serial_num="/dev/ttyS0", freq=433, addr=current_address, power=22, rssi=True, fixed=True)  # rssi=True for RSSI
 target_address = 30  # Your target address
+link = arq.Link(node)  # commands are acknowledged by the motor unit
 
 # Lock for LoRa operations to prevent conflicts
 
@@ -44,8 +47,10 @@ def safe_receive(node, max_retries=3):
     for _ in range(max_retries):
         with lora_lock:  # Lock only for the actual receive operation
             try:
-                received_data = node.receivetemp()  # Your LoRa receive function
-                if received_data:
+                packet = link.receive()  # Your LoRa receive function
+                if packet:
+                    # binary status frames are stored as JSON for the web page
+                    received_data = json.dumps(dict(codec.decode(packet.data), address=packet.addr, rssi=packet.rssi))
                     print(f"Received in lora: {received_data}")
                     with sqlite3.connect(DATABASE) as conn:
                         cursor = conn.cursor()
@@ -77,18 +82,11 @@ receive_thread.start()
 def send_command(command):
     with lora_lock:  # Acquire lock for LoRa send
         try:
-            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-            message = {"command": command, "time": timestamp, "address": current_address}
-            json_message = json.dumps(message)
-
-            original_address = node.addr
-            node.addr_temp = node.addr
-            node.set(node.freq, target_address, node.power, node.rssi)
-            node.send(json_message)
-            node.set(node.freq, original_address, node.power, node.rssi)
-            time.sleep(0.1)  # Delay after send
-            print(f"Command '{command}' sent to {target_address}.")
-            return {"status": "success", "message": f"Command '{command}' sent."}
+            if not link.send(target_address, codec.encode_command(command)):
+                print(f"Command '{command}' not acknowledged by {target_address}.")
+                return {"status": "error", "message": f"Command '{command}' not acknowledged."}
+            print(f"Command '{command}' delivered to {target_address}.")
+            return {"status": "success", "message": f"Command '{command}' delivered."}
         except Exception as e:
             print(f"Send error: {e}")
             return {"status": "error", "message": f"Error sending command: {e}"}, 500
@@ -136,4 +134,7 @@ def process_received_data(node, received_data):
 
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0')
\ No newline at end of file
+    try:
+        app.run(debug=True, host='0.0.0.0')
+    finally:
+        node.close()
\ No newline at end of file
@@ -0,0 +1,175 @@
+# This file is the multi-hop forwarding between nodes in fixed-point mode
+# (see sx126x.relay())
+#
+#    mesh frame:  [0xA8, SRC (2), DST (2), SEQ (2), TTL, HOPS, message...]
+#
+#    SRC is the node the message comes from and DST the one it goes to
+#    (0xFFFF for all of them). Every node learns a route back to SRC from each
+#    frame it hears: the node it heard the frame from is the next hop, HOPS+1
+#    the distance. A route is replaced by one with fewer hops, a hop weaker
+#    than weak dBm counting as one more, or on equal terms by a stronger
+#    last hop, and it expires after max_age seconds.
+#
+#    A frame for another node goes on to the next hop of its route, or to
+#    everybody (0xFFFF) when there is none, with TTL one less; a frame whose
+#    TTL has run out is dropped. Each node handles a (SRC, SEQ) only once
+#    within dup_time seconds, so floods die out and copies heard over two
+#    paths are dropped. Both are dictionary lookups, the cost per frame does
+#    not grow with the number of nodes behind a relay.
+#
+#    Mesh has the send() and receive_packet() of sx126x, arq.Link and
+#    motor.Motor work through it end to end:
+#
+#        mesh = node.relay()
+#        link = arq.Link(mesh)
+#
+#    A node which only forwards runs mesh.serve(). A relay does not hear
+#    while it forwards, the nodes around it should listen before they talk
+#    (sx126x.set_lbt()), and a beacon() of the gateway spares the first
+#    messages to it the flood.
+
+import time
+import random
+import collections
+
+MESH = 0xA8
+HEADER = 9
+BROADCAST = 0xFFFF
+
+
+class Mesh:
+
+    def __init__(self, node, max_hops=4, weak=-115, max_age=600.0, dup_time=60.0, jitter=0.3,
+                 max_unanswered=2):
+        if not node.fixed:
+            raise ValueError("the mesh needs a node in fixed-point mode")
+        self.node = node
+        self.max_hops = max_hops
+        self.weak = weak
+        self.max_age = max_age
+        self.dup_time = dup_time
+        # floods are sent again after a random delay of up to jitter seconds
+        self.jitter = jitter
+        self.max_unanswered = max_unanswered
+        self.seq = random.randrange(0x10000)
+        # dest -> [next hop, hops, rssi of the next hop, time]
+        self.routes = {}
+        # (src, seq) -> time, oldest first
+        self.seen = collections.OrderedDict()
+        # dest -> frames sent to it since the last one heard from it
+        self.unanswered = collections.Counter()
+        self.stats = collections.Counter()
+
+    @property
+    def addr(self):
+        return self.node.addr
+
+    def cost(self, hops, rssi):
+        return hops + (1 if rssi is not None and rssi < self.weak else 0)
+
+    def learn(self, src, via, hops, rssi, now):
+        if src == self.node.addr:
+            return
+        route = self.routes.get(src)
+        if route is None or route[0] == via or now - route[3] > self.max_age:
+            self.routes[src] = [via, hops, rssi, now]
+            return
+        new, old = self.cost(hops, rssi), self.cost(route[1], route[2])
+        if new < old or (new == old and rssi is not None and (route[2] is None or rssi > route[2])):
+            self.routes[src] = [via, hops, rssi, now]
+
+    def next_hop(self, dest, now):
+        # the neighbour to send a frame for dest to, BROADCAST without a live route
+        route = self.routes.get(dest)
+        if route is None:
+            return BROADCAST
+        if now - route[3] > self.max_age or self.unanswered[dest] > self.max_unanswered:
+            # silence behind the route, look for dest again
+            del self.routes[dest]
+            self.unanswered[dest] = 0
+            return BROADCAST
+        return route[0]
+
+    def duplicate(self, src, seq, now):
+        while self.seen:
+            key, t = next(iter(self.seen.items()))
+            if now - t <= self.dup_time:
+                break
+            self.seen.popitem(last=False)
+        if (src, seq) in self.seen:
+            return True
+        self.seen[(src, seq)] = now
+        return False
+
+    def send(self, data, dest=None, channel=None):
+        # data to dest (None: every node) over as many hops as it takes
+        if isinstance(data, str):
+            data = data.encode()
+        if dest is None:
+            dest = BROADCAST
+        now = time.time()
+        self.seq = (self.seq + 1) & 0xffff
+        self.duplicate(self.node.addr, self.seq, now)
+        if dest != BROADCAST:
+            self.unanswered[dest] += 1
+        frame = bytes([MESH, self.node.addr >> 8, self.node.addr & 0xff, dest >> 8, dest & 0xff,
+                       self.seq >> 8, self.seq & 0xff, self.max_hops, 0]) + data
+        self.node.send(frame, dest=self.next_hop(dest, now) if dest != BROADCAST else BROADCAST,
+                       channel=channel)
+
+    def beacon(self):
+        # an empty flood, every node in reach learns its route to this one
+        self.send(b'')
+
+    def receive_packet(self, timeout=0):
+        # the next message for this node, frames for others are forwarded meanwhile;
+        # the packet comes with the address of its source
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            remaining = None if deadline is None else max(deadline - time.time(), 0)
+            packet = self.node.receive_packet(remaining)
+            if packet is None:
+                return None
+            message = self.handle(packet)
+            if message is not None:
+                return message
+            if deadline is not None and time.time() >= deadline:
+                return None
+
+    def handle(self, packet):
+        # forward packet if it is for another node, returns what is for this one
+        data = packet.data
+        if len(data) < HEADER or data[0] != MESH:
+            # a neighbour outside the mesh
+            return packet
+        now = time.time()
+        src = (data[1] << 8) + data[2]
+        dest = (data[3] << 8) + data[4]
+        seq = (data[5] << 8) + data[6]
+        ttl, hops = data[7], data[8]
+        self.learn(src, packet.addr, hops + 1, packet.rssi, now)
+        self.unanswered[src] = 0
+        if self.duplicate(src, seq, now):
+            self.stats['duplicate'] += 1
+            return None
+
+        mine = dest in (self.node.addr, BROADCAST)
+        if dest != self.node.addr:
+            if ttl <= 1:
+                self.stats['expired'] += 1
+            else:
+                via = self.next_hop(dest, now)
+                if via == BROADCAST:
+                    # everybody hears the flood at once, spread the copies out
+                    time.sleep(random.uniform(0, self.jitter))
+                self.node.send(data[:7] + bytes([ttl - 1, hops + 1]) + data[HEADER:], dest=via)
+                self.stats['forwarded'] += 1
+        if not mine or len(data) == HEADER:
+            return None
+        self.stats['delivered'] += 1
+        return packet._replace(addr=src, data=data[HEADER:])
+
+    def serve(self, running=lambda: True):
+        # forward for the other nodes, messages for this one are dropped
+        while running():
+            self.receive_packet(0.5)
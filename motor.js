@@ -1,14 +1,14 @@
 // receiver.js (Node.js)
 
 const SerialPort = require('serialport');
-const { ReadlineParser } = require('@serialport/parser-readline');
+const codec = require('./codec');
+const arq = require('./arq');
 const { Buffer } = require('node:buffer');
 const { Gpio } = require('onoff'); // Import onoff for GPIO
 
 // --- Configuration ---
 const serialPortPath = "/dev/ttyS0"; //  Serial port
 const currentAddress = 30;       //  Receiver address
-const targetAddress = 2;          //  Sender address (for replies)
 const frequency = 433;           //  Frequency
 const power = 22;                //  Power
 const enableRssi = false;        //  RSSI reporting
@@ -93,7 +93,8 @@ class sx126x {
             parity: 'none',
         });
 
-        this.parser = this.port.pipe(new ReadlineParser({ delimiter: '\r\n' }));
+        // the packets of sx126x.py are [address, 0xFE, length, message], see arq.js
+        this.decoder = new arq.FrameDecoder(rssi);
         this.set(freq, addr, power, rssi);
 
         this.port.on('error', function (err) {
@@ -185,44 +186,16 @@ class sx126x {
         this.M1_gpio.writeSync(0);
         this.M0_gpio.writeSync(0);
         setTimeout(() => {
-            let l_addr = this.addr_temp & 0xff;
-            let h_addr = this.addr_temp >> 8 & 0xff;
-            const buffer = Buffer.from([h_addr, l_addr, ...data]);
-            this.port.write(buffer);
+            this.port.write(arq.frame(this.addr_temp, data));
         }, 100);
     }
 
     receive(callback) {
-        this.parser.on('data', (data) => {
-            console.log("Raw data from serial:", data);
-
-            try {
-                const buffer = Buffer.from(data);
-                if (buffer.length < 3) {
-                    console.log("Incomplete packet");
-                    return;
-                }
-                const node_address = (buffer[0] << 8) + buffer[1];
-                const rssi = 256 - buffer[buffer.length - 1];
-                const message_bytes = buffer.slice(2, -1);
-                const message_str = message_bytes.toString('utf-8');
-                let json_message;
-                const start = message_str.indexOf('{');
-                const end = message_str.lastIndexOf('}') + 1;
-
-                if (start !== -1 && end !== -1) {
-                    json_message = message_str.substring(start, end);
-                    console.log(json_message);
-                    const time = new Date().toISOString();
-                    callback({ time, message: json_message, rssi, node_address }); // Pass to callback
-
-                } else {
-                    console.log("No JSON found in message");
-                    console.log(message_str);
-                }
-            } catch (error) {
-                console.error("Error processing received data:", error);
-            }
+        // callback gets { time, node_address, data, rssi } of every packet
+        this.port.on('data', (chunk) => {
+            this.decoder.feed(chunk, (packet) => {
+                callback({ time: new Date().toISOString(), ...packet });
+            });
         });
     }
 
@@ -234,64 +207,116 @@ class sx126x {
 // --- Main Program Logic ---
 
 const node = new sx126x(serialPortPath, frequency, currentAddress, power, enableRssi);
+// acknowledges the commands home.py sends through arq.py
+const link = new arq.Receiver();
+
+// run time accounting for the status frame, like motor.py
+let motorOnTime = null;
+let totalRunTime = 0;
+let motorOffTimer = null;
 
-function sendReply(message, targetAddress) {
-    const timestamp = new Date().toISOString();
-    const replyMessage = { reply: message, time: timestamp };
-    const jsonMessage = JSON.stringify(replyMessage);
+function runTime() {
+    return totalRunTime + (motorOnTime === null ? 0 : (Date.now() - motorOnTime) / 1000);
+}
 
+function sendFrame(frame, targetAddress) {
     const originalAddress = node.addr;
     node.addr_temp = node.addr;
     node.set(node.freq, targetAddress, node.power, node.rssi);
-    node.send(Buffer.from(jsonMessage, 'utf8'));
+    node.send(frame);
     node.set(node.freq, originalAddress, node.power, node.rssi);
-    console.log(`Reply sent to ${targetAddress}: ${message}`);
 }
 
-// Replace the original receive method to use a callback:
-node.receive((receivedData) => {
-    try {
-        const receivedJson = JSON.parse(receivedData.message);
-        if (receivedJson.command) {
-            const command = receivedJson.command;
-            const currentTime = new Date().toISOString();
-            console.log(`[${currentTime}] Received command: ${command}`);
-
-            if (command === "ON") {
-                if (relayOff && relayOn) { // Check if relayOn and relayOff are defined
-                    relayOff.writeSync(0);  // Ensure only one relay is on
-                    relayOn.writeSync(1);   // Turn ON relay
-                    sendReply("Motor on", targetAddress);
-                } else {
-                    console.error("relayOn or relayOff is not initialized. Check GPIO initialization.");
-                    sendReply("Error: Relay control failed", targetAddress);
-                }
-            } else if (command === "OFF") {
-                if (relayOn && relayOff) { // Check if relayOn and relayOff are defined
-                    relayOn.writeSync(0);   // Turn OFF relay
-                    relayOff.writeSync(1);
-                    setTimeout(() => {
-                        relayOff.writeSync(0);
-                    }, 500);
-                    sendReply("Motor off", targetAddress);
-                } else {
-                    console.error("relayOn or relayOff is not initialized. Check GPIO initialization.");
-                    sendReply("Error: Relay control failed", targetAddress);
-                }
-            } else if (command === "STATUS") {
-                if (relayOn) { // Check if relayOn is defined
-                    const status = relayOn.readSync() === 1 ? "ON" : "OFF";
-                    sendReply(`Motor is ${status}`, targetAddress);
-                } else {
-                    console.error("relayOn is not initialized. Check GPIO initialization.");
-                    sendReply("Error: Could not read motor status", targetAddress);
-                }
-            } else {
-                sendReply("Unknown command", targetAddress);
-            }
+function sendReply(targetAddress, error = codec.NO_ERROR) {
+    // the motor status as a codec status frame
+    let status = codec.MOTOR_ERROR;
+    if (relayOn) {
+        status = relayOn.readSync() === 1 ? codec.MOTOR_ON : codec.MOTOR_OFF;
+    } else {
+        error = codec.POWER_FAILURE;
+    }
+    sendFrame(codec.encodeStatus(status, runTime(), error), targetAddress);
+    console.log(`Reply sent to ${targetAddress}.`);
+}
+
+function motorOn() {
+    if (!relayOn || !relayOff) {
+        console.error("relayOn or relayOff is not initialized. Check GPIO initialization.");
+        return;
+    }
+    relayOff.writeSync(0);  // Ensure only one relay is on
+    relayOn.writeSync(1);   // Turn ON relay
+    if (motorOnTime === null) {
+        motorOnTime = Date.now();
+    }
+}
+
+function motorOff() {
+    clearTimeout(motorOffTimer);
+    motorOffTimer = null;
+    if (!relayOn || !relayOff) {
+        console.error("relayOn or relayOff is not initialized. Check GPIO initialization.");
+        return;
+    }
+    relayOn.writeSync(0);   // Turn OFF relay
+    relayOff.writeSync(1);
+    setTimeout(() => {
+        relayOff.writeSync(0);
+    }, 500);
+    totalRunTime = runTime();
+    motorOnTime = null;
+}
+
+function decodeCommand(message) {
+    // { command, timer } of a codec frame, or of the JSON of senders from before the codec
+    if (codec.isFrame(message)) {
+        return codec.decode(message);
+    }
+    const text = message.toString('utf8');
+    return JSON.parse(text.substring(text.indexOf('{'), text.lastIndexOf('}') + 1));
+}
+
+node.receive((packet) => {
+    const { ack, messages } = link.handle(packet.node_address, packet.data);
+    if (ack) {
+        sendFrame(ack, packet.node_address);
+    }
+    for (const message of messages) {
+        let received;
+        try {
+            received = decodeCommand(message);
+        } catch (error) {
+            console.error("Error processing command:", error.message, message);
+            continue;
+        }
+        const command = received.command;
+        if (!command) {
+            continue;
+        }
+        // the reply goes to the unit which sent the command
+        console.log(`[${packet.time}] Received command: ${command}`);
+
+        if (command === "ON") {
+            motorOn();
+            clearTimeout(motorOffTimer);
+            motorOffTimer = null;
+            sendReply(packet.node_address);
+        } else if (command === "OFF") {
+            motorOff();
+            sendReply(packet.node_address);
+        } else if (command === "SET_TIMER") {
+            motorOn();
+            clearTimeout(motorOffTimer);
+            motorOffTimer = setTimeout(() => {
+                motorOff();
+                sendReply(packet.node_address);
+            }, received.timer * 1000);
+            sendReply(packet.node_address);
+        } else if (command === "STATUS") {
+            sendReply(packet.node_address);
+        } else {
+            sendReply(packet.node_address, codec.UNKNOWN_COMMAND);
         }
-    } catch (error) {
-        console.error("Error processing command:", error);
     }
 });
 
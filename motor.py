@@ -1,116 +1,179 @@
 import sys
 import sx126x
+import codec
+import arq
+import remote_config
 import time
-import json
 import RPi.GPIO as GPIO
-import os 
-
-# GPIO Setup
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(23, GPIO.OUT)  # Relay ON
-GPIO.setup(24, GPIO.OUT)  # Relay OFF
-GPIO.setup(25, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)  # Sensor Input
-
-# Initial States
-GPIO.output(23, GPIO.LOW)
-GPIO.output(24, GPIO.LOW)
-DOUT_PIN = 25
-current_address = 30
-target_address = 0
-prev_state = "OFF"
-on_from_remote = False
-
-# Noise Filtering Variables
-stable_zero_count = 0
-ZERO_THRESHOLD = 100   
-
-# Initialize LoRa
-node = sx126x.sx126x(serial_num="/dev/ttyS0", freq=433, addr=current_address, power=22, rssi=False)
-
-def send_command(command, target_address):
-    """Sends a command."""
-    message = json.dumps({"command": command, "time": time.strftime("%Y-%m-%d %H:%M:%S")})
-    original_address = node.addr
-    node.set(node.freq, target_address, node.power, node.rssi)
-    node.send(message)
-    node.set(node.freq, original_address, node.power, node.rssi)
-    print(f"Command sent to {target_address}.")
-
-def send_reply(message, target_address):
-    """Sends a reply."""
-    reply_message = json.dumps({"reply": message, "time": time.strftime("%Y-%m-%d %H:%M:%S")})
-    original_address = node.addr
-    node.set(node.freq, target_address, node.power, node.rssi)
-    node.send(reply_message)
-    node.set(node.freq, original_address, node.power, node.rssi)
-    print(f"Reply sent to {target_address}.")
-
-try:
-    while True:
-        received_data = node.receive()
-        if received_data:
-            try:
-                received_json = json.loads(received_data)
-                command = received_json.get("command", "")
-
-                if command == "ON":
-                    GPIO.output(24, GPIO.LOW)   # Turn OFF relay 24
-                    GPIO.output(23, GPIO.HIGH)  # Turn ON relay 23
-                    send_reply("Motor on", target_address)
-                    on_from_remote = True
-                    prev_state = "ON"
-                    stable_zero_count = 0  # Reset counter
-
-                elif command == "OFF":
-                    GPIO.output(23, GPIO.LOW)   # Turn OFF relay 23
-                    GPIO.output(24, GPIO.HIGH)  # Turn ON relay 24
-                    time.sleep(0.5)
-                    GPIO.output(24, GPIO.LOW)  # Ensure relay 24 is ON
-                    send_reply("Motor off", target_address)
-                    on_from_remote = False
-                    prev_state = "OFF"
-                    stable_zero_count = 0  # Reset counter
-
-                elif command == "STATUS":
-                    status = "ON" if GPIO.input(23) else "OFF"
-                    send_reply(f"Motor is {status}", target_address)
-
-                else:
-                    send_reply("Unknown command", target_address)
-
-            except json.JSONDecodeError:
-                print(f"Received non-JSON data: {received_data}")
-
-        # **Noise Filtering Logic for Motor Control**
-        current_signal = GPIO.input(DOUT_PIN)
-        print(f"Stable Zero Count: {stable_zero_count}")
-
-
-        # if current_signal:  # If sensor detects current
-        #     print("On Detected, {current_signal}")
-        #     stable_zero_count = 0  # Reset counter
-        #     if prev_state == "OFF":
-        #         GPIO.output(24, GPIO.LOW)   # Turn OFF relay 24
-        #         GPIO.output(23, GPIO.HIGH)  # Turn ON relay 23
-        #         send_command("ON", target_address)
-        #         prev_state = "ON"
-
-        # else:  # Possible OFF condition
-        #     stable_zero_count += 1
-        #     # print(f"Stable Zero Count: {stable_zero_count}")
-
-            # if stable_zero_count >= ZERO_THRESHOLD and prev_state == "ON":
-            #     GPIO.output(23, GPIO.LOW)   # Turn OFF relay 23
-            #     GPIO.output(24, GPIO.HIGH)  # Turn ON relay 24
-            #     time.sleep(0.5)
-            #     GPIO.output(24, GPIO.LOW)  # Ensure relay 24 is ON
-            #     send_reply("Motor off", target_address)
-            #     send_command("OFF", target_address)
-            #     prev_state = "OFF"
-            #     stable_zero_count = 0  # Reset counter
-
-        time.sleep(0.001)  # Small delay to reduce CPU usage
-
-except KeyboardInterrupt:
-    GPIO.cleanup()
-    print("Program terminated.")
+import os
+
+
+class Motor:
+    """The motor unit: relays, run time and the commands of the home unit."""
+
+    def __init__(self, node, link, target_address=0, relay_on=23, relay_off=24, sensor=25):
+        self.node = node
+        self.link = link  # acknowledges the commands of the home unit
+        self.target_address = target_address
+        self.relay_on = relay_on
+        self.relay_off = relay_off
+        self.sensor = sensor
+
+        # GPIO Setup
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(relay_on, GPIO.OUT)  # Relay ON
+        GPIO.setup(relay_off, GPIO.OUT)  # Relay OFF
+        GPIO.setup(sensor, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)  # Sensor Input
+
+        # Initial States
+        GPIO.output(relay_on, GPIO.LOW)
+        GPIO.output(relay_off, GPIO.LOW)
+        self.prev_state = "OFF"
+        self.on_from_remote = False
+
+        # Run time accounting for the status frame
+        self.motor_on_time = None
+        self.total_run_time = 0
+        self.motor_off_at = None  # end of a SET_TIMER run
+
+        # Noise Filtering Variables
+        self.stable_zero_count = 0
+
+    def send_command(self, command, target_address):
+        """Sends a command."""
+        self.node.send(codec.encode_command(command), dest=target_address)
+        print(f"Command sent to {target_address}.")
+
+    def send_reply(self, target_address, error=codec.NO_ERROR):
+        """Sends the motor status as the reply."""
+        status = codec.MOTOR_ON if GPIO.input(self.relay_on) else codec.MOTOR_OFF
+        self.node.send(codec.encode_status(status, self.run_time(), error), dest=target_address)
+        print(f"Reply sent to {target_address}.")
+
+    def run_time(self):
+        """Total run time in seconds, including the current run."""
+        if self.motor_on_time is None:
+            return self.total_run_time
+        return self.total_run_time + time.time() - self.motor_on_time
+
+    def motor_on(self):
+        GPIO.output(self.relay_off, GPIO.LOW)   # Turn OFF relay 24
+        GPIO.output(self.relay_on, GPIO.HIGH)  # Turn ON relay 23
+        if self.motor_on_time is None:
+            self.motor_on_time = time.time()
+
+    def motor_off(self):
+        GPIO.output(self.relay_on, GPIO.LOW)   # Turn OFF relay 23
+        GPIO.output(self.relay_off, GPIO.HIGH)  # Turn ON relay 24
+        time.sleep(0.5)
+        GPIO.output(self.relay_off, GPIO.LOW)  # Ensure relay 24 is ON
+        self.total_run_time = self.run_time()
+        self.motor_on_time = None
+        self.motor_off_at = None
+
+    def handle(self, packet):
+        """Carries out one command frame of the home unit."""
+        try:
+            message = codec.decode(packet.data)
+            command = message.get("command", "")
+
+            if command == "ON":
+                self.motor_on()
+                self.motor_off_at = None
+                self.send_reply(self.target_address)
+                self.on_from_remote = True
+                self.prev_state = "ON"
+                self.stable_zero_count = 0  # Reset counter
+
+            elif command == "OFF":
+                self.motor_off()
+                self.send_reply(self.target_address)
+                self.on_from_remote = False
+                self.prev_state = "OFF"
+                self.stable_zero_count = 0  # Reset counter
+
+            elif command == "SET_TIMER":
+                self.motor_on()
+                self.motor_off_at = time.time() + message["timer"]
+                self.send_reply(self.target_address)
+                self.on_from_remote = True
+                self.prev_state = "ON"
+                self.stable_zero_count = 0  # Reset counter
+
+            elif command == "STATUS":
+                self.send_reply(self.target_address)
+
+            else:
+                self.send_reply(self.target_address, codec.UNKNOWN_COMMAND)
+
+        except codec.CodecError as e:
+            print(f"Received invalid frame ({e}): {packet.data}")
+
+    def poll(self, timeout=0.05):
+        """Waits up to timeout for a command, then checks the SET_TIMER run."""
+        packet = self.link.receive(timeout=timeout)
+        if packet:
+            self.handle(packet)
+
+        if self.motor_off_at is not None and time.time() >= self.motor_off_at:
+            self.motor_off()
+            self.send_reply(self.target_address)
+            self.on_from_remote = False
+            self.prev_state = "OFF"
+
+
+if __name__ == '__main__':
+    DOUT_PIN = 25
+    current_address = 30
+    target_address = 0
+    ZERO_THRESHOLD = 100
+    # WOR cycle in ms (500 to 4000) to let the module sleep between commands, the home
+    # unit must then wake this node (node.wor_peers.add(30) in home.py); None listens all the time
+    WOR_PERIOD = None
+
+    # Initialize LoRa
+    node = sx126x.sx126x(serial_num="/dev/ttyS0", freq=433, addr=current_address, power=22, rssi=False, fixed=True)
+    # the settings the home unit changed over the air (remote_config.py)
+    remote_config.restore(node)
+    node.start_reader()
+    if WOR_PERIOD:
+        node.wor(WOR_PERIOD)
+    poll = WOR_PERIOD / 1000.0 if WOR_PERIOD else 0.05
+    link = node.remote_config(arq.Link(node), gateway=target_address)
+    motor = Motor(node, link, target_address, sensor=DOUT_PIN)
+
+    try:
+        while True:
+            # waits on the reader thread, the sensor is still checked every 50 ms
+            # (once a WOR cycle when the module sleeps in between)
+            motor.poll(timeout=poll)
+
+            # **Noise Filtering Logic for Motor Control**
+            current_signal = GPIO.input(DOUT_PIN)
+            print(f"Stable Zero Count: {motor.stable_zero_count}")
+
+
+            # if current_signal:  # If sensor detects current
+            #     print("On Detected, {current_signal}")
+            #     motor.stable_zero_count = 0  # Reset counter
+            #     if motor.prev_state == "OFF":
+            #         motor.motor_on()
+            #         motor.send_command("ON", target_address)
+            #         motor.prev_state = "ON"
+
+            # else:  # Possible OFF condition
+            #     motor.stable_zero_count += 1
+            #     # print(f"Stable Zero Count: {motor.stable_zero_count}")
+
+                # if motor.stable_zero_count >= ZERO_THRESHOLD and motor.prev_state == "ON":
+                #     motor.motor_off()
+                #     motor.send_reply(target_address)
+                #     motor.send_command("OFF", target_address)
+                #     motor.prev_state = "OFF"
+                #     motor.stable_zero_count = 0  # Reset counter
+
+    except KeyboardInterrupt:
+        print("Program terminated.")
+    finally:
+        node.close()
+        GPIO.cleanup()
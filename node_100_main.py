@@ -63,7 +63,9 @@ def get_cpu_temp():
 #
 
 #node = sx126x.sx126x(serial_num = "/dev/ttyS0",freq=433,addr=30,power=22,rssi=False)
-node = sx126x.sx126x(serial_num = "/dev/ttyS0",freq=868,addr=100,power=22,rssi=True)
+node = sx126x.sx126x(serial_num = "/dev/ttyS0",freq=868,addr=100,power=22,rssi=True,fixed=True)
+# the telemetry timer below must not take more than 1% of the 868 MHz channel
+node.set_duty_cycle(0.01)
 
 def send_deal():
     get_rec = ""
@@ -81,11 +83,7 @@ def send_deal():
 
     get_t = get_rec.split(",")
 
-    node.addr_temp = node.addr
-    node.set(node.freq,int(get_t[0]),node.power,node.rssi)
-    node.send(get_t[1])
-    time.sleep(0.2)
-    node.set(node.freq,node.addr_temp,node.power,node.rssi)
+    node.send(get_t[1],dest=int(get_t[0]))
 
     print('\x1b[2A',end='\r')
     print(" "*100)
@@ -99,21 +97,11 @@ def send_cpu_continue(send_to_who,continue_or_not = True):
     if continue_or_not:
         global timer_task
         global seconds
-        node.send_to = send_to_who
-        node.addr_temp = node.addr
-        node.set(node.freq,node.send_to,node.power,node.rssi)
-        node.send("CPU Temperature:"+str(get_cpu_temp())+" C")
-        time.sleep(0.2)
-        node.set(node.freq,node.addr_temp,node.power,node.rssi)
+        node.send("CPU Temperature:"+str(get_cpu_temp())+" C",dest=send_to_who)
         timer_task = Timer(seconds,send_cpu_continue,(send_to_who,))
         timer_task.start()
     else:
-        node.send_to = send_to_who
-        node.addr_temp = node.addr
-        node.set(node.freq,node.send_to,node.power,node.rssi)
-        node.send("CPU Temperature:"+str(get_cpu_temp())+" C")
-        time.sleep(0.2)
-        node.set(node.freq,node.addr_temp,node.power,node.rssi)
+        node.send("CPU Temperature:"+str(get_cpu_temp())+" C",dest=send_to_who)
         timer_task.cancel()
         pass
 
@@ -169,6 +157,8 @@ except:
     # print('\x1b[2A',end='\r')
 
 termios.tcsetattr(sys.stdin, termios.TCSADRAIN, old_settings)
+# the journal of the received packets writes its last batch
+node.close()
 # print('\x1b[2A',end='\r')
 # print(" "*100)
 # print(" "*100)
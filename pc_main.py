@@ -126,7 +126,9 @@ class sx126x:
             self.ser.flushInput()
 
             print("receive message from address %d node "%((r_buff[0]<<8)+r_buff[1]))
-            print("message is "+str(r_buff[2:-1]))
+            # the sx126x.py of the top directory sends [0xFE, length] in front of the message
+            start = 4 if len(r_buff) > 3 and r_buff[2] == 0xFE else 2
+            print("message is "+str(r_buff[start:-1]))
             current_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
             print(f"[{current_time}] Received: PC_MAin")
             # print the rssi
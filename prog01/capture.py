@@ -0,0 +1,120 @@
+#
+#    Capture of the received packets for pc_main.py
+#
+#    Every row is appended to the open save_data_01.csv (same columns as
+#    before), so a row costs the same at the first packet and after a night
+#    of range testing. Every roll_rows rows or roll_interval seconds the rows
+#    since the last roll are written as one columnar segment
+#
+#        segments/capture-20210807-011312.feather
+#
+#    Feather segments are uncompressed Arrow files which load() maps into
+#    memory instead of reading them, Parquet (smaller, no mapping) can be
+#    chosen with fmt="parquet". Both need pyarrow.
+#
+
+import os
+import csv
+import glob
+import time
+
+import pandas as pd
+
+COLUMNS = ['Time Rx','Time Tx','Node','Noise RSSI','Channel RSSI']
+
+
+class Capture:
+
+    def __init__(self,path='save_data_01.csv',directory='segments',
+                 roll_rows=1000,roll_interval=600,fmt='feather'):
+        self.path = path
+        self.directory = directory
+        self.roll_rows = roll_rows
+        self.roll_interval = roll_interval
+        self.fmt = fmt
+        os.makedirs(directory,exist_ok=True)
+
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path,'a',newline='')
+        self.writer = csv.writer(self.file)
+        if new:
+            self.writer.writerow(COLUMNS)
+            self.file.flush()
+
+        # rows since the last segment
+        self.rows = []
+        self.rolled = time.time()
+
+    def append(self,node,noise,rssi,time_tx=''):
+        # one received packet, noise and rssi in dBm
+        now = time.time()
+        day = time.strftime("%d %m %Y at %I:%M:%S%p",time.localtime(now))
+        self.writer.writerow([day,time_tx,node,noise,rssi])
+        self.file.flush()
+        self.rows.append((now,time_tx,node,noise,rssi))
+        if len(self.rows) >= self.roll_rows or now - self.rolled >= self.roll_interval:
+            self.roll()
+
+    def frame(self,rows):
+        times,time_tx,node,noise,rssi = zip(*rows)
+        return pd.DataFrame({
+            'Time Rx':pd.to_datetime(times,unit='s'),
+            'Time Tx':pd.Series(time_tx,dtype='string'),
+            'Node':pd.Series(node,dtype='int32'),
+            'Noise RSSI':pd.Series(noise,dtype='int16'),
+            'Channel RSSI':pd.Series(rssi,dtype='int16')
+        })
+
+    def roll(self):
+        # write the rows since the last roll as a columnar segment
+        self.rolled = time.time()
+        if not self.rows:
+            return None
+        df = self.frame(self.rows)
+        base = name = os.path.join(self.directory,
+                                   time.strftime("capture-%Y%m%d-%H%M%S",time.localtime(self.rows[0][0])))
+        n = 1
+        while glob.glob(name + '.*'):
+            name = "%s-%d" % (base,n)
+            n += 1
+        if self.fmt == 'parquet':
+            path = name + '.parquet'
+            df.to_parquet(path,index=False)
+        else:
+            path = name + '.feather'
+            # uncompressed, so load() can map it
+            df.to_feather(path,compression='uncompressed')
+        self.rows = []
+        return path
+
+    def pending(self):
+        # the rows which are not in a segment yet, as a DataFrame
+        if not self.rows:
+            return self.frame([(0,'',0,0,0)]).iloc[:0]
+        return self.frame(self.rows)
+
+    def close(self):
+        self.roll()
+        self.file.close()
+
+
+def load(directory='segments',capture=None):
+    # all the segments as one DataFrame, Feather segments are memory mapped;
+    # with a Capture also the rows which are not rolled yet
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as parquet
+
+    tables = []
+    # capture-X before capture-X-1, the extension must not take part in the order
+    paths = sorted(glob.glob(os.path.join(directory,'capture-*')),key=lambda p: os.path.splitext(p)[0])
+    for path in paths:
+        if path.endswith('.feather'):
+            tables.append(feather.read_table(path,memory_map=True))
+        elif path.endswith('.parquet'):
+            tables.append(parquet.read_table(path,memory_map=True))
+    if capture is not None and capture.rows:
+        tables.append(pa.Table.from_pandas(capture.pending(),preserve_index=False))
+    if not tables:
+        return pd.DataFrame(columns=COLUMNS)
+    return pa.concat_tables(tables).to_pandas()
@@ -18,8 +18,7 @@
 import time
 import sys
 import serial
-import pandas as pd
-from time import strftime
+from capture import Capture
 
 
 class sx126x:
@@ -128,7 +127,9 @@ class sx126x:
             self.ser.flushInput()
 
             print("receive message from address %d node "%((r_buff[0]<<8)+r_buff[1]))
-            print("message is "+str(r_buff[2:-1]))
+            # the sx126x.py of the top directory sends [0xFE, length] in front of the message
+            start = 4 if len(r_buff) > 3 and r_buff[2] == 0xFE else 2
+            print("message is "+str(r_buff[start:-1]))
             current_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
             print(f"[{current_time}] Received:")
 
@@ -147,11 +148,8 @@ class sx126x:
                 # print("return value: -{0}dBm".format(256-r))
                 # print("return value: -{0}dBm".format(256-r1))
 
-                data_holder = pd.read_csv('save_data_01.csv')
-                day = strftime("%d %m %Y at %I:%M:%S%p")
-                new_data = pd.Series([str(day),str((r_buff[0]<<8)+r_buff[1]), str(-(256-r)),str(-(256-r1))], index= ['Time Rx','Node','Noise RSSI','Channel RSSI'])
-                data_holder = data_holder.append(new_data,ignore_index=True)
-                data_holder.to_csv('save_data_01.csv',index=False) 
+                # appended to the open capture file, see capture.py
+                capture.append((r_buff[0]<<8)+r_buff[1],-(256-r),-(256-r1))
 
             else:
                 pass
@@ -216,6 +214,7 @@ class sx126x:
 #
 
 node = sx126x(serial_num = "COM3",freq=433,addr=21,power=22,rssi=True)
+capture = Capture('save_data_01.csv')
 # node = sx126x(serial_num = "COM8",freq=868,addr=65535,power=22,rssi=True)
 
 
@@ -237,3 +236,5 @@ try:
 except:
     node.free_serial()
     pass
+finally:
+    capture.close()
@@ -0,0 +1,48 @@
+# This file holds the radio figures of the SX126x LoRa HAT which the driver,
+# the rate and power control and the emulator all work with
+#
+#    BAUD, AIR_SPEED, BUFFER_SIZE and POWER are the values in the order of
+#    their register bits, LORA_PARAMS the LoRa modulation behind each air
+#    speed and sensitivity() the weakest packet the demodulator still
+#    decodes at an air speed.
+#
+#    It needs neither RPi.GPIO nor a serial port, so the emulator can use it
+#    before it installs its GPIO model.
+
+import math
+
+# register 03H bits 7-5
+BAUD = [1200, 2400, 4800, 9600, 19200, 38400, 57600, 115200]
+# register 03H bits 2-0
+AIR_SPEED = [300, 1200, 2400, 4800, 9600, 19200, 38400, 62500]
+# register 04H bits 7-6
+BUFFER_SIZE = [240, 128, 64, 32]
+# register 04H bits 1-0
+POWER = [22, 17, 13, 10]
+
+# The module only exposes an air speed, these are the nearest LoRa spreading
+# factor and bandwidth (kHz) for each of them, coding rate 4/5.
+# Good enough to estimate the time on air, not an exact copy of the firmware.
+LORA_PARAMS = {
+    300: (12, 125),
+    1200: (12, 500),
+    2400: (11, 500),
+    4800: (10, 500),
+    9600: (9, 500),
+    19200: (7, 500),
+    38400: (6, 500),
+    62500: (5, 500)
+}
+
+# the SNR the LoRa demodulator still decodes at, by spreading factor (SX1262 datasheet)
+SNR_LIMIT = {5: -2.5, 6: -5.0, 7: -7.5, 8: -10.0, 9: -12.5, 10: -15.0, 11: -17.5, 12: -20.0}
+NOISE_FIGURE = 6
+
+
+def sensitivity(air_speed, noise=None):
+    # weakest rssi in dBm decoded at air_speed with noise dBm on the channel,
+    # the thermal noise of the bandwidth + noise figure when it is lower or
+    # not known, plus the SNR limit
+    sf, bw = LORA_PARAMS[air_speed]
+    thermal = -174 + 10 * math.log10(bw * 1000) + NOISE_FIGURE
+    return max(thermal, noise if noise is not None else thermal) + SNR_LIMIT[sf]
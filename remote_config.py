@@ -0,0 +1,399 @@
+# This file is the configuration of nodes over the air, the gateway changes
+# the settings of set() without a visit to the node (see sx126x.remote_config())
+#
+#    apply frame:   [0xA9, APPLY, ID, WAIT, DELAY, N, (FIELD, VALUE (2)) * N]
+#    query frame:   [0xA9, QUERY, ID, WAIT, N, FIELD * N]
+#    result frame:  [0xA9, RESULT, ID, STATUS, DIGEST (4)]
+#
+#    FIELD is one of the settings in FIELDS, VALUE its new value. The target
+#    checks the whole delta first, applies it with one reconfigure(), that is
+#    one register frame the module takes as a whole, and reads the registers
+#    back. DIGEST is the CRC-32 of the (FIELD, VALUE) pairs of the delta as
+#    the module reports them, the gateway compares it with the one of what it
+#    asked for. A module which does not report what was written is set back
+#    to the old settings (FAILED).
+#
+#    A change of freq, addr, net_id or air_speed cuts the node off from the
+#    gateway, the result could not reach it. Those need a DELAY in seconds:
+#    the target answers ACCEPTED with the digest of the delta it checked and
+#    applies it DELAY seconds later. The gateway moves along and verify()
+#    asks with QUERY for the digest of the registers at the new settings. A
+#    target which hears nothing from the gateway within confirm_timeout
+#    seconds after such a change goes back to the old settings.
+#
+#    push() sends the same delta to many nodes, window requests back to back
+#    without waiting for the results in between. The gateway does not hear
+#    while it sends, so each request has its own WAIT (1/10 s): the target
+#    sends its result that long after the request came in, once the gateway
+#    is done with the burst and in a slot of its own. Requests without a
+#    result go out again in the next burst. A repeated request is answered
+#    with the result of the first one and not applied twice.
+#
+#    The target takes config frames only from the address of its gateway
+#    (Agent(gateway=...)), a frame from any other node is dropped.
+#
+#    The applied settings are kept in a JSON file, restore() sets them again
+#    when the program starts (set() of the program writes its own ones).
+#    crypt is not read back by the module and stays a setting of the program.
+
+import os
+import json
+import time
+import zlib
+import random
+import collections
+
+import sx126x
+import radio
+
+CONFIG = 0xA9
+APPLY = 0x01
+QUERY = 0x02
+RESULT = 0x03
+
+APPLIED = 0x00
+ACCEPTED = 0x01
+REJECTED = 0x02
+FAILED = 0x03
+# [CONFIG, RESULT, IDENT, STATUS] and the 4 byte digest
+RESULT_LENGTH = 8
+
+FIELDS = {"freq": 1, "addr": 2, "net_id": 3, "air_speed": 4, "buffer_size": 5, "power": 6,
+          "rssi": 7, "wor": 8, "wor_period": 9}
+NAMES = {code: name for name, code in FIELDS.items()}
+# the fields which change the link to the gateway
+LINK = {"freq", "addr", "net_id", "air_speed"}
+
+STATUS = {APPLIED: "ok", ACCEPTED: "accepted", REJECTED: "rejected", FAILED: "failed"}
+
+
+def digest(fields):
+    # CRC-32 of the (field, value) pairs in the order of their codes
+    data = b''.join(bytes([FIELDS[name], int(value) >> 8, int(value) & 0xff])
+                    for name, value in sorted(fields.items(), key=lambda item: FIELDS[item[0]]))
+    return zlib.crc32(data)
+
+
+def band(freq):
+    # the channel 0 of the module freq belongs to, None outside both bands
+    if 850 <= freq <= 930:
+        return 850
+    if 410 <= freq <= 493:
+        return 410
+    return None
+
+
+def valid(node, delta):
+    # True if node can take every value of delta, the band is that of the module
+    for name, value in delta.items():
+        if name == "freq":
+            ok = band(value) is not None and band(value) == band(node.params["freq"])
+        elif name == "addr":
+            ok = 0 <= value <= 0xffff
+        elif name == "net_id":
+            ok = 0 <= value <= 0xff
+        elif name == "air_speed":
+            ok = value in radio.AIR_SPEED[1:]
+        elif name == "buffer_size":
+            ok = value in radio.BUFFER_SIZE
+        elif name == "power":
+            ok = value in radio.POWER
+        elif name == "wor_period":
+            ok = value in range(500, 4001, 500)
+        else:
+            ok = value in (0, 1)
+        if not ok:
+            return False
+    return True
+
+
+def fields(regs, freq):
+    # the settings in registers 00H~08H, freq picks the band
+    return {
+        "addr": (regs[0] << 8) + regs[1],
+        "net_id": regs[2],
+        "air_speed": radio.AIR_SPEED[regs[3] & 0x07],
+        "buffer_size": radio.BUFFER_SIZE[regs[4] >> 6],
+        "power": radio.POWER[regs[4] & 0x03],
+        "freq": band(freq) + regs[5],
+        "rssi": int(bool(regs[6] & 0x80)),
+        "wor": int(bool(regs[6] & 0x08)),
+        "wor_period": 500 * ((regs[6] & 0x07) + 1)
+    }
+
+
+def encode_apply(ident, changes, delay=0):
+    frame = bytes([CONFIG, APPLY, ident, 0, delay, len(changes)])
+    for name, value in changes.items():
+        frame += bytes([FIELDS[name], int(value) >> 8, int(value) & 0xff])
+    return frame
+
+
+def decode_apply(data):
+    # (id, delay, delta) of an apply frame, None if it is not a valid one
+    if len(data) < 6 or len(data) != 6 + 3 * data[5]:
+        return None
+    delta = {}
+    for i in range(6, len(data), 3):
+        name = NAMES.get(data[i])
+        if name is None:
+            return None
+        delta[name] = (data[i + 1] << 8) + data[i + 2]
+    return data[2], data[4], delta
+
+
+def restore(node, path="remote_config.json"):
+    # set the settings applied over the air again, returns them
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    saved = {name: value for name, value in saved.items() if name in FIELDS}
+    if saved and valid(node, saved):
+        old = dict(node.params)
+        try:
+            node.reconfigure(**saved)
+        except ValueError:
+            # the file is of another module, keep the settings of the program
+            node.set(**old)
+            return {}
+    return saved
+
+
+class Agent:
+    # The target side. send() and receive() are those of the link, config
+    # frames are handled here and the other packets go to the application.
+
+    def __init__(self, node, link, gateway=None, path="remote_config.json", confirm_timeout=60.0):
+        self.node = node
+        self.link = link
+        # the address config frames are taken from, None takes them from any node
+        self.gateway = gateway
+        self.path = path
+        self.confirm_timeout = confirm_timeout
+        # (gateway, id, delta, time to apply) of an accepted change
+        self.staged = None
+        # (gateway, delta, old settings, deadline) of a link change not heard at yet
+        self.pending = None
+        # (gateway, id) -> result frame of the last apply requests
+        self.results = collections.OrderedDict()
+        self.applied = 0
+        self.rejected = 0
+        self.rollbacks = 0
+
+    def receive(self, timeout=0):
+        # the next packet for the application
+        deadline = time.time() + timeout
+        while True:
+            self.expire()
+            packet = self.link.receive(timeout=min(max(deadline - time.time(), 0), 0.5))
+            if packet is not None:
+                if self.pending is not None and packet.addr == self.pending[0]:
+                    # the gateway reached the node at the new settings
+                    self.save(self.pending[1])
+                    self.pending = None
+                if not self.handle(packet):
+                    return packet
+            elif time.time() >= deadline:
+                return None
+
+    def send(self, dest, data):
+        return self.link.send(dest, data)
+
+    def handle(self, packet):
+        # True if packet was a config frame
+        data = packet.data
+        if len(data) < 4 or data[0] != CONFIG:
+            return False
+        if self.gateway is not None and packet.addr != self.gateway:
+            # only the gateway configures the node, the frame is dropped
+            return True
+        key = (packet.addr, data[2])
+        if data[1] == APPLY:
+            if key not in self.results:
+                self.results[key] = self.request(packet.addr, data)
+                while len(self.results) > 16:
+                    self.results.popitem(last=False)
+            # a repeated request is answered again, the first result may have been lost
+            self.reply(packet, self.results[key])
+        elif data[1] == QUERY and len(data) >= 5 and len(data) == 5 + data[4]:
+            names = [NAMES.get(code) for code in data[5:]]
+            current = self.read()
+            if current is None or None in names:
+                self.reply(packet, self.result(data[2], FAILED, {}))
+            else:
+                self.reply(packet, self.result(data[2], APPLIED, {n: current[n] for n in names}))
+        return True
+
+    def request(self, gateway, data):
+        # the result frame of an apply frame
+        request = decode_apply(data)
+        if request is None or not valid(self.node, request[2]) or \
+           (LINK & set(request[2]) and not request[1]) or self.staged is not None:
+            self.rejected += 1
+            return self.result(data[2], REJECTED, {})
+        ident, delay, delta = request
+        if delay:
+            self.staged = (gateway, ident, delta, time.time() + delay)
+            return self.result(ident, ACCEPTED, delta)
+        status, current = self.apply(delta)
+        if status == APPLIED:
+            self.save(delta)
+        return self.result(ident, status, current)
+
+    def apply(self, delta):
+        # (status, the settings of delta the module reports)
+        old = dict(self.node.params)
+        try:
+            self.node.reconfigure(**delta)
+        except Exception:
+            # a value the driver does not take, the receive loop must go on
+            self.node.set(**old)
+            self.rejected += 1
+            return REJECTED, {}
+        current = self.read()
+        if current is None or any(current[name] != value for name, value in delta.items()):
+            self.node.set(**old)
+            self.rollbacks += 1
+            return FAILED, {name: value for name, value in (current or {}).items() if name in delta}
+        self.applied += 1
+        return APPLIED, {name: current[name] for name in delta}
+
+    def read(self):
+        regs = self.node.readback()
+        if regs is None:
+            return None
+        return fields(regs, self.node.params["freq"])
+
+    def expire(self):
+        now = time.time()
+        if self.staged is not None and now >= self.staged[3]:
+            gateway, ident, delta, when = self.staged
+            self.staged = None
+            old = dict(self.node.params)
+            status, current = self.apply(delta)
+            if status == APPLIED and LINK & set(delta):
+                self.pending = (gateway, delta, old, now + self.confirm_timeout)
+            elif status == APPLIED:
+                self.save(delta)
+        if self.pending is not None and now >= self.pending[3]:
+            gateway, delta, old, deadline = self.pending
+            self.pending = None
+            self.node.set(**old)
+            self.rollbacks += 1
+
+    def result(self, ident, status, current):
+        return bytes([CONFIG, RESULT, ident, status]) + digest(current).to_bytes(4, 'big')
+
+    def reply(self, request, frame):
+        # frame to the gateway in the slot WAIT of request gives it
+        time.sleep(max(request.time + request.data[3] / 10 - time.time(), 0))
+        self.link.node.send(frame, dest=request.addr)
+
+    def save(self, delta):
+        # the settings changed over the air so far, the file is replaced as a whole
+        saved = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    saved = json.load(f)
+            except ValueError:
+                pass
+        saved.update({name: self.node.params[name] for name in delta})
+        saved = {name: int(value) for name, value in saved.items() if name in FIELDS}
+        temp = self.path + ".tmp"
+        with open(temp, "w") as f:
+            json.dump(saved, f)
+        os.replace(temp, self.path)
+
+
+class Configurator:
+    # The gateway side. push() and verify() return {dest: status} with status
+    # one of "ok", "accepted", "rejected", "failed", "digest mismatch" and
+    # "no reply"; the packets which are not results come from receive().
+    # apply_time is the time a target takes from a request to its result,
+    # send_time the time send() takes, it follows the sends of the gateway.
+
+    def __init__(self, link, retries=3, window=8, apply_time=0.8, send_time=0.25, guard=0.1):
+        self.link = link
+        self.retries = retries
+        self.window = window
+        self.apply_time = apply_time
+        self.send_time = send_time
+        self.guard = guard
+        self.ident = random.randrange(256)
+        self.held = collections.deque()
+        self.retransmissions = 0
+
+    def push(self, dests, changes, delay=0):
+        # apply changes on every node of dests, a link change needs a delay
+        for name in changes:
+            if name not in FIELDS:
+                raise ValueError(f"no remote setting {name}")
+        if LINK & set(changes) and not delay:
+            raise ValueError("a change of " + ", ".join(sorted(LINK & set(changes))) +
+                             " needs a delay, the result would not reach the gateway")
+        if not 0 <= delay <= 255:
+            raise ValueError("the delay is 0 to 255 seconds")
+        self.ident = (self.ident + 1) & 0xff
+        changes = {name: int(value) for name, value in changes.items()}
+        return self.exchange(dests, encode_apply(self.ident, changes, delay), digest(changes))
+
+    def verify(self, dests, expected):
+        # compare the settings of expected with the registers of every node of dests
+        self.ident = (self.ident + 1) & 0xff
+        frame = bytes([CONFIG, QUERY, self.ident, 0, len(expected)] + [FIELDS[name] for name in expected])
+        return self.exchange(dests, frame, digest({name: int(value) for name, value in expected.items()}))
+
+    def exchange(self, dests, frame, expected):
+        # frame to every node of dests in bursts of window requests
+        node = self.link.node
+        # the module sends one packet after the other, the slower of the two sets the pace
+        airtime = sx126x.packet_time(len(frame), node.air_speed)
+        slot = sx126x.packet_time(RESULT_LENGTH, node.air_speed) + self.send_time + self.guard
+        waiting = collections.deque(dests)
+        tries = collections.Counter()
+        results = {}
+        while waiting:
+            burst = [waiting.popleft() for _ in range(min(self.window, len(waiting)))]
+            for k, dest in enumerate(burst):
+                # the rest of the burst, the target applying, the slots before its own
+                sending = max(airtime, self.send_time)
+                wait = (len(burst) - 1 - k) * sending + self.apply_time + k * slot
+                start = time.time()
+                node.send(frame[:3] + bytes([min(round(wait * 10), 255)]) + frame[4:], dest=dest)
+                self.send_time += 0.25 * (time.time() - start - self.send_time)
+                self.retransmissions += tries[dest] > 0
+                tries[dest] += 1
+
+            outstanding = set(burst)
+            end = time.time() + self.apply_time + len(burst) * slot
+            while outstanding and time.time() < end:
+                packet = self.link.receive(timeout=min(max(end - time.time(), 0), 0.05))
+                if packet is None:
+                    continue
+                data = packet.data
+                if len(data) != RESULT_LENGTH or data[0] != CONFIG or data[1] != RESULT:
+                    self.held.append(packet)
+                elif data[2] == frame[2] and packet.addr in outstanding:
+                    outstanding.discard(packet.addr)
+                    status = STATUS.get(data[3], "failed")
+                    if status in ("ok", "accepted") and int.from_bytes(data[4:8], 'big') != expected:
+                        status = "digest mismatch"
+                    results[packet.addr] = status
+
+            for dest in burst:
+                if dest not in outstanding:
+                    continue
+                if tries[dest] > self.retries:
+                    results[dest] = "no reply"
+                else:
+                    waiting.append(dest)
+        return results
+
+    def receive(self, timeout=0):
+        # the next packet for the application, those held during push() first
+        if self.held:
+            return self.held.popleft()
+        return self.link.receive(timeout)
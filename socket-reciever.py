@@ -1,6 +1,8 @@
 import sys
 import sx126x
+import codec
 import time
+import json
 import termios
 import tty
 import asyncio
@@ -12,37 +14,38 @@ tty.setcbreak(sys.stdin.fileno())
 
 # Initialize LoRa module
 node = sx126x.sx126x(serial_num="/dev/ttyS0", freq=433, addr=0, power=22, rssi=False)
+radio = sx126x.AsyncSX126x(node)
 
 connected_clients = set()
 
 async def lora_receiver():
     """Receive data from LoRa and broadcast to all WebSocket clients."""
-    while True:
+    # The serial port is watched by the event loop, no executor per packet
+    radio.start()
+    async for packet in radio:
         try:
-            # Run blocking receive in a thread to avoid blocking the event loop
-            data = await asyncio.get_event_loop().run_in_executor(None, node.receive)
-            if data:
-                current_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-                message = f"[{current_time}] {data}"
-                print(f"LoRa Received: {message}")
+            if packet.data[:1] == bytes([codec.VERSION]):
+                # binary status frames are sent as JSON, like lora-web.py stores them
+                data = json.dumps(dict(codec.decode(packet.data), address=packet.addr, rssi=packet.rssi))
+            else:
+                # senders from before codec.py send text
+                data = packet.data.decode('utf-8', errors='replace')
+            current_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+            message = f"[{current_time}] {data}"
+            print(f"LoRa Received: {message}")
 
-                await websocket.send(message) 
-                
-                # Send to all connected WebSocket clients
-                for websocket in connected_clients.copy():
-                    try:
-                        print(f"LoRa Received: -----------|||||||||||||\\-")
-                        await websocket.send(message)  # This line might be raising an exception
-                        print(f"LoRa Received: ------------")
-                    except websockets.exceptions.ConnectionClosed as e:
-                        print(f"WebSocket connection closed: {e}")
-                        connected_clients.remove(websocket)
-                    except Exception as e:
-                        print(f"Unexpected error sending message: {e}")
-                        connected_clients.remove(websocket)
+            # Send to all connected WebSocket clients
+            for websocket in connected_clients.copy():
+                try:
+                    await websocket.send(message)
+                except websockets.exceptions.ConnectionClosed as e:
+                    print(f"WebSocket connection closed: {e}")
+                    connected_clients.discard(websocket)
+                except Exception as e:
+                    print(f"Unexpected error sending message: {e}")
+                    connected_clients.discard(websocket)
         except Exception as e:
             print(f"LoRa Error: {e}")
-            await asyncio.sleep(1)  # Prevent tight loop on errors
 
 async def websocket_handler(websocket, path=None):  # <-- KEY FIX: ADD 'path' PARAMETER
     """Handle new WebSocket connections and maintain client list."""
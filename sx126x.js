@@ -1,3 +1,6 @@
+const codec = require('./codec');
+const arq = require('./arq');
+
 class SX126X {
     constructor(serial_num, freq, addr, power, rssi) { // serial_num is still here for now, but not used in constructor
         this.rssi = rssi;
@@ -13,6 +16,8 @@ class SX126X {
         this.cfg_reg = [0xC2, 0x00, 0x09, 0x00, 0x00, 0x00, 0x62, 0x00, 0x17, 0x00, 0x00, 0x00];
         this.get_reg = Buffer.alloc(12);
         this.serialPort = null;
+        // the packets of sx126x.py are [address, 0xFE, length, message], see arq.js
+        this.decoder = new arq.FrameDecoder(rssi);
 
         this.SX126X_UART_BAUDRATE_1200 = 0x00;
         this.SX126X_UART_BAUDRATE_2400 = 0x20;
@@ -252,51 +257,48 @@ class SX126X {
     //     });
     // }
 
+    message(packet) {
+        // the message of a packet as a JSON string: codec frames decoded like
+        // lora-web.py does, the text of senders from before the codec as it is
+        if (codec.isFrame(packet.data)) {
+            return JSON.stringify({ ...codec.decode(packet.data), address: packet.node_address, rssi: packet.rssi });
+        }
+        return packet.data.toString('utf8');
+    }
+
     receive() {
         return new Promise((resolve, reject) => {
             let accumulatedData = ''; // Buffer to accumulate data
 
-            const dataHandler = (data) => {
-                console.log("[SerialPort - receive()] Raw Bytes Received (Before Filter):", data); // Log raw data BEFORE filter
-
-                let filteredData = data; // Assume no prefix initially
-                const prefixBuffer = Buffer.from([0x00, 0x1e]);
-
-                // Robust prefix check: Does data START WITH <Buffer 00 1e>?
-                if (data.indexOf(prefixBuffer) === 0) {
-                    filteredData = data.subarray(prefixBuffer.length); // Remove prefix
-                    console.log("[SerialPort - receive()] Prefix <Buffer 00 1e> detected and removed. Filtered Data:", filteredData); // Log filtered data
-                } else {
-                    console.log("[SerialPort - receive()] No prefix <Buffer 00 1e> detected. Data:", data); // Log data if no prefix
-                }
-
-
-                const receivedString = filteredData.toString('utf8');
-                accumulatedData += receivedString; // Append to buffer
-
-                // Attempt to parse accumulated data as JSON
-                try {
-
-                    // const cleanData = accumulatedData.replace(/[\uFFFD\u0000-\u001F]/g, '');
-                    const cleanData = accumulatedData.replace(/^[^{]+/, ''); 
-
-                    accumulatedData = cleanData; // Clean up data before parsing
-
-                    console.log('\n\n\n\n\n\n', accumulatedData, '\n\n\n\n\n');
-                    
-                    const parsedJSON = JSON.parse(accumulatedData);
-                    // JSON parsing successful!
-                    console.log(`[SerialPort - receive()] Complete JSON Received and Parsed:`, parsedJSON);
-                    this.serialPort.off('data', dataHandler);
-                    this.serialPort.off('error', errorHandler);
-                    resolve(JSON.stringify(parsedJSON));
-                    accumulatedData = ''; // Reset buffer
+            const finish = (message) => {
+                this.serialPort.off('data', dataHandler);
+                this.serialPort.off('error', errorHandler);
+                resolve(message);
+            };
 
-                } catch (parseError) {
-                    // JSON parsing failed - Incomplete or invalid
-                    console.log("[SerialPort - receive()] Incomplete or Invalid JSON, accumulating more data...", accumulatedData);
-                    // console.error("[SerialPort - receive()] JSON Parse Error:", parseError); // Optional: Log parse error
-                }
+            const dataHandler = (data) => {
+                console.log("[SerialPort - receive()] Raw Bytes Received:", data);
+                this.decoder.feed(data, (packet) => {
+                    if (codec.isFrame(packet.data)) {
+                        try {
+                            finish(this.message(packet));
+                        } catch (error) {
+                            console.log("[SerialPort - receive()] Invalid frame:", error.message, packet.data);
+                        }
+                        return;
+                    }
+                    // senders from before the codec send JSON text, maybe over several packets
+                    accumulatedData += packet.data.toString('utf8');
+                    try {
+                        accumulatedData = accumulatedData.replace(/^[^{]+/, '');
+                        const parsedJSON = JSON.parse(accumulatedData);
+                        console.log(`[SerialPort - receive()] Complete JSON Received and Parsed:`, parsedJSON);
+                        finish(JSON.stringify(parsedJSON));
+                    } catch (parseError) {
+                        // JSON parsing failed - Incomplete or invalid
+                        console.log("[SerialPort - receive()] Incomplete or Invalid JSON, accumulating more data...", accumulatedData);
+                    }
+                });
             };
 
             const errorHandler = (err) => {
@@ -317,14 +319,11 @@ class SX126X {
             this.m0Pin.digitalWrite(0);
             this.m1Pin.digitalWrite(0);
 
-            const target_addr_high = (this.send_to >> 8) & 0xff;
-            const target_addr_low = this.send_to & 0xff;
-            const current_addr_high = (this.addr >> 8) & 0xff;
-            const current_addr_low = this.addr & 0xff;
-
-            const header = Buffer.from([target_addr_high, target_addr_low, current_addr_high, current_addr_low]);
+            // the module sends the address it borrowed for the destination, the
+            // packet carries our own one in front of the message like sx126x.py does
+            const source = this.addr_temp !== undefined ? this.addr_temp : this.addr;
             const data = Buffer.from(tx_data, 'utf8'); // Encode string to Buffer
-            const bufferToSend = Buffer.concat([header, data]);
+            const bufferToSend = arq.frame(source, data);
 
 
             this.serialPort.write(bufferToSend, (err) => {
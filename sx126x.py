@@ -4,8 +4,291 @@
 import RPi.GPIO as GPIO
 import serial
 import time
-import datetime
 import json
+import collections
+import contextlib
+import threading
+import asyncio
+import math
+import random
+
+import journal
+import radio
+
+
+# one received message, rssi is the packet rssi in dBm or None when not enabled,
+# noise is the latest noise floor of the sampler in dBm (see start_noise_sampler())
+Packet = collections.namedtuple('Packet',['addr','data','rssi','time','noise'],defaults=(None,))
+
+
+class FrameDecoder:
+    # Splits the bytes coming from the serial port into packets.
+    # A frame is [address high, address low, MAGIC, length, message...] and the
+    # module appends one more byte with the packet rssi when the 06H register
+    # enables it. 0xFE never occurs in UTF-8 text, so the packets of older
+    # senders, [address high, address low, message...], are told apart by the
+    # third byte; they are closed by the silence on the UART after the module
+    # has output the whole packet.
+
+    MAGIC = 0xFE
+    HEADER = 4
+
+    def __init__(self,rssi=False,gap=0.02):
+        self.rssi = rssi
+        self.gap = gap
+        self.buf = bytearray()
+        self.last = 0
+        self.unframed = 0
+        # cached noise rssi attached to every packet, set by the noise sampler
+        self.noise = None
+
+    def reset(self):
+        self.buf.clear()
+
+    def pending(self):
+        return len(self.buf) > 0
+
+    def feed(self,data,now):
+        # data is what has been read from the port at the time now,
+        # returns the list of packets completed by it
+        if data:
+            self.buf += data
+            self.last = now
+        tail = 1 if self.rssi else 0
+        packets = []
+        while len(self.buf) >= self.HEADER and self.buf[2] == self.MAGIC:
+            need = self.HEADER + self.buf[3] + tail
+            if len(self.buf) < need:
+                break
+            packets.append(self.packet(self.buf[:need],self.HEADER,tail,now))
+            del self.buf[:need]
+
+        # only an idle port tells the end of an unframed packet, bytes which
+        # were waiting in the driver during a busy loop belong together
+        if not data and self.buf and now - self.last > self.gap:
+            if len(self.buf) >= 2 + tail:
+                packets.append(self.packet(self.buf,2,tail,now))
+            self.unframed += 1
+            self.buf.clear()
+        return packets
+
+    def packet(self,frame,header,tail,now):
+        addr = (frame[0] << 8) + frame[1]
+        rssi = None
+        if tail:
+            rssi = -(256 - frame[-1])
+        return Packet(addr,bytes(frame[header:len(frame)-tail]),rssi,now,self.noise)
+
+
+class PacketRing:
+    # Fixed size ring of received packets between the reader thread and the
+    # consumers. When it is full the oldest packet is overwritten (DROP_OLDEST)
+    # or the new one is thrown away (DROP_NEWEST), both are counted in dropped.
+
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+
+    def __init__(self,size=64,policy=DROP_OLDEST):
+        self.slots = [None] * size
+        self.size = size
+        self.policy = policy
+        self.head = 0
+        self.count = 0
+        self.received = 0
+        self.dropped = 0
+        self.cond = threading.Condition()
+
+    def __len__(self):
+        return self.count
+
+    def put(self,packet):
+        with self.cond:
+            self.received += 1
+            if self.count == self.size:
+                self.dropped += 1
+                if self.policy == self.DROP_NEWEST:
+                    return
+                self.head = (self.head + 1) % self.size
+                self.count -= 1
+            self.slots[(self.head + self.count) % self.size] = packet
+            self.count += 1
+            self.cond.notify()
+
+    def get(self,timeout=None):
+        # wait up to timeout seconds (None is forever) for a packet, None if there is none
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.count > 0,timeout):
+                return None
+            packet = self.slots[self.head]
+            self.slots[self.head] = None
+            self.head = (self.head + 1) % self.size
+            self.count -= 1
+            return packet
+
+    def __iter__(self):
+        while True:
+            yield self.get()
+
+
+class Reassembler:
+    # Collects the fragments of send_large(), the payload of a fragment is
+    # [0xFA, message id, index (2 bytes), count (2 bytes), data...]
+    # Fragments may arrive in any order, an incomplete message is dropped
+    # when no fragment of it arrived for timeout seconds.
+
+    MARK = 0xFA
+    HEADER = 6
+
+    def __init__(self,timeout=30):
+        self.timeout = timeout
+        self.partial = {}
+        self.expired = 0
+
+    def is_fragment(self,packet):
+        return len(packet.data) >= self.HEADER and packet.data[0] == self.MARK
+
+    def feed(self,packet):
+        # returns the whole message as a Packet once its last fragment is in
+        self.expire(packet.time)
+        data = packet.data
+        key = (packet.addr,data[1])
+        index = (data[2] << 8) + data[3]
+        count = (data[4] << 8) + data[5]
+        if key not in self.partial or self.partial[key][0] != count:
+            self.partial[key] = [count,{},packet.time]
+        entry = self.partial[key]
+        entry[1][index] = data[self.HEADER:]
+        entry[2] = packet.time
+        if len(entry[1]) < count:
+            return None
+        del self.partial[key]
+        parts = entry[1]
+        return Packet(packet.addr,b''.join(parts[i] for i in range(count)),packet.rssi,packet.time,packet.noise)
+
+    def expire(self,now):
+        for key in [k for k,v in self.partial.items() if now - v[2] > self.timeout]:
+            del self.partial[key]
+            self.expired += 1
+
+
+
+# [target address, target channel] in front of a packet in fixed mode, the
+# module consumes it and sends the rest
+ROUTE = 3
+
+
+def packet_length(length):
+    # bytes on air for a message of length bytes with the header frame() puts in front of it
+    return FrameDecoder.HEADER + length
+
+
+def packet_time(length,air_speed):
+    # seconds on air for a message of length bytes
+    return time_on_air(packet_length(length),air_speed)
+
+
+def time_on_air(length,air_speed,preamble=8):
+    # seconds on air for a packet of length bytes (Semtech LoRa modem formula,
+    # explicit header, crc on, coding rate 4/5)
+    sf,bw = radio.LORA_PARAMS[air_speed]
+    t_sym = (2 ** sf) / (bw * 1000.0)
+    de = 1 if t_sym > 0.016 else 0
+    n_payload = 8 + max(math.ceil((8 * length - 4 * sf + 28 + 16) / (4.0 * (sf - 2 * de))) * 5,0)
+    return (preamble + 4.25 + n_payload) * t_sym
+
+
+class DutyCycleExceeded(Exception):
+    pass
+
+
+class DutyCycle:
+    # Sliding window of the time on air used by one node.
+    # limit is the allowed fraction of the window, e.g. 0.01 for 1% in the
+    # 868 MHz band or 0.1 for 10% in the 433 MHz band.
+
+    def __init__(self,limit=0.1,window=3600):
+        self.limit = limit
+        self.window = window
+        self.sent = collections.deque()
+        self.used = 0.0
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def expire(self,now):
+        while self.sent and self.sent[0][0] <= now - self.window:
+            self.used -= self.sent.popleft()[1]
+
+    def utilisation(self,now=None):
+        # fraction of the window spent on air
+        if now is None:
+            now = time.time()
+        with self.lock:
+            self.expire(now)
+            return self.used / self.window
+
+    def wait_time(self,airtime,now):
+        # seconds until airtime fits into the budget, None if it never does
+        with self.lock:
+            self.expire(now)
+            if airtime > self.limit * self.window:
+                return None
+            over = self.used + airtime - self.limit * self.window
+            wait = 0
+            for sent_at,t in self.sent:
+                if over <= 0:
+                    break
+                over -= t
+                wait = sent_at + self.window - now
+            return wait
+
+    def record(self,airtime,now):
+        with self.lock:
+            self.sent.append((now,airtime))
+            self.used += airtime
+            self.total += airtime
+
+
+class CarrierSense:
+    # Listen before talk on the noise rssi of the module. A channel is busy
+    # when its noise is more than margin dB over its floor, the floor follows
+    # the idle samples (alpha) and any lower one at once. A busy channel is
+    # sensed again after a random backoff of up to slot * 2^n seconds, n being
+    # the number of busy samples of this packet (at most max_exponent), and
+    # after max_attempts busy samples the packet is sent anyway.
+
+    def __init__(self,margin=6,slot=None,max_exponent=6,max_attempts=8,alpha=0.1):
+        self.margin = margin
+        self.slot = slot
+        self.max_exponent = max_exponent
+        self.max_attempts = max_attempts
+        self.alpha = alpha
+        self.floors = {}
+        # channel -> busy, idle and forced (sent while busy) counts
+        self.counts = collections.defaultdict(collections.Counter)
+        self.lock = threading.Lock()
+
+    def threshold(self,channel):
+        # the noise in dBm above which channel is busy, None before the first sample
+        floor = self.floors.get(channel)
+        return None if floor is None else floor + self.margin
+
+    def sample(self,channel,noise):
+        # count one noise sample of channel, True if the channel is busy
+        with self.lock:
+            floor = self.floors.get(channel)
+            busy = floor is not None and noise > floor + self.margin
+            if not busy:
+                self.floors[channel] = noise if floor is None or noise < floor else floor + self.alpha * (noise - floor)
+            self.counts[channel]['busy' if busy else 'idle'] += 1
+            return busy
+
+    def backoff(self,attempt,slot):
+        return random.uniform(0,slot * 2 ** min(attempt,self.max_exponent))
+
+    def busy_ratio(self,channel):
+        counts = self.counts[channel]
+        total = counts['busy'] + counts['idle']
+        return counts['busy'] / total if total else 0.0
 
 
 class sx126x:
@@ -16,14 +299,20 @@ class sx126x:
     # cfg_reg = [0xC0,0x00,0x09,0x00,0x00,0x00,0x62,0x00,0x17,0x00,0x00,0x00]
     cfg_reg = [0xC2,0x00,0x09,0x00,0x00,0x00,0x62,0x00,0x17,0x00,0x00,0x00]
     get_reg = bytes(12)
+    # registers 00H~08H as last acknowledged by the module, None if unknown
+    reg_shadow = None
     rssi = False
+    reading = False
     addr = 65535
     serial_n = ""
     send_to = 0
     addr_temp = 0
+    fixed = False
+    channel = 0
     freq = 868
     power = 22
     air_speed =2400
+    baud = 9600
 
     SX126X_UART_BAUDRATE_1200 = 0x00
     SX126X_UART_BAUDRATE_2400 = 0x20
@@ -33,6 +322,9 @@ class sx126x:
     SX126X_UART_BAUDRATE_38400 = 0xA0
     SX126X_UART_BAUDRATE_57600 = 0xC0
     SX126X_UART_BAUDRATE_115200 = 0xE0
+    # the UART rates by the bits 7-5 of 03H, in the order they are tried when the module is lost
+    UART_BAUDRATES = (1200,2400,4800,9600,19200,38400,57600,115200)
+    PROBE_ORDER = (9600,115200,57600,38400,19200,4800,2400,1200)
 
     SX126X_AIR_SPEED_300bps = 0x00
     SX126X_AIR_SPEED_1200bps = 0x01
@@ -53,13 +345,38 @@ class sx126x:
     SX126X_Power_13dBm = 0x02
     SX126X_Power_10dBm = 0x03
 
-    def __init__(self,serial_num,freq,addr,power,rssi):
+    # 06H bits 2-0, the WOR cycle (both ends must use the same one), and bit 3
+    SX126X_WOR_500ms = 0x00
+    SX126X_WOR_1000ms = 0x01
+    SX126X_WOR_1500ms = 0x02
+    SX126X_WOR_2000ms = 0x03
+    SX126X_WOR_2500ms = 0x04
+    SX126X_WOR_3000ms = 0x05
+    SX126X_WOR_3500ms = 0x06
+    SX126X_WOR_4000ms = 0x07
+    SX126X_WOR_TRANSMITTER = 0x08
+
+    def __init__(self,serial_num,freq,addr,power,rssi,fixed=False,baud=9600,m0=None,m1=None):
         self.rssi = rssi
+        # fixed=True uses the fixed-point transmission, every packet carries
+        # the target address and channel so the module is configured only once
+        self.fixed = fixed
+        # the UART rate set() writes to the module, see set_baud()
+        if self.uart_baud_cal(baud) is None:
+            raise ValueError(f"unsupported baud {baud}")
+        self.baud = baud
         self.addr = addr
         self.freq = freq
         self.serial_n = serial_num
         self.power = power
         self.send_to = addr
+        # every module has registers of its own, the class list is only the template,
+        # and a second HAT or USB module needs M0 and M1 on other pins than 22 and 27
+        self.cfg_reg = list(self.cfg_reg)
+        if m0 is not None:
+            self.M0 = m0
+        if m1 is not None:
+            self.M1 = m1
 
         # Initial the GPIO for M0 and M1 Pin
         GPIO.setmode(GPIO.BCM)
@@ -69,27 +386,87 @@ class sx126x:
         GPIO.output(self.M0,GPIO.LOW)
         GPIO.output(self.M1,GPIO.HIGH)
 
+        self.decoder = FrameDecoder(rssi)
+        self.frames = collections.deque()
+        # called with the packets decoded by others than the reader, see AsyncSX126x
+        self.on_packets = None
+
+        # the reader thread is started by start_reader(), the lock keeps it
+        # away from the port while the module is in the setting mode
+        self.ring = None
+        self.reader = None
+        self.io_lock = threading.Lock()
+        self.hold_lock = threading.Lock()
+        self.hold = 0
+
+        # time on air accounting, see set_duty_cycle()
+        self.duty = None
+        self.defer = True
+
+        # listen before talk, see set_lbt()
+        self.carrier = None
+
+        # M0, M1 between sends and settings, see wor() and sleep(),
+        # send() wakes the nodes of wor_peers with the WOR preamble
+        self.idle_pins = (GPIO.LOW,GPIO.LOW)
+        self.wor_peers = set()
+
+        # send_large() and recv_large()
+        self.msg_id = 0
+        self.reassembler = Reassembler()
+        self.large = collections.deque()
+        self.held = collections.deque()
+
+        # noise floor cache, see start_noise_sampler()
+        self.sampler = None
+        self.sampling = False
+        self.noise = None
+        self.noise_time = 0
+
+        # packet journal, see log_packet()
+        self.journal = None
+
         # The hardware UART of Pi3B+,Pi4B is /dev/ttyS0
-        self.ser = serial.Serial(serial_num,9600)
+        # if the module kept another rate from before, set() finds it
+        self.ser = serial.Serial(serial_num,baud)
         self.ser.flushInput()
         self.set(freq,addr,power,rssi)
+        if rssi:
+            self.start_noise_sampler()
 
     def set(self,freq,addr,power,rssi,air_speed=2400,\
             net_id=0,buffer_size = 240,crypt=0,\
-            relay=False,lbt=False,wor=False):
+            relay=False,lbt=None,wor=False,wor_period=2000):
+        # every argument is kept for reconfigure(), lbt=None keeps the listen
+        # before talk as it is (set_lbt() turns it on)
+        if lbt is None:
+            lbt = self.carrier is not None
+        # channel 0 is 850 MHz on the 868/915 MHz modules and 410 MHz on the 433/470 MHz ones
+        if freq >= 850:
+            freq_temp = freq - 850
+        elif freq >= 410:
+            freq_temp = freq - 410
+        else:
+            raise ValueError("frequency {0} MHz is below both bands".format(freq))
+        self.params = dict(freq=freq,addr=addr,power=power,rssi=rssi,air_speed=air_speed,
+                           net_id=net_id,buffer_size=buffer_size,crypt=crypt,
+                           relay=relay,lbt=lbt,wor=wor,wor_period=wor_period)
         self.send_to = addr
         self.addr = addr
-        # We should pull up the M1 pin when sets the module
-        GPIO.output(self.M0,GPIO.LOW)
-        GPIO.output(self.M1,GPIO.HIGH)
-        time.sleep(0.1)
         low_addr = addr & 0xff
         high_addr = addr >> 8 & 0xff
         net_id_temp = net_id & 0xff
-        if freq > 850:
-            freq_temp = freq - 850
-        elif freq >410:
-            freq_temp = freq - 410
+        self.channel = freq_temp
+        self.air_speed = air_speed
+        self.power = power
+        self.buffer_size = buffer_size
+        self.wor_period = wor_period
+        # the listen before talk of the driver, the one of the module (06H bit4)
+        # has neither counters nor a backoff to tune, so it stays off
+        if lbt and self.carrier is None:
+            self.carrier = CarrierSense()
+        elif not lbt:
+            self.carrier = None
 
         air_speed_temp = self.air_speed_cal(air_speed)
         # if air_speed_temp != None:
@@ -113,13 +490,31 @@ class sx126x:
         else:
             rssi_temp = 0x00
 
+        # the sixth bit of 06H register selects the fixed-point transmission,
+        # then the first three bytes of every packet are the target address and channel
+        if self.fixed:
+            fixed_temp = 0x40
+        else:
+            fixed_temp = 0x00
+
+        # relay=True is the repeater of the module (06H bit5): it passes on every packet
+        # between the two net ids given as the high and low byte of addr and is no node
+        # itself; the multi-hop forwarding between nodes is relay() below
+        relay_temp = 0x20 if relay else 0x00
+
+        # wor=True makes the module a WOR transmitter, it sends the preamble of
+        # one WOR cycle in the WOR mode; a WOR receiver listens once a cycle
+        wor_temp = self.wor_cal(wor_period)
+        if wor:
+            wor_temp += self.SX126X_WOR_TRANSMITTER
+
         l_crypt = crypt & 0xff
         h_crypt = crypt >> 8 & 0xff
 
         self.cfg_reg[3] = high_addr
         self.cfg_reg[4] = low_addr
         self.cfg_reg[5] = net_id_temp
-        self.cfg_reg[6] = self.SX126X_UART_BAUDRATE_9600 + air_speed_temp
+        self.cfg_reg[6] = self.uart_baud_cal(self.baud) + air_speed_temp
         #
         # it will enable to read noise rssi value when add 0x20 as follow
         #
@@ -129,77 +524,242 @@ class sx126x:
         # it will output a packet rssi value following received message
         # when enable seventh bit with 06H register(rssi_temp = 0x80)
         #
-        self.cfg_reg[9] = 0x03 + rssi_temp
+        self.cfg_reg[9] = wor_temp + fixed_temp + rssi_temp + relay_temp
         self.cfg_reg[10] = h_crypt
         self.cfg_reg[11] = l_crypt
+
+        # Compare with the register image the module acknowledged last time,
+        # nothing changed means we dont need to enter the setting mode at all
+        changed = self.reg_changes(self.cfg_reg[3:])
+        if changed is None:
+            return
+        start, end = changed
+
+        with self.exclusive():
+            done = self.write_cfg(start,end,rssi)
+            if not done and self.sync_baud() is not None:
+                # the module answers at another rate, e.g. it kept a saved one over a reboot,
+                # the registers read back are the shadow now so only the difference is written
+                changed = self.reg_changes(self.cfg_reg[3:])
+                done = changed is None or self.write_cfg(changed[0],changed[1],rssi)
+            if not done:
+                print("setting fail, press Esc to exit and run again")
+                time.sleep(2)
+                print('\x1b[1A',end='\r')
+
+    def reconfigure(self,**changes):
+        # set() again with the arguments of the last call, changes replace some of them
+        params = dict(self.params,**changes)
+        self.set(**params)
+
+    def set_baud(self,baud):
+        # Switch the UART to baud on both ends: the register is written at the current
+        # rate (and saved in the module), the port reopened at the new one and the
+        # registers read back there. A higher rate shortens every packet on the UART,
+        # a 240 byte packet takes 250 ms at 9600 and 21 ms at 115200.
+        if self.uart_baud_cal(baud) is None:
+            raise ValueError(f"unsupported baud {baud}")
+        self.baud = baud
+        self.reconfigure()
+        return self.ser.baudrate == baud
+
+    def write_cfg(self,start,end,rssi):
+        # returns True when the module acknowledged the registers
+        # We should pull up the M1 pin when sets the module
+        GPIO.output(self.M0,GPIO.LOW)
+        GPIO.output(self.M1,GPIO.HIGH)
+        time.sleep(0.1)
+
+        # only write the registers from the first to the last changed one,
+        # the frame is [header, start register, length, registers...]
+        # a new UART rate is saved (0xC0), the host opens the port at it after a reboot
+        baud = self.UART_BAUDRATES[self.cfg_reg[6] >> 5]
+        header = 0xC0 if baud != self.ser.baudrate else self.cfg_reg[0]
+        frame = [header,start,end-start] + self.cfg_reg[3+start:3+end]
         self.ser.flushInput()
+        self.decoder.reset()
+        self.decoder.rssi = bool(rssi)
 
+        done = False
         for i in range(2):
-            self.ser.write(bytes(self.cfg_reg))
-            r_buff = 0
-            time.sleep(0.2)
-            if self.ser.inWaiting() > 0:
-                time.sleep(0.1)
-                r_buff = self.ser.read(self.ser.inWaiting())
-                if r_buff[0] == 0xC1:
-                    pass
-                    # print("parameters setting is :",end='')
-                    # for i in self.cfg_reg:
-                        # print(hex(i),end=' ')
-
-                    # print('\r\n')
-                    # print("parameters return is  :",end='')
-                    # for i in r_buff:
-                        # print(hex(i),end=' ')
-                    # print('\r\n')
+            self.ser.write(bytes(frame))
+            r_buff = self.wait_reply(len(frame),0.3)
+            if len(r_buff) > 0:
+                if r_buff[0] == 0xC1 and list(r_buff[1:]) == frame[1:]:
+                    # keep the acknowledged registers as the shadow of the module
+                    self.reg_shadow = list(self.cfg_reg[3:])
+                    done = True
                 else:
-                    pass
+                    # the module is in an unknown state, write everything next time
+                    self.reg_shadow = None
                     #print("parameters setting fail :",r_buff)
                 break
             else:
+                self.reg_shadow = None
                 print("trying again!")
                 self.ser.flushInput()
                 time.sleep(0.2)
                 print('\x1b[1A',end='\r')
-                if i == 1:
-                    print("setting fail, press Esc to exit and run again")
-                    time.sleep(2)
-                    print('\x1b[1A',end='\r')
-                pass
 
+        if done and baud != self.ser.baudrate:
+            # the module answered at the old rate and uses the new one from now on
+            self.ser.baudrate = baud
+            regs = self.read_regs()
+            if regs is None or regs[:7] != self.cfg_reg[3:10]:
+                self.reg_shadow = None
+                done = False
+
+        self.rest()
+        time.sleep(0.1)
+        return done
+
+    def read_regs(self):
+        # registers 00H~08H as the module reports them, None without an answer,
+        # the module must be in the setting mode
+        self.ser.flushInput()
+        self.ser.write(bytes([0xC1,0x00,0x09]))
+        r_buff = self.wait_reply(12,0.3)
+        if len(r_buff) >= 12 and r_buff[:3] == bytes([0xC1,0x00,0x09]):
+            return list(r_buff[3:12])
+        return None
+
+    def readback(self):
+        # the registers 00H~08H the module holds now, None without an answer
+        with self.exclusive():
+            GPIO.output(self.M0,GPIO.LOW)
+            GPIO.output(self.M1,GPIO.HIGH)
+            time.sleep(0.1)
+            regs = self.read_regs()
+            self.rest()
+            time.sleep(0.1)
+        return regs
+
+    def sync_baud(self):
+        # Find the UART rate of the module by reading its registers at every rate,
+        # the rate of the port first. Returns the rate or None if the module never answered.
         GPIO.output(self.M0,GPIO.LOW)
-        GPIO.output(self.M1,GPIO.LOW)
+        GPIO.output(self.M1,GPIO.HIGH)
         time.sleep(0.1)
+        found = None
+        current = self.ser.baudrate
+        for baud in (current,) + tuple(b for b in self.PROBE_ORDER if b != current):
+            self.ser.baudrate = baud
+            regs = self.read_regs()
+            if regs is not None:
+                self.reg_shadow = regs
+                found = baud
+                break
+        if found is None:
+            self.ser.baudrate = current
+        self.rest()
+        time.sleep(0.1)
+        return found
 
-    def air_speed_cal(self,airSpeed):
-        air_speed_c = {
-            1200:self.SX126X_AIR_SPEED_1200bps,
-            2400:self.SX126X_AIR_SPEED_2400bps,
-            4800:self.SX126X_AIR_SPEED_4800bps,
-            9600:self.SX126X_AIR_SPEED_9600bps,
-            19200:self.SX126X_AIR_SPEED_19200bps,
-            38400:self.SX126X_AIR_SPEED_38400bps,
-            62500:self.SX126X_AIR_SPEED_62500bps
+    @contextlib.contextmanager
+    def exclusive(self):
+        # hold the reader thread off the serial port, it waits for hold to drop to 0
+        with self.hold_lock:
+            self.hold += 1
+        try:
+            with self.io_lock:
+                yield
+        finally:
+            with self.hold_lock:
+                self.hold -= 1
+
+    def start_reader(self,size=64,policy=PacketRing.DROP_OLDEST):
+        # drain the UART in a background thread into a ring of parsed packets,
+        # afterwards receive(), get() and iterating the node block on the ring
+        if self.reader is not None:
+            return
+        self.ring = PacketRing(size,policy)
+        # a read returns after this much silence, which also closes unframed packets
+        self.ser.timeout = self.decoder.gap
+        self.reading = True
+        self.reader = threading.Thread(target=self.read_loop,daemon=True)
+        self.reader.start()
+
+    def stop_reader(self):
+        if self.reader is None:
+            return
+        self.reading = False
+        self.reader.join()
+        self.reader = None
+
+    def read_loop(self):
+        while self.reading:
+            if self.hold:
+                time.sleep(0.001)
+                continue
+            with self.io_lock:
+                data = self.ser.read(max(1,self.ser.inWaiting()))
+                packets = self.decoder.feed(data,time.time())
+            for packet in packets:
+                self.ring.put(packet)
+
+    def get(self,timeout=None):
+        return self.ring.get(timeout)
+
+    def __iter__(self):
+        return iter(self.ring)
+
+    def reg_changes(self,regs):
+        # return (start, end) of the registers which differ from the shadow,
+        # or None when the module already holds the same settings
+        if self.reg_shadow is None:
+            return 0,len(regs)
+        diff = [i for i in range(len(regs)) if regs[i] != self.reg_shadow[i]]
+        if not diff:
+            return None
+        return diff[0],diff[-1]+1
+
+    def wait_reply(self,length,timeout):
+        # poll the serial port until the reply of the module is complete
+        # instead of sleeping for a fixed time
+        r_buff = b''
+        deadline = time.time() + timeout
+        while len(r_buff) < length and time.time() < deadline:
+            if self.ser.inWaiting() > 0:
+                r_buff += self.ser.read(self.ser.inWaiting())
+            else:
+                time.sleep(0.005)
+        return r_buff
+
+    # the register bits of a value, None when the module does not know it;
+    # the tables are in radio.py, remote_config and the emulator decode with them
+    def uart_baud_cal(self,baud):
+        if baud not in radio.BAUD:
+            return None
+        return radio.BAUD.index(baud) << 5
+
+    def wor_cal(self,period):
+        wor_c = {
+            500:self.SX126X_WOR_500ms,
+            1000:self.SX126X_WOR_1000ms,
+            1500:self.SX126X_WOR_1500ms,
+            2000:self.SX126X_WOR_2000ms,
+            2500:self.SX126X_WOR_2500ms,
+            3000:self.SX126X_WOR_3000ms,
+            3500:self.SX126X_WOR_3500ms,
+            4000:self.SX126X_WOR_4000ms
         }
-        return air_speed_c.get(airSpeed,None)
+        return wor_c.get(period,None)
+
+    def air_speed_cal(self,airSpeed):
+        # 300 bps is in the register but not offered
+        if airSpeed not in radio.AIR_SPEED[1:]:
+            return None
+        return radio.AIR_SPEED.index(airSpeed)
 
     def power_cal(self,power):
-        power_c = {
-            22:self.SX126X_Power_22dBm,
-            17:self.SX126X_Power_17dBm,
-            13:self.SX126X_Power_13dBm,
-            10:self.SX126X_Power_10dBm
-        }
-        return power_c.get(power,None)
+        if power not in radio.POWER:
+            return None
+        return radio.POWER.index(power)
 
     def buffer_size_cal(self,bufferSize):
-        buffer_size_c = {
-            240:self.SX126X_PACKAGE_SIZE_240_BYTE,
-            128:self.SX126X_PACKAGE_SIZE_128_BYTE,
-            64:self.SX126X_PACKAGE_SIZE_64_BYTE,
-            32:self.SX126X_PACKAGE_SIZE_32_BYTE
-        }
-        return buffer_size_c.get(bufferSize,None)
+        if bufferSize not in radio.BUFFER_SIZE:
+            return None
+        return radio.BUFFER_SIZE.index(bufferSize) << 6
 
     def get_settings(self):
         # the pin M1 of lora HAT must be high when enter setting mode and get parameters
@@ -242,135 +802,314 @@ class sx126x:
             print("Power is " + power_dic(power_temp))
             GPIO.output(self.M1,GPIO.LOW)
 
-    def send(self,data):
+    def send(self,data,dest=None,channel=None,wake=None):
+        # wake sends with the preamble of one WOR cycle which a node in the WOR
+        # mode hears, by default for the nodes in wor_peers
+        if isinstance(data,str):
+            data = data.encode()
+        if wake is None:
+            wake = dest in self.wor_peers
+
+        if dest is not None and not self.fixed:
+            # transparent transmission can only reach another node by
+            # borrowing its address for the time of sending
+            self.addr_temp = self.addr
+            self.reconfigure(addr=dest)
+            self.send(data,wake=wake)
+            self.reconfigure(addr=self.addr_temp)
+            return
+
+        frame,wake,wait = self.prepare(data,dest,channel,wake)
+        time.sleep(wait)
+        self.transmit(frame,wake)
+
+    def prepare(self,data,dest=None,channel=None,wake=None):
+        # (frame, wake, seconds the duty cycle holds it back) of one packet,
+        # the steps of send() before the wait, shared with AsyncSX126x.send()
+        if isinstance(data,str):
+            data = data.encode()
+        if wake is None:
+            wake = dest in self.wor_peers
+        if wake and not self.params['wor']:
+            self.reconfigure(wor=True)
+        frame = self.frame(data,dest,channel)
+        return frame,wake,self.reserve(frame,wake)
+
+    def transmit(self,frame,wake=False):
+        # put frame on the air once the duty cycle allows it
         GPIO.output(self.M1,GPIO.LOW)
         GPIO.output(self.M0,GPIO.LOW)
         time.sleep(0.1)
 
-        # add the node address ,and the node of address is 65535 can able to find who sends message
-        l_addr = self.addr_temp & 0xff
-        h_addr = self.addr_temp >> 8 & 0xff
-
-        self.ser.write(bytes([h_addr,l_addr])+data.encode())
+        # the module answers the noise read of the listen before talk only in
+        # the normal mode, the WOR mode is switched on after it
+        self.clear_channel(frame)
+        if wake:
+            GPIO.output(self.M0,GPIO.HIGH)
+            time.sleep(0.1)
+        # a noise read between its command and the reply must not get our frame in between
+        with self.io_lock:
+            self.ser.write(frame)
         # if self.rssi == True:
             # self.get_channel_rssi()
         time.sleep(0.1)
+        if wake or self.idle_pins != (GPIO.LOW,GPIO.LOW):
+            # switching the mode would cut the packet off
+            time.sleep(self.airtime(frame,wake))
+            self.rest()
+
+    def send_large(self,dest,data):
+        # send data of any length, it is split into fragments which fit the
+        # configured packet size and written back to back, see recv_large()
+        if isinstance(data,str):
+            data = data.encode()
+        size = min(self.buffer_size,0xff) - FrameDecoder.HEADER - Reassembler.HEADER
+        chunks = [data[i:i+size] for i in range(0,len(data),size)] or [b'']
+        count = len(chunks)
+        if count > 0xffff:
+            raise ValueError("message is too long")
+        self.msg_id = (self.msg_id + 1) & 0xff
+
+        if not self.fixed:
+            self.addr_temp = self.addr
+            self.reconfigure(addr=dest)
+
+        # a node in the WOR mode sleeps again after every packet, each fragment wakes it
+        wake = dest in self.wor_peers
+        if wake and not self.params['wor']:
+            self.reconfigure(wor=True)
+        GPIO.output(self.M1,GPIO.LOW)
+        GPIO.output(self.M0,GPIO.LOW)
+        time.sleep(0.1)
+        woken = False
+        for index,chunk in enumerate(chunks):
+            header = bytes([Reassembler.MARK,self.msg_id,index >> 8,index & 0xff,count >> 8,count & 0xff])
+            frame = self.frame(header+chunk,dest)
+            time.sleep(self.reserve(frame,wake))
+            # listen in the normal mode, see send()
+            if woken and self.carrier is not None:
+                GPIO.output(self.M0,GPIO.LOW)
+                time.sleep(0.1)
+                woken = False
+            self.clear_channel(frame)
+            if wake and not woken:
+                GPIO.output(self.M0,GPIO.HIGH)
+                time.sleep(0.1)
+                woken = True
+            self.ser.write(frame)
+            # the module sends one packet at a time, give it the time on air
+            # of this one instead of a fixed sleep
+            time.sleep(self.airtime(frame,wake))
+        self.rest()
+
+        if not self.fixed:
+            self.reconfigure(addr=self.addr_temp)
+
+    def set_duty_cycle(self,limit=0.1,window=3600,defer=True):
+        # keep the time on air of this node under limit (fraction of window seconds),
+        # a send over budget waits for it (defer) or raises DutyCycleExceeded
+        self.duty = DutyCycle(limit,window)
+        self.defer = defer
+
+    def set_lbt(self,margin=6,slot=None,max_exponent=6,max_attempts=8):
+        # sense the channel before every packet, slot is the backoff unit in seconds
+        # (None: the time on air of the packet), see CarrierSense
+        self.carrier = CarrierSense(margin,slot,max_exponent,max_attempts)
+        self.params['lbt'] = True
+
+    def clear_channel(self,frame):
+        # wait until the channel is idle, returns False if frame goes out on a busy
+        # channel (or without an answer of the module)
+        carrier = self.carrier
+        if carrier is None:
+            return True
+        slot = carrier.slot or self.airtime(frame)
+        for attempt in range(carrier.max_attempts):
+            noise = self.read_noise()
+            if noise is None:
+                return False
+            if not carrier.sample(self.channel,noise):
+                # an idle sample is a sample of the noise floor too
+                self.noise = self.decoder.noise = noise
+                self.noise_time = time.time()
+                return True
+            time.sleep(carrier.backoff(attempt,slot))
+        with carrier.lock:
+            carrier.counts[self.channel]['forced'] += 1
+        return False
+
+    def channel_stats(self):
+        # {channel: {'busy': n, 'idle': n, 'forced': n}} of the listen before talk
+        if self.carrier is None:
+            return {}
+        with self.carrier.lock:
+            return {channel: dict(counts) for channel,counts in self.carrier.counts.items()}
+
+    def airtime(self,frame,wake=False):
+        # the module consumes the target address and channel in fixed mode
+        length = len(frame) - ROUTE if self.fixed else len(frame)
+        if not wake:
+            return time_on_air(length,self.air_speed)
+        # the WOR preamble lasts one WOR cycle
+        sf,bw = radio.LORA_PARAMS[self.air_speed]
+        return time_on_air(length,self.air_speed,preamble=self.wor_period * bw / 2 ** sf)
+
+    def utilisation(self):
+        if self.duty is None:
+            return 0.0
+        return self.duty.utilisation()
+
+    def reserve(self,frame,wake=False):
+        # book the time on air of frame, returns how long to wait before sending it
+        if self.duty is None:
+            return 0
+        airtime = self.airtime(frame,wake)
+        now = time.time()
+        wait = self.duty.wait_time(airtime,now)
+        if wait is None or (wait > 0 and not self.defer):
+            raise DutyCycleExceeded("{0:.3f}s on air would exceed the duty cycle ({1:.1%} used)".format(airtime,self.utilisation()))
+        self.duty.record(airtime,now + wait)
+        return wait
+
+    def frame(self,data,dest=None,channel=None):
+        # the bytes written to the module for one packet
+        if len(data) > 0xff:
+            raise ValueError("message is longer than 255 bytes")
+
+        if self.fixed:
+            # [target address, target channel] is consumed by the module,
+            # the receiver gets our own address followed by the message
+            if dest is None:
+                dest = self.send_to
+            if channel is None:
+                channel = self.channel
+            header = bytes([dest >> 8 & 0xff,dest & 0xff,channel,self.addr >> 8 & 0xff,self.addr & 0xff])
+        else:
+            # add the node address ,and the node of address is 65535 can able to find who sends message
+            l_addr = self.addr_temp & 0xff
+            h_addr = self.addr_temp >> 8 & 0xff
+            header = bytes([h_addr,l_addr])
+
+        # the receiver splits the packets with the marker and the length byte
+        return header+bytes([FrameDecoder.MAGIC,len(data)])+data
+
+    def receive_packet(self,timeout=0):
+        # return the next complete packet, or None if there is none after timeout seconds,
+        # fragments of send_large() are kept back for recv_large()
+        deadline = None if timeout is None else time.time() + timeout
+        if self.held:
+            return self.held.popleft()
+        while True:
+            packet = self.next_packet(deadline)
+            if packet is None or not self.reassembler.is_fragment(packet):
+                return packet
+            message = self.reassembler.feed(packet)
+            if message is not None:
+                self.large.append(message)
+
+    def recv_large(self,timeout=None):
+        # return the next message of send_large() as a Packet, or None after timeout seconds,
+        # other packets received meanwhile are kept for receive_packet()
+        deadline = None if timeout is None else time.time() + timeout
+        while not self.large:
+            packet = self.next_packet(deadline)
+            if packet is None:
+                return None
+            if self.reassembler.is_fragment(packet):
+                message = self.reassembler.feed(packet)
+                if message is not None:
+                    self.large.append(message)
+            else:
+                self.held.append(packet)
+        return self.large.popleft()
+
+    def next_packet(self,deadline):
+        # the next packet from the reader thread or the port, None when deadline
+        # (None waits forever) has passed
+        if self.reader is not None:
+            return self.ring.get(None if deadline is None else max(deadline - time.time(),0))
+        while not self.frames:
+            with self.io_lock:
+                waiting = self.ser.inWaiting()
+                if waiting > 0:
+                    self.frames.extend(self.decoder.feed(self.ser.read(waiting),time.time()))
+                    continue
+                self.frames.extend(self.decoder.feed(b'',time.time()))
+            # a started frame is waited for until it completes or the port goes quiet
+            if not self.frames and not self.decoder.pending() and deadline is not None and time.time() >= deadline:
+                return None
+            if not self.frames:
+                time.sleep(0.002)
+        return self.frames.popleft()
 
-    def receive(self):
-        if self.ser.inWaiting() > 0:
-            time.sleep(0.5)
-            r_buff = self.ser.read(self.ser.inWaiting())
+    def receive(self,timeout=0):
+        packet = self.receive_packet(timeout)
+        if packet is None:
+            return None
 
-            node_address = (r_buff[0] << 8) + r_buff[1]
-            print(f"receive message from address \033[1;32m{node_address} node\033[0m {r_buff[2:]}")
+        print(f"receive message from address \033[1;32m{packet.addr} node\033[0m {packet.data}")
 
-            try:
-                message_str = r_buff.decode('utf-8')
-            except UnicodeDecodeError as e:
-                print(f"Error decoding message: {e}")
-                print(f"Raw data: {r_buff}")
-                return None  # Return None to indicate an error
+        try:
+            message_str = packet.data.decode('utf-8')
+        except UnicodeDecodeError as e:
+            print(f"Error decoding message: {e}")
+            print(f"Raw data: {packet.data}")
+            return None  # Return None to indicate an error
 
-            try:
-                start = message_str.find('{')  # Find the first opening curly brace
-                end = message_str.rfind('}') + 1 # Find the last closing curly brace
-                if start != -1 and end != -1:
-                    json_message = message_str[start:end]
-                else:
-                    print("Message format error, no JSON found")
-                    print("Raw data: " + message_str)
-                    return message_str # Return None to indicate an error
+        current_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        print(f"@ [{current_time}] ")
 
-            except Exception as e:
-                print(f"Error extracting JSON: {e}")
-                print("Raw data: " + message_str)
-                return None # Return None to indicate an error
+        if self.rssi and packet.rssi is not None:
+            print(f"the packet rssi value: {packet.rssi}dBm")
+            # the noise floor comes from the sampler cache, the port is not touched here
+            self.log_packet(packet)
+        print(f"receive    {message_str} ")
 
-            current_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-            print(f"@ [{current_time}] ")
-            rssi = 256 - r_buff[-1:][0]
-            print(f"the packet rssi value: -{rssi}dBm")
-            self.get_channel_rssi()
-            e = datetime.datetime.now()
-            with open("g.txt", "a") as f:
-                f.write(f"Packet RSSI: -{rssi}dBm Current date and time = {e}\n")
-            print(f"@ [{rssi}]dBm ")
-
-            
-
-            if self.rssi:
-                    rssi = 256 - r_buff[-1:][0]
-                    print(f"the packet rssi value: -{rssi}dBm")
-                    self.get_channel_rssi()
-                    e = datetime.datetime.now()
-                    with open("g.txt", "a") as f:
-                        f.write(f"Packet RSSI: -{rssi}dBm Current date and time = {e}\n")
-            print(f"receive    {json_message} ")
-            
-            return json_message  # Return the complete JSON string
-
-            # else:
-            #     pass
-                #print('\x1b[2A',end='\r')
-
-
-    def receivetemp(self):
-        if self.ser.inWaiting() > 0:
-            time.sleep(0.5)
-            r_buff = self.ser.read(self.ser.inWaiting())
+        return message_str  # Return the complete message of the packet
 
-            # Check if the buffer has enough bytes (address + message + RSSI)
-            if len(r_buff) < 3:
-                print("Incomplete packet")
-                return None
 
-            # Extract node address (first two bytes)
-            node_address = (r_buff[0] << 8) + r_buff[1]
-            print(f"Receive message from address \033[1;32m{node_address} node\033[0m")
-
-            # Extract RSSI (last byte)
-            rssi_byte = r_buff[-1]
-            rssi = 256 - rssi_byte
-            print(f"Packet RSSI value: -{rssi}dBm")
+    def receivetemp(self,timeout=0):
+        packet = self.receive_packet(timeout)
+        if packet is None:
+            return None
 
-            # Extract message (bytes between address and RSSI)
-            message_bytes = r_buff[2:-1]
+        print(f"Receive message from address \033[1;32m{packet.addr} node\033[0m")
+        if packet.rssi is not None:
+            print(f"Packet RSSI value: {packet.rssi}dBm")
 
-            try:
-                # Decode the message part (excluding address and RSSI)
-                message_str = message_bytes.decode('utf-8')
-            except UnicodeDecodeError as e:
-                print(f"Error decoding message: {e}")
-                print(f"Raw message data: {message_bytes}")
-                return None
+        try:
+            # Decode the message part (excluding address and RSSI)
+            message_str = packet.data.decode('utf-8')
+        except UnicodeDecodeError as e:
+            print(f"Error decoding message: {e}")
+            print(f"Raw message data: {packet.data}")
+            return None
 
-            # Extract JSON from the message string
-            try:
-                start = message_str.find('{')
-                end = message_str.rfind('}') + 1
-                if start != -1 and end != -1:
-                    json_message = message_str[start:end]
-                else:
-                    print("No JSON found in message")
-                    print(f"Message content: {message_str}")
-                    return None
-            except Exception as e:
-                print(f"Error extracting JSON: {e}")
-                return None
+        # the packet is complete, it should be a JSON object as a whole
+        if not message_str.startswith('{'):
+            print("No JSON found in message")
+            print(f"Message content: {message_str}")
+            return None
 
-            # Logging and additional processing
-            current_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-            print(f"@ [{current_time}] Received: {json_message}")
+        # Logging and additional processing
+        current_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        print(f"@ [{current_time}] Received: {message_str}")
 
-            with open("g.txt", "a") as f:
-                e = datetime.datetime.now()
-                f.write(f"Packet RSSI: -{rssi}dBm Current date and time = {e}\n")
+        if packet.rssi is not None:
+            self.log_packet(packet)
 
-            return json_message
+        return message_str
     
 
              
 
+    def log_packet(self,packet):
+        # the journal of received packets (see journal.py), it is opened with the
+        # first packet and written to the disk in batches by its own thread
+        if self.journal is None:
+            self.journal = journal.Journal()
+        self.journal.write(packet)
+
     def process_received_data(node, received_data):  # New helper function
         if received_data is None:
             return None
@@ -410,27 +1149,242 @@ class sx126x:
     
 
     def get_channel_rssi(self):
-        GPIO.output(self.M1,GPIO.LOW)
-        GPIO.output(self.M0,GPIO.LOW)
-        time.sleep(0.1)
-        self.ser.flushInput()
-        self.ser.write(bytes([0xC0,0xC1,0xC2,0xC3,0x00,0x02]))
-        time.sleep(0.5)
-        re_temp = bytes(5)
-        if self.ser.inWaiting() > 0:
-            time.sleep(0.1)
-            re_temp = self.ser.read(self.ser.inWaiting())
-        if re_temp[0] == 0xC1 and re_temp[1] == 0x00 and re_temp[2] == 0x02:
-            # print("the current noise rssi value: -{0}dBm".format(256-re_temp[3]))
-            f=open("g.txt","a")
-            print("Noise RSSI value: -{0}dBm".format(256-re_temp[3]))
-            f.write("Noise RSSI: -{0}dBm ".format(256-re_temp[3]))
-            f.close()
+        # read the noise floor now, returns it in dBm (None if the module did not answer)
+        noise = self.sample_noise()
+        if noise is not None:
+            print("Noise RSSI value: {0}dBm".format(noise))
         else:
-            # pass
             print("Receive RSSI value failed!")
-            # print("receive rssi value fail: ",re_temp)
+        return noise
+
+    def sample_noise(self):
+        # read the noise floor and keep it for Packet.noise and noise_rssi()
+        noise = self.read_noise()
+        if noise is not None:
+            self.noise = self.decoder.noise = noise
+            self.noise_time = time.time()
+        return noise
+
+    def read_noise(self):
+        # The module answers the noise read C0 C1 C2 C3 00 02 with C1 00 02 noise lastrssi
+        # in the normal mode, so neither the mode is switched nor the input flushed.
+        # Bytes of a packet which arrive meanwhile go to the decoder as usual.
+        with self.exclusive():
+            self.ser.write(bytes([0xC0,0xC1,0xC2,0xC3,0x00,0x02]))
+            r_buff = bytearray()
+            deadline = time.time() + 0.3
+            while True:
+                waiting = self.ser.inWaiting()
+                if waiting > 0:
+                    r_buff += self.ser.read(waiting)
+                i = r_buff.find(b'\xc1\x00\x02')
+                if (i >= 0 and len(r_buff) >= i + 5) or time.time() >= deadline:
+                    break
+                time.sleep(0.005)
+
+            noise = None
+            if i >= 0 and len(r_buff) >= i + 5:
+                noise = -(256 - r_buff[i+3])
+                del r_buff[i:i+5]
+            packets = self.decoder.feed(bytes(r_buff),time.time()) if r_buff else []
+        if packets and self.on_packets is not None:
+            self.on_packets(packets)
+            packets = []
+        for packet in packets:
+            if self.ring is not None:
+                self.ring.put(packet)
+            else:
+                self.frames.append(packet)
+        return noise
+
+    def start_noise_sampler(self,interval=10,idle=0.5):
+        # Sample the noise floor every interval seconds in a background thread, but
+        # only after the UART has been quiet for idle seconds. Received packets carry
+        # the latest value in Packet.noise, noise_rssi() returns it with its time.
+        if self.sampler is not None:
+            return
+        self.sampling = True
+        self.sampler = threading.Thread(target=self.sample_loop,args=(interval,idle),daemon=True)
+        self.sampler.start()
+
+    def stop_noise_sampler(self):
+        if self.sampler is None:
+            return
+        self.sampling = False
+        self.sampler.join()
+        self.sampler = None
+
+    def close(self):
+        # stop the threads of the node and write out what the journal still
+        # buffers (its last batch is lost without this), then free the port
+        self.stop_reader()
+        self.stop_noise_sampler()
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        self.ser.close()
+
+    def sample_loop(self,interval,idle):
+        next_time = time.time()
+        while self.sampling:
+            now = time.time()
+            wait = max(next_time - now,self.decoder.last + idle - now)
+            if wait > 0:
+                time.sleep(min(wait,0.1))
+                continue
+            # a packet on its way or a mode switch has the port, try again later
+            if self.hold or self.decoder.pending() or self.ser.inWaiting() > 0:
+                time.sleep(0.05)
+                continue
+            # the module in the WOR or sleep mode does not answer the noise read
+            if self.idle_pins != (GPIO.LOW,GPIO.LOW):
+                next_time = time.time() + interval
+                continue
+            self.sample_noise()
+            next_time = time.time() + interval
+
+    def noise_rssi(self):
+        # (noise floor in dBm, time it was sampled), the value is None before the first sample
+        return self.noise,self.noise_time
+
+    def rest(self):
+        # put the module back into the mode it waits in
+        GPIO.output(self.M0,self.idle_pins[0])
+        GPIO.output(self.M1,self.idle_pins[1])
+
+    def wor(self,period=None):
+        # Listen in the WOR mode: the module wakes up once every period ms (500 to 4000)
+        # and hears only the packets sent with the WOR preamble (send() to a node in
+        # wor_peers). Packets come in as usual between the sleeps of the module, the
+        # host can block in receive_packet() or get() up to a cycle at a time, a command
+        # waits at most one cycle. send() switches to the normal mode and back.
+        changes = {}
+        if period is not None and period != self.wor_period:
+            changes['wor_period'] = period
+        if self.params['wor']:
+            # a WOR transmitter does not listen in the WOR mode
+            changes['wor'] = False
+        if changes:
+            self.reconfigure(**changes)
+        self.idle_pins = (GPIO.HIGH,GPIO.LOW)
+        self.rest()
+        time.sleep(0.1)
+
+    def sleep(self):
+        # deep sleep, the module neither sends nor receives until wake() or send()
+        self.idle_pins = (GPIO.HIGH,GPIO.HIGH)
+        self.rest()
+        time.sleep(0.1)
+
+    def wake(self):
+        # back to the normal mode, continuous receive
+        self.idle_pins = (GPIO.LOW,GPIO.LOW)
+        self.rest()
+        time.sleep(0.1)
+
+    def relay(self,**options):
+        # multi-hop forwarding over the other nodes, returns the mesh.Mesh of this node
+        # which sends and receives like the node itself
+        import mesh
+        return mesh.Mesh(self,**options)
+
+    def remote_config(self,link,**options):
+        # let the gateway change the settings of this node over the air through link,
+        # returns the remote_config.Agent which receives in place of link
+        import remote_config
+        return remote_config.Agent(self,link,**options)
+
+
+class AsyncSX126x:
+    # asyncio front end of a sx126x node for the WebSocket and web bridges.
+    # The serial port is watched by the event loop (loop.add_reader), so
+    # packets are decoded in the loop itself without any thread or executor.
+    # send() runs the mode switches and the listen before talk of
+    # sx126x.transmit() in the executor, only the duty cycle wait is awaited.
+    # Dont start the reader thread of the node together with it.
+
+    def __init__(self,node,size=64):
+        self.node = node
+        self.queue = asyncio.Queue(size)
+        self.dropped = 0
+        self.loop = None
+        self.idle = None
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.loop.add_reader(self.node.ser.fileno(),self.on_readable)
+        # packets a noise read decoded in another thread
+        loop = self.loop
+        self.node.on_packets = lambda packets: loop.call_soon_threadsafe(self.deliver,packets)
+
+    def close(self):
+        if self.loop is not None:
+            self.node.on_packets = None
+            self.loop.remove_reader(self.node.ser.fileno())
+            if self.idle is not None:
+                self.idle.cancel()
+            self.loop = None
+
+    def rearm(self):
+        if self.loop is not None:
+            self.loop.add_reader(self.node.ser.fileno(),self.on_readable)
+
+    def on_readable(self):
+        # the noise sampler may hold the port for the moment of its reply, the
+        # loop must not block on it; the port stays readable, so the reader is
+        # taken off the loop for a moment instead of being called again at once
+        if not self.node.io_lock.acquire(blocking=False):
+            self.loop.remove_reader(self.node.ser.fileno())
+            self.loop.call_later(0.005,self.rearm)
+            return
+        try:
+            waiting = self.node.ser.inWaiting()
+            data = self.node.ser.read(waiting) if waiting > 0 else b''
+            packets = self.node.decoder.feed(data,time.time())
+        finally:
+            self.node.io_lock.release()
+        self.deliver(packets)
+
+    def on_idle(self):
+        # nothing came in for a while, let the decoder close an unframed packet
+        self.idle = None
+        self.deliver(self.node.decoder.feed(b'',time.time()))
+
+    def deliver(self,packets):
+        for packet in packets:
+            # messages of send_large() come out whole
+            if self.node.reassembler.is_fragment(packet):
+                packet = self.node.reassembler.feed(packet)
+                if packet is None:
+                    continue
+            if self.queue.full():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.queue.put_nowait(packet)
+        if self.node.decoder.pending() and self.idle is None and self.loop is not None:
+            self.idle = self.loop.call_later(self.node.decoder.gap * 1.5,self.on_idle)
+
+    async def recv(self,timeout=None):
+        # the next packet, or None if there is none after timeout seconds
+        try:
+            return await asyncio.wait_for(self.queue.get(),timeout)
+        except asyncio.TimeoutError:
+            return None
 
-    #def relay(self):
-    #def wor(self):
-    #def remote_config(self):
+    async def send(self,data,dest=None,channel=None):
+        if isinstance(data,str):
+            data = data.encode()
+        if dest is not None and not self.node.fixed:
+            # needs the setting mode of the module, keep the blocking path out of the loop
+            await self.loop.run_in_executor(None,self.node.send,data,dest,channel)
+            return
+        # the wake up of WOR nodes may switch the module to the setting mode first
+        frame,wake,wait = await self.loop.run_in_executor(None,self.node.prepare,data,dest,channel)
+        await asyncio.sleep(wait)
+        await self.loop.run_in_executor(None,self.node.transmit,frame,wake)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.queue.get()
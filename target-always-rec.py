@@ -98,4 +98,5 @@ except Exception as e:
     print(f"An error occurred: {e}")
 finally:
     termios.tcsetattr(sys.stdin, termios.TCSADRAIN, old_settings)
+    node.close()
     GPIO.cleanup()  # Clean up GPIO on exit
\ No newline at end of file
@@ -0,0 +1,76 @@
+# Checks of the vectorised link statistics of analytics.py against plain
+# loops, no radio needed
+#
+#    python -m unittest test_analytics
+
+import unittest
+
+import numpy as np
+
+import analytics
+
+
+def naive_rolling(values, window, groups, reduce):
+    # the last window values of the same group at every position
+    out = []
+    for i in range(len(values)):
+        same = [v for v, g in zip(values[:i + 1], groups[:i + 1]) if g == groups[i]]
+        last = [v for v in same[-window:] if not np.isnan(v)]
+        out.append(reduce(last) if last else np.nan)
+    return np.array(out)
+
+
+class RollingTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.values = rng.normal(-90, 8, 200)
+        self.values[rng.random(200) < 0.1] = np.nan
+        self.groups = rng.integers(0, 4, 200)
+
+    def test_rolling_mean_per_node(self):
+        expected = naive_rolling(self.values, 7, self.groups, np.mean)
+        np.testing.assert_allclose(analytics.rolling_mean(self.values, 7, self.groups), expected)
+
+    def test_rolling_percentile_per_node(self):
+        expected = naive_rolling(self.values, 9, self.groups, lambda v: np.percentile(v, 10))
+        got = analytics.rolling_percentile(self.values, 9, 10, self.groups, block=16)
+        np.testing.assert_allclose(got, expected)
+
+    def test_without_groups_the_window_spans_every_row(self):
+        ones = np.zeros(len(self.values), int)
+        np.testing.assert_allclose(analytics.rolling_mean(self.values, 5),
+                                   naive_rolling(self.values, 5, ones, np.mean))
+
+
+class LinkStatsTest(unittest.TestCase):
+
+    def history(self):
+        # node 30 every 10 s with the packets at 30 and 40 s lost, node 31 every 5 s
+        t30 = np.array([0, 10, 20, 50, 60], float)
+        t31 = np.arange(0, 65, 5, dtype=float)
+        time = np.concatenate((t30, t31))
+        node = np.array([30] * len(t30) + [31] * len(t31))
+        rssi = np.concatenate((np.full(len(t30), -100.0), np.full(len(t31), -80.0)))
+        return analytics.make_history(time, node, rssi, rssi - 20)
+
+    def test_packet_loss_from_the_median_gap(self):
+        nodes, received, lost, rate = analytics.packet_loss(self.history())
+        self.assertEqual(list(nodes), [30, 31])
+        self.assertEqual(list(received), [5, 13])
+        self.assertEqual(list(lost), [2, 0])
+        self.assertAlmostEqual(rate[0], 2 / 7)
+
+    def test_outages(self):
+        nodes, start, end = analytics.outages(self.history(), threshold=15)
+        self.assertEqual((list(nodes), list(start), list(end)), ([30], [20.0], [50.0]))
+
+    def test_node_stats(self):
+        stats = analytics.node_stats(self.history())
+        self.assertEqual(list(stats["count"]), [5, 13])
+        np.testing.assert_allclose(stats["rssi_mean"], [-100, -80])
+        np.testing.assert_allclose(stats["snr_mean"], [20, 20])
+
+
+if __name__ == '__main__':
+    unittest.main()
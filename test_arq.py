@@ -0,0 +1,109 @@
+# Checks of the selective repeat of arq.py over a wire of two fake nodes,
+# no radio needed
+#
+#    python -m unittest test_arq
+
+import time
+import unittest
+import collections
+
+import arq
+
+Packet = collections.namedtuple('Packet', ['addr', 'data', 'rssi', 'time', 'noise'])
+
+
+class Node:
+    # the part of sx126x the link uses; frames go straight to the peer, a
+    # peer with a handler handles them at once, the other one reads them
+    # with receive_packet()
+
+    def __init__(self, addr):
+        self.addr = addr
+        self.peer = None
+        self.handler = None
+        self.lose = lambda data: False
+        self.inbox = collections.deque()
+        self.sent = []
+
+    def send(self, data, dest=None):
+        self.sent.append(bytes(data))
+        if self.lose(data):
+            return
+        packet = Packet(self.addr, bytes(data), None, time.time(), None)
+        if self.peer.handler is not None:
+            self.peer.handler(packet)
+        else:
+            self.peer.inbox.append(packet)
+
+    def receive_packet(self, timeout=0):
+        if self.inbox:
+            return self.inbox.popleft()
+        time.sleep(min(timeout, 0.005))
+        return None
+
+
+def frame(session, seq, base, message):
+    return Packet(1, bytes([arq.DATA, session, seq, base]) + message, None, 0.0, None)
+
+
+class ArqTest(unittest.TestCase):
+
+    def setUp(self):
+        self.home, self.motor = Node(1), Node(2)
+        self.home.peer, self.motor.peer = self.motor, self.home
+        self.sender = arq.Link(self.home)
+        self.sender.rto[2] = arq.Rto(initial=0.05, min_rto=0.05)
+        self.receiver = arq.Link(self.motor)
+        self.motor.handler = self.receiver.handle
+
+    def delivered(self):
+        return [p.data for p in self.receiver.inbox]
+
+    def test_out_of_order_frames_are_delivered_in_order(self):
+        self.receiver.handle(frame(7, 1, 0, b'b'))
+        self.assertEqual(self.delivered(), [])
+        self.receiver.handle(frame(7, 0, 0, b'a'))
+        self.assertEqual(self.delivered(), [b'a', b'b'])
+        # every copy is acknowledged
+        self.assertEqual(self.home.inbox[0].data, bytes([arq.ACK, 7, 1]))
+        self.assertEqual(len(self.home.inbox), 2)
+
+    def test_repeated_frame_is_acknowledged_but_not_delivered_again(self):
+        self.receiver.handle(frame(7, 0, 0, b'a'))
+        self.receiver.handle(frame(7, 0, 0, b'a'))
+        self.assertEqual(self.delivered(), [b'a'])
+        self.assertEqual((self.receiver.duplicates, len(self.home.inbox)), (1, 2))
+
+    def test_only_the_lost_frame_is_sent_again(self):
+        lost = []
+
+        def lose_first_copy_of_b(data):
+            if data[0] == arq.DATA and data[4:] == b'b' and not lost:
+                lost.append(data)
+                return True
+            return False
+        self.home.lose = lose_first_copy_of_b
+        self.assertEqual(self.sender.send_many(2, [b'a', b'b', b'c']), [])
+        self.assertEqual(self.delivered(), [b'a', b'b', b'c'])
+        self.assertEqual(self.sender.retransmissions, 1)
+        self.assertEqual([d[4:] for d in self.home.sent], [b'a', b'b', b'c', b'b'])
+
+    def test_a_dead_link_gives_up(self):
+        self.sender.max_retries = 2
+        self.home.lose = lambda data: True
+        self.assertFalse(self.sender.send(2, b'a'))
+        self.assertEqual(len(self.home.sent), 3)
+
+    def test_new_session_resets_the_receiver(self):
+        self.receiver.handle(frame(7, 0, 0, b'a'))
+        self.receiver.handle(frame(8, 0, 0, b'again'))
+        self.assertEqual(self.delivered(), [b'a', b'again'])
+
+    def test_other_packets_pass_through(self):
+        self.receiver.handle(Packet(1, b'CPU Temperature:50.0 C', None, 0.0, None))
+        self.assertEqual(self.delivered(), [b'CPU Temperature:50.0 C'])
+        self.assertEqual(len(self.home.inbox), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
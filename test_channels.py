@@ -0,0 +1,72 @@
+# Checks of the channel plan of channels.py, no radio needed
+#
+#    python -m unittest test_channels
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import emulator
+
+emulator.install(emulator.Medium().gpio)
+
+import channels  # noqa: E402
+
+A = channels.Group(433, 0)
+B = channels.Group(435, 0)
+
+
+class PlanTest(unittest.TestCase):
+
+    def plan(self, placed, net_ids=(0,), **kwargs):
+        # placed is {addr: (group, load)}
+        plan = channels.Plan(channels.groups([433, 435], net_ids), path=None, **kwargs)
+        for addr, (group, load) in placed.items():
+            plan.nodes[addr] = group
+            plan.loads[addr] = load
+        return plan
+
+    def test_new_node_goes_to_the_quietest_frequency(self):
+        plan = self.plan({1: (A, 0.3), 2: (B, 0.1)})
+        self.assertEqual(plan.assign(3, load=0.1), B)
+        self.assertEqual(plan.assign(4), B)
+        # a known node keeps its group
+        self.assertEqual(plan.assign(1), A)
+
+    def test_rebalance_evens_out_the_frequencies(self):
+        plan = self.plan({addr: (A, 0.1) for addr in range(1, 5)})
+        moves = plan.rebalance()
+        self.assertEqual(len(moves), 2)
+        self.assertTrue(all(old == A and new == B for addr, old, new in moves))
+        # rebalance() only proposes, the plan changes with move()
+        self.assertEqual(plan.members(B), [])
+
+    def test_small_gain_is_not_worth_a_move(self):
+        plan = self.plan({1: (A, 0.5), 2: (A, 0.04), 3: (B, 0.46)})
+        self.assertEqual(plan.rebalance(), [])
+
+    def test_moves_are_limited(self):
+        plan = self.plan({addr: (A, 0.01) for addr in range(1, 41)}, hysteresis=0.01, max_moves=3)
+        self.assertEqual(len(plan.rebalance()), 3)
+
+    def test_net_id_is_kept(self):
+        plan = self.plan({1: (channels.Group(433, 1), 0.2), 2: (channels.Group(433, 1), 0.2)}, net_ids=(0, 1))
+        moves = plan.rebalance()
+        self.assertEqual([new for addr, old, new in moves], [channels.Group(435, 1)])
+
+    def test_registry_survives_a_restart(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "channel_plan.json")
+            plan = channels.Plan(channels.groups([433, 435]), path=path)
+            plan.assign(30, load=0.25)
+            plan.move(30, B)
+            again = channels.Plan(channels.groups([433, 435]), path=path)
+            self.assertEqual((again.group(30), again.loads[30]), (B, 0.25))
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+# Checks of the motor frames of codec.py, no radio needed
+#
+#    python -m unittest test_codec
+
+import unittest
+
+import codec
+
+
+class CodecTest(unittest.TestCase):
+
+    def test_commands_round_trip(self):
+        for command in ["ON", "OFF", "STATUS"]:
+            self.assertEqual(codec.decode(codec.encode_command(command)), {"command": command})
+        self.assertEqual(codec.decode(codec.encode_command("SET_TIMER", 300)), {"command": "SET_TIMER", "timer": 300})
+
+    def test_status_round_trip(self):
+        frame = codec.encode_status(codec.MOTOR_ON, 4660, codec.POWER_FAILURE)
+        self.assertEqual(frame[:2], bytes([codec.VERSION, codec.STATUS_UPDATE]))
+        self.assertEqual(codec.decode(frame), {"status": "ON", "run_time": 4660, "error": codec.POWER_FAILURE})
+
+    def test_values_are_clamped_to_two_bytes(self):
+        self.assertEqual(codec.decode(codec.encode_command("SET_TIMER", 100000))["timer"], 0xffff)
+        self.assertEqual(codec.decode(codec.encode_status(codec.MOTOR_OFF, -5))["run_time"], 0)
+
+    def test_crc8_check_value(self):
+        # CRC-8 (polynomial 0x07, init 0) of "123456789"
+        self.assertEqual(codec.crc8(b"123456789"), 0xF4)
+
+    def test_corrupted_frames_are_rejected(self):
+        frame = bytearray(codec.encode_command("ON"))
+        frame[1] ^= 0x04
+        with self.assertRaises(codec.CodecError):
+            codec.decode(frame)
+        with self.assertRaises(codec.CodecError):
+            codec.decode(bytes([0x02]) + codec.encode_command("ON")[1:])
+        with self.assertRaises(codec.CodecError):
+            codec.decode(b"\x01\x01")
+
+    def test_unknown_command_and_json_text(self):
+        with self.assertRaises(codec.CodecError):
+            codec.encode_command("REVERSE")
+        with self.assertRaises(codec.CodecError):
+            codec.decode(b'{"command": "ON"}')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# Checks of the forwarding rules of mesh.py on a fake node, no radio needed
+#
+#    python -m unittest test_mesh
+
+import unittest
+import collections
+
+import mesh
+
+Packet = collections.namedtuple('Packet', ['addr', 'data', 'rssi', 'time', 'noise'])
+
+
+class Node:
+
+    fixed = True
+
+    def __init__(self, addr):
+        self.addr = addr
+        self.sent = []
+
+    def send(self, data, dest=None, channel=None):
+        self.sent.append((dest, bytes(data)))
+
+
+def frame(src, dest, seq, ttl, hops, message=b'hello', via=None, rssi=-80):
+    data = bytes([mesh.MESH, src >> 8, src & 0xff, dest >> 8, dest & 0xff, seq >> 8, seq & 0xff, ttl, hops])
+    return Packet(src if via is None else via, data + message, rssi, 0.0, None)
+
+
+class MeshTest(unittest.TestCase):
+
+    def setUp(self):
+        self.node = Node(5)
+        self.mesh = mesh.Mesh(self.node, jitter=0)
+
+    def test_message_for_this_node_comes_from_its_source(self):
+        packet = self.mesh.handle(frame(1, 5, 10, 4, 1, via=3))
+        self.assertEqual((packet.addr, packet.data), (1, b'hello'))
+        self.assertEqual(self.node.sent, [])
+        self.assertEqual(self.mesh.routes[1][:2], [3, 2])
+
+    def test_copy_over_a_second_path_is_dropped(self):
+        self.assertIsNotNone(self.mesh.handle(frame(1, 5, 10, 4, 0)))
+        self.assertIsNone(self.mesh.handle(frame(1, 5, 10, 4, 1, via=3)))
+        self.assertEqual(self.mesh.stats['duplicate'], 1)
+
+    def test_forward_with_one_less_ttl(self):
+        # a route to 9 through 7 first, then a frame from 1 to 9
+        self.mesh.handle(frame(9, 0xFFFF, 1, 4, 0, message=b'', via=7))
+        self.assertIsNone(self.mesh.handle(frame(1, 9, 10, 3, 0)))
+        dest, data = self.node.sent[-1]
+        self.assertEqual(dest, 7)
+        self.assertEqual((data[7], data[8], data[mesh.HEADER:]), (2, 1, b'hello'))
+
+    def test_ttl_run_out_is_not_forwarded(self):
+        self.assertIsNone(self.mesh.handle(frame(1, 9, 10, 1, 3)))
+        self.assertEqual(self.node.sent, [])
+        self.assertEqual(self.mesh.stats['expired'], 1)
+
+    def test_flood_without_a_route(self):
+        self.mesh.handle(frame(1, 9, 10, 3, 0))
+        self.assertEqual(self.node.sent[-1][0], mesh.BROADCAST)
+
+    def test_shorter_route_wins(self):
+        self.mesh.handle(frame(1, 5, 10, 4, 2, via=3))
+        self.mesh.handle(frame(1, 5, 11, 4, 0, via=1))
+        self.assertEqual(self.mesh.routes[1][:2], [1, 1])
+        # a longer one does not replace it
+        self.mesh.handle(frame(1, 5, 12, 4, 3, via=4))
+        self.assertEqual(self.mesh.routes[1][0], 1)
+
+    def test_own_frames_are_not_handled_again(self):
+        self.mesh.send(b'ping', dest=9)
+        dest, data = self.node.sent[-1]
+        self.assertEqual(dest, mesh.BROADCAST)
+        self.assertIsNone(self.mesh.handle(Packet(7, data, -80, 0.0, None)))
+        self.assertEqual(self.mesh.stats['duplicate'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
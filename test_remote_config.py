@@ -0,0 +1,162 @@
+# Checks of the target side of remote_config.py on a fake node, no radio needed
+#
+#    python -m unittest test_remote_config
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import collections
+
+import emulator
+
+emulator.install(emulator.Medium().gpio)
+
+import radio  # noqa: E402
+import remote_config  # noqa: E402
+
+Packet = collections.namedtuple('Packet', ['addr', 'data', 'rssi', 'time', 'noise'])
+
+GATEWAY = 0
+
+
+class Node:
+    # params, reconfigure(), set() and readback() of sx126x; the registers
+    # read back are made from params, except the fields in stuck
+
+    def __init__(self):
+        self.params = {"freq": 433, "addr": 2, "net_id": 0, "air_speed": 2400, "buffer_size": 240,
+                       "power": 22, "rssi": 0, "wor": 0, "wor_period": 500}
+        self.stuck = {}
+        self.sent = []
+
+    def reconfigure(self, **changes):
+        self.params.update(changes)
+
+    def set(self, **params):
+        self.params.update(params)
+
+    def readback(self):
+        p = dict(self.params, **self.stuck)
+        return [p["addr"] >> 8, p["addr"] & 0xff, p["net_id"], radio.AIR_SPEED.index(p["air_speed"]),
+                radio.BUFFER_SIZE.index(p["buffer_size"]) << 6 | radio.POWER.index(p["power"]),
+                p["freq"] - remote_config.band(p["freq"]),
+                0x80 * p["rssi"] + 0x08 * p["wor"] + p["wor_period"] // 500 - 1, 0, 0]
+
+    def send(self, data, dest=None):
+        self.sent.append((dest, bytes(data)))
+
+
+class Link:
+
+    def __init__(self, node):
+        self.node = node
+
+
+def apply_frame(ident, changes, delay=0):
+    return Packet(GATEWAY, remote_config.encode_apply(ident, changes, delay), None, time.time(), None)
+
+
+class FramesTest(unittest.TestCase):
+
+    def test_apply_frame_round_trip(self):
+        frame = remote_config.encode_apply(7, {"power": 17, "freq": 868}, delay=5)
+        self.assertEqual(remote_config.decode_apply(frame), (7, 5, {"power": 17, "freq": 868}))
+        self.assertIsNone(remote_config.decode_apply(frame[:-1]))
+
+    def test_digest_does_not_depend_on_the_order(self):
+        self.assertEqual(remote_config.digest({"power": 17, "freq": 868}),
+                         remote_config.digest({"freq": 868, "power": 17}))
+        self.assertNotEqual(remote_config.digest({"power": 17}), remote_config.digest({"power": 13}))
+
+    def test_band_edges(self):
+        self.assertEqual([remote_config.band(f) for f in (409, 410, 493, 494, 850, 930, 931)],
+                         [None, 410, 410, None, 850, 850, None])
+
+    def test_valid_stays_in_the_band_of_the_module(self):
+        node = Node()
+        self.assertTrue(remote_config.valid(node, {"freq": 410, "power": 13, "air_speed": 9600}))
+        self.assertFalse(remote_config.valid(node, {"freq": 868}))
+        self.assertFalse(remote_config.valid(node, {"power": 20}))
+        self.assertFalse(remote_config.valid(node, {"air_speed": 300}))
+
+    def test_fields_of_the_registers(self):
+        node = Node()
+        node.params.update(power=13, buffer_size=64, wor=1, wor_period=2000)
+        self.assertEqual(remote_config.fields(node.readback(), 433), node.params)
+
+
+class AgentTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.node = Node()
+        self.agent = remote_config.Agent(self.node, Link(self.node), gateway=GATEWAY,
+                                         path=os.path.join(self.dir, "remote_config.json"))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def status(self):
+        dest, frame = self.node.sent[-1]
+        self.assertEqual((dest, frame[:2]), (GATEWAY, bytes([remote_config.CONFIG, remote_config.RESULT])))
+        return frame[3]
+
+    def test_apply_and_restore(self):
+        self.assertTrue(self.agent.handle(apply_frame(1, {"power": 13})))
+        self.assertEqual(self.status(), remote_config.APPLIED)
+        self.assertEqual(self.node.sent[-1][1][4:], remote_config.digest({"power": 13}).to_bytes(4, 'big'))
+        other = Node()
+        self.assertEqual(remote_config.restore(other, self.agent.path), {"power": 13})
+        self.assertEqual(other.params["power"], 13)
+
+    def test_repeated_request_is_not_applied_twice(self):
+        self.agent.handle(apply_frame(1, {"power": 13}))
+        self.agent.handle(apply_frame(1, {"power": 13}))
+        self.assertEqual((self.agent.applied, len(self.node.sent)), (1, 2))
+        self.assertEqual(self.node.sent[0], self.node.sent[1])
+
+    def test_module_which_does_not_take_the_value_is_set_back(self):
+        self.node.stuck = {"power": 22}
+        self.agent.handle(apply_frame(1, {"power": 13}))
+        self.assertEqual(self.status(), remote_config.FAILED)
+        self.assertEqual(self.agent.rollbacks, 1)
+
+    def test_driver_error_is_answered_with_a_rejection(self):
+        # valid() lets it through, the driver refuses it
+        def refuse(**changes):
+            self.node.params.update(changes)
+            raise ValueError("refused")
+        self.node.reconfigure = refuse
+        self.agent.handle(apply_frame(1, {"power": 13}))
+        self.assertEqual(self.status(), remote_config.REJECTED)
+        self.assertEqual(self.node.params["power"], 22)
+
+    def test_link_change_without_delay_is_rejected(self):
+        self.agent.handle(apply_frame(1, {"freq": 440}))
+        self.assertEqual(self.status(), remote_config.REJECTED)
+        self.agent.handle(apply_frame(2, {"freq": 440}, delay=5))
+        self.assertEqual(self.status(), remote_config.ACCEPTED)
+        self.assertEqual(self.node.params["freq"], 433)
+
+    def test_frames_of_other_nodes_are_dropped(self):
+        packet = apply_frame(1, {"power": 13})._replace(addr=9)
+        self.assertTrue(self.agent.handle(packet))
+        self.assertEqual((self.node.sent, self.node.params["power"]), ([], 22))
+
+    def test_short_query_is_ignored(self):
+        query = bytes([remote_config.CONFIG, remote_config.QUERY, 1, 0])
+        self.assertTrue(self.agent.handle(Packet(GATEWAY, query, None, time.time(), None)))
+        self.assertEqual(self.node.sent, [])
+        query += bytes([1, remote_config.FIELDS["power"]])
+        self.agent.handle(Packet(GATEWAY, query, None, time.time(), None))
+        self.assertEqual(self.status(), remote_config.APPLIED)
+        self.assertEqual(self.node.sent[-1][1][4:], remote_config.digest({"power": 22}).to_bytes(4, 'big'))
+
+    def test_other_packets_go_to_the_application(self):
+        self.assertFalse(self.agent.handle(Packet(GATEWAY, b'\x01\x01\x07', None, time.time(), None)))
+
+
+if __name__ == '__main__':
+    unittest.main()
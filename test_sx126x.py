@@ -0,0 +1,156 @@
+# Checks of the helpers of sx126x.py which work without a module
+#
+#    python -m unittest test_sx126x
+
+import unittest
+
+import emulator
+
+emulator.install(emulator.Medium().gpio)
+
+import sx126x  # noqa: E402
+
+
+def frame(addr, data, rssi=None):
+    tail = bytes([256 + rssi]) if rssi is not None else b''
+    return bytes([addr >> 8, addr & 0xff, sx126x.FrameDecoder.MAGIC, len(data)]) + data + tail
+
+
+class FrameDecoderTest(unittest.TestCase):
+
+    def test_back_to_back_frames_are_split(self):
+        decoder = sx126x.FrameDecoder()
+        packets = decoder.feed(frame(30, b'one') + frame(0x1234, b'two'), 1.0)
+        self.assertEqual([(p.addr, p.data) for p in packets], [(30, b'one'), (0x1234, b'two')])
+        self.assertFalse(decoder.pending())
+
+    def test_frame_split_over_reads(self):
+        decoder = sx126x.FrameDecoder()
+        data = frame(30, b'hello')
+        self.assertEqual(decoder.feed(data[:5], 1.0), [])
+        packets = decoder.feed(data[5:], 1.001)
+        self.assertEqual(packets[0].data, b'hello')
+
+    def test_rssi_byte_is_not_part_of_the_message(self):
+        decoder = sx126x.FrameDecoder(rssi=True)
+        packet = decoder.feed(frame(30, b'abc', rssi=-70), 1.0)[0]
+        self.assertEqual((packet.data, packet.rssi), (b'abc', -70))
+
+    def test_unframed_packet_ends_with_the_silence(self):
+        decoder = sx126x.FrameDecoder(gap=0.02)
+        self.assertEqual(decoder.feed(b'\x00\x1eold text', 1.0), [])
+        self.assertEqual(decoder.feed(b'', 1.01), [])
+        packets = decoder.feed(b'', 1.05)
+        self.assertEqual([(p.addr, p.data) for p in packets], [(30, b'old text')])
+        self.assertEqual(decoder.unframed, 1)
+
+
+class PacketRingTest(unittest.TestCase):
+
+    def fill(self, policy):
+        ring = sx126x.PacketRing(size=3, policy=policy)
+        for i in range(5):
+            ring.put(i)
+        return ring
+
+    def test_drop_oldest_keeps_the_latest(self):
+        ring = self.fill(sx126x.PacketRing.DROP_OLDEST)
+        self.assertEqual([ring.get(0) for _ in range(3)], [2, 3, 4])
+        self.assertEqual((ring.received, ring.dropped), (5, 2))
+
+    def test_drop_newest_keeps_the_first(self):
+        ring = self.fill(sx126x.PacketRing.DROP_NEWEST)
+        self.assertEqual([ring.get(0) for _ in range(3)], [0, 1, 2])
+        self.assertEqual(ring.dropped, 2)
+
+    def test_get_on_an_empty_ring_times_out(self):
+        ring = sx126x.PacketRing(size=2)
+        self.assertIsNone(ring.get(timeout=0.01))
+        ring.put('a')
+        self.assertEqual((len(ring), ring.get(0), len(ring)), (1, 'a', 0))
+
+
+class DutyCycleTest(unittest.TestCase):
+
+    def test_wait_until_the_oldest_send_leaves_the_window(self):
+        duty = sx126x.DutyCycle(limit=0.1, window=100)
+        duty.record(6.0, 0.0)
+        duty.record(3.0, 10.0)
+        self.assertEqual(duty.wait_time(1.0, 20.0), 0)
+        # 9 s used of 10, 2 more fit once the first send expires at 100
+        self.assertEqual(duty.wait_time(2.0, 20.0), 80.0)
+        self.assertAlmostEqual(duty.utilisation(50.0), 0.09)
+        self.assertAlmostEqual(duty.utilisation(105.0), 0.03)
+
+    def test_a_packet_longer_than_the_budget_never_fits(self):
+        duty = sx126x.DutyCycle(limit=0.01, window=100)
+        self.assertIsNone(duty.wait_time(1.5, 0.0))
+
+    def test_time_on_air_grows_with_length_and_spreading(self):
+        self.assertLess(sx126x.time_on_air(10, 2400), sx126x.time_on_air(100, 2400))
+        self.assertLess(sx126x.time_on_air(10, 9600), sx126x.time_on_air(10, 2400))
+        self.assertEqual(sx126x.packet_time(10, 2400), sx126x.time_on_air(10 + sx126x.FrameDecoder.HEADER, 2400))
+
+
+class ReassemblerTest(unittest.TestCase):
+
+    def fragment(self, ident, index, count, data, now=0.0, addr=30):
+        header = bytes([sx126x.Reassembler.MARK, ident, index >> 8, index & 0xff, count >> 8, count & 0xff])
+        return sx126x.Packet(addr, header + data, None, now)
+
+    def test_fragments_in_any_order(self):
+        reassembler = sx126x.Reassembler()
+        self.assertIsNone(reassembler.feed(self.fragment(1, 2, 3, b'c')))
+        self.assertIsNone(reassembler.feed(self.fragment(1, 0, 3, b'a')))
+        message = reassembler.feed(self.fragment(1, 1, 3, b'b'))
+        self.assertEqual((message.addr, message.data), (30, b'abc'))
+        self.assertEqual(reassembler.partial, {})
+
+    def test_messages_of_two_senders_are_kept_apart(self):
+        reassembler = sx126x.Reassembler()
+        reassembler.feed(self.fragment(1, 0, 2, b'x', addr=30))
+        reassembler.feed(self.fragment(1, 0, 2, b'y', addr=31))
+        self.assertEqual(reassembler.feed(self.fragment(1, 1, 2, b'2', addr=31)).data, b'y2')
+        self.assertEqual(reassembler.feed(self.fragment(1, 1, 2, b'1', addr=30)).data, b'x1')
+
+    def test_incomplete_message_expires(self):
+        reassembler = sx126x.Reassembler(timeout=5)
+        reassembler.feed(self.fragment(1, 0, 2, b'a', now=0.0))
+        self.assertIsNone(reassembler.feed(self.fragment(1, 1, 2, b'b', now=10.0)))
+        self.assertEqual(reassembler.expired, 1)
+        self.assertTrue(reassembler.is_fragment(self.fragment(1, 0, 1, b'')))
+        self.assertFalse(reassembler.is_fragment(sx126x.Packet(30, b'plain text', None, 0.0)))
+
+
+class CarrierSenseTest(unittest.TestCase):
+
+    def test_busy_above_the_floor_plus_margin(self):
+        carrier = sx126x.CarrierSense(margin=6)
+        self.assertIsNone(carrier.threshold(23))
+        self.assertFalse(carrier.sample(23, -110))
+        self.assertEqual(carrier.threshold(23), -104)
+        self.assertFalse(carrier.sample(23, -105))
+        self.assertTrue(carrier.sample(23, -90))
+        self.assertEqual(carrier.busy_ratio(23), 1 / 3)
+
+    def test_floor_follows_idle_samples_only(self):
+        carrier = sx126x.CarrierSense(margin=6, alpha=0.5)
+        carrier.sample(23, -110)
+        carrier.sample(23, -80)
+        self.assertEqual(carrier.floors[23], -110)
+        carrier.sample(23, -106)
+        self.assertEqual(carrier.floors[23], -108)
+        carrier.sample(23, -120)
+        self.assertEqual(carrier.floors[23], -120)
+        # every channel has its own floor
+        self.assertFalse(carrier.sample(30, -90))
+
+    def test_backoff_window_doubles_up_to_max_exponent(self):
+        carrier = sx126x.CarrierSense(max_exponent=2)
+        for attempt in range(6):
+            backoff = carrier.backoff(attempt, 0.01)
+            self.assertTrue(0 <= backoff <= 0.01 * 2 ** min(attempt, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
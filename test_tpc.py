@@ -0,0 +1,38 @@
+# Checks of the power choice of tpc.py, no radio needed
+#
+#    python -m unittest test_tpc
+
+import types
+import unittest
+import collections
+
+import emulator
+
+emulator.install(emulator.Medium().gpio)
+
+import tpc  # noqa: E402
+
+Packet = collections.namedtuple('Packet', ['addr', 'data', 'rssi', 'time', 'noise'])
+
+
+class TpcTest(unittest.TestCase):
+
+    def tpc(self, *rssis):
+        control = tpc.Tpc(types.SimpleNamespace(air_speed=2400, power=22), None, history=len(rssis))
+        for rssi in rssis:
+            control.observe(Packet(30, b'', rssi, 0, None))
+        return control
+
+    def test_weakest_packet_sets_the_margin(self):
+        control = self.tpc(-60, -120)
+        weak = self.tpc(-120)
+        self.assertEqual(control.margin(30, 10), weak.margin(30, 10))
+        self.assertLess(control.margin(30, 10), 0)
+
+    def test_mixed_samples_need_the_power_of_the_weakest(self):
+        self.assertEqual(self.tpc(-60, -120).choose(30), 22)
+        self.assertEqual(self.tpc(-60, -60).choose(30), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
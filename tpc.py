@@ -0,0 +1,105 @@
+# This file is the transmit power control of the links of one node, on top
+# of arq.Link (see arq.py and adr.py)
+#
+#    The path loss to a node is the power it sends at less the rssi of its
+#    packets here (the link is taken to be the same both ways), so our
+#    packets arrive there with the power we send at less that loss. The power
+#    of a link is the lowest level of power_cal() (10, 13, 17 or 22 dBm)
+#    which keeps margin dB over the sensitivity of the air speed for the
+#    weakest of the last history packets. A send which needed a
+#    retransmission raises the power of its link one level, one which failed
+#    is sent once more at the highest level, and the estimate does not lower
+#    the power again for hold seconds.
+#
+#    The power of every destination is kept, so consecutive packets to the
+#    same node cost no register write (set() writes nothing when 04H is
+#    unchanged). A link without samples uses the highest level.
+#
+#    The acks arq.Link sends on its own go out at the power of the last send.
+#    With adaptive data rate the speed is chosen first and the power for it:
+#
+#        link = adr.Adr(node, tpc.Tpc(node, arq.Link(node)))
+
+import time
+import collections
+
+import radio
+
+# the levels of register 04H bits 1-0, lowest first
+LEVELS = [10, 13, 17, 22]
+
+
+class Tpc:
+    # The links of one node with a transmit power each, send() and receive()
+    # are those of arq.Link.
+
+    def __init__(self, node, link, margin=10.0, history=4, remote_power=22, hold=300.0):
+        self.node = node
+        self.link = link
+        self.margin_db = margin
+        self.history = history
+        # the power the other nodes send at
+        self.remote_power = remote_power
+        self.hold = hold
+        self.powers = {}
+        self.samples = collections.defaultdict(lambda: collections.deque(maxlen=history))
+        # dest -> the time its power was raised last
+        self.raised = {}
+        self.changes = 0
+
+    def observe(self, packet):
+        if packet.rssi is not None:
+            self.samples[packet.addr].append((packet.rssi, packet.noise))
+
+    def margin(self, dest, power):
+        # dB over the sensitivity at the current air speed of the weakest recent
+        # packet to dest sent at power, None without samples
+        samples = self.samples.get(dest)
+        if not samples:
+            return None
+        # the weakest packet has the highest loss over the sensitivity
+        loss = max(self.remote_power - rssi + radio.sensitivity(self.node.air_speed, noise)
+                   for rssi, noise in samples)
+        return power - loss
+
+    def choose(self, dest):
+        # the lowest level which keeps the margin
+        current = self.powers.get(dest, LEVELS[-1])
+        if len(self.samples.get(dest, ())) < self.history:
+            return current
+        power = LEVELS[-1]
+        for level in LEVELS:
+            if self.margin(dest, level) >= self.margin_db:
+                power = level
+                break
+        raised = self.raised.get(dest)
+        if raised is not None and time.time() - raised < self.hold:
+            power = max(power, current)
+        return power
+
+    def tune(self, power):
+        if self.node.power != power:
+            self.node.reconfigure(power=power)
+            self.changes += 1
+
+    def send(self, dest, data):
+        # data to dest at the power of its link, True once acknowledged
+        power = self.powers[dest] = self.choose(dest)
+        self.tune(power)
+        retransmissions = self.link.retransmissions
+        done = self.link.send(dest, data)
+        if power == LEVELS[-1] or (done and self.link.retransmissions == retransmissions):
+            return done
+        self.raised[dest] = time.time()
+        if done:
+            self.powers[dest] = LEVELS[LEVELS.index(power) + 1]
+            return True
+        self.powers[dest] = LEVELS[-1]
+        self.tune(LEVELS[-1])
+        return self.link.send(dest, data)
+
+    def receive(self, timeout=0):
+        packet = self.link.receive(timeout)
+        if packet is not None:
+            self.observe(packet)
+        return packet